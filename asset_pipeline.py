@@ -0,0 +1,166 @@
+import argparse
+import base64
+import hashlib
+import io
+import logging
+import os
+from functools import lru_cache
+
+from PIL import Image
+
+from instrumentation import event
+
+# --- Asset Pipeline Configuration ---
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(PROJECT_DIR, "static") # Served by Streamlit at app/static/ (see .streamlit/config.toml)
+STATIC_URL = "app/static"
+BACKGROUND_SUBDIR = "backgrounds"
+DISPLAY_WIDTH = 1920 # Backgrounds are never shown wider than a full-HD screen
+WEBP_QUALITY = 78
+JPEG_QUALITY = 80 # Progressive JPEG fallback for browsers without WebP
+PIPELINE_VERSION = "1" # Bump to rebuild every asset after changing the settings above
+
+
+class BackgroundAsset:
+    """Display-sized variants of one background image, by URL the browser can cache."""
+    __slots__ = ("source_path", "webp_url", "jpeg_url", "webp_bytes", "jpeg_bytes")
+
+    def __init__(self, source_path, webp_url, jpeg_url, webp_bytes, jpeg_bytes):
+        self.source_path = source_path
+        self.webp_url = webp_url
+        self.jpeg_url = jpeg_url
+        self.webp_bytes = webp_bytes
+        self.jpeg_bytes = jpeg_bytes
+
+
+# --- Build step (resize + recompress, content-hashed file names) ---
+def _asset_name(source_path, source_bytes):
+    """Content-hashed stem ("shop_bg-3fa2c1d9"), so a changed image gets a new URL and stale copies are never served."""
+    digest = hashlib.sha256(source_bytes + f"|{DISPLAY_WIDTH}|{WEBP_QUALITY}|{JPEG_QUALITY}|{PIPELINE_VERSION}".encode()).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(source_path))[0]}-{digest}"
+
+def _write_atomic(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def build_background(source_path, static_dir=STATIC_DIR):
+    """Resizes a background to DISPLAY_WIDTH and writes WebP + progressive JPEG variants into static_dir/backgrounds/.
+    Already-built variants are reused, so this is cheap after the first run. Returns a BackgroundAsset."""
+    with open(source_path, "rb") as f:
+        source_bytes = f.read()
+    stem = _asset_name(source_path, source_bytes)
+    output_dir = os.path.join(static_dir, BACKGROUND_SUBDIR)
+    webp_path = os.path.join(output_dir, f"{stem}.webp")
+    jpeg_path = os.path.join(output_dir, f"{stem}.jpg")
+
+    if not (os.path.exists(webp_path) and os.path.exists(jpeg_path)):
+        os.makedirs(output_dir, exist_ok=True)
+        image = Image.open(io.BytesIO(source_bytes)).convert("RGB")
+        if image.width > DISPLAY_WIDTH:
+            image = image.resize((DISPLAY_WIDTH, round(image.height * DISPLAY_WIDTH / image.width)), Image.LANCZOS)
+        webp_buffer = io.BytesIO()
+        image.save(webp_buffer, format="WEBP", quality=WEBP_QUALITY, method=6)
+        jpeg_buffer = io.BytesIO()
+        image.save(jpeg_buffer, format="JPEG", quality=JPEG_QUALITY, progressive=True, optimize=True)
+        _write_atomic(webp_path, webp_buffer.getvalue())
+        _write_atomic(jpeg_path, jpeg_buffer.getvalue())
+
+    return BackgroundAsset(
+        source_path,
+        f"{STATIC_URL}/{BACKGROUND_SUBDIR}/{stem}.webp",
+        f"{STATIC_URL}/{BACKGROUND_SUBDIR}/{stem}.jpg",
+        os.path.getsize(webp_path),
+        os.path.getsize(jpeg_path),
+    )
+
+def build_all_backgrounds(registry=None, static_dir=STATIC_DIR):
+    """Builds every background referenced in the scenario registry. Returns {source_path: BackgroundAsset};
+    images that are missing or unreadable are skipped (the app then falls back to no background)."""
+    if registry is None:
+        from scenario_registry import registry
+    assets = {}
+    for scenario in registry.scenarios.values():
+        source_path = scenario.background
+        if not source_path or source_path in assets:
+            continue
+        try:
+            assets[source_path] = build_background(_resolve(source_path), static_dir)
+        except (OSError, ValueError) as e:
+            event("assets.background_error", level=logging.WARNING, source=source_path, error=str(e))
+    return assets
+
+def _resolve(path):
+    return path if os.path.isabs(path) else os.path.join(PROJECT_DIR, path)
+
+
+# --- CSS (built once per background, then reused on every rerun) ---
+APP_TEXT_CSS = """
+    /* Ensure all text elements have white color and a text shadow */
+    h1, h2, h3, h4, h5, h6, .stMarkdown, .stSelectbox, .stRadio, .stButton, .stTextInput, label {
+        color: white !important;
+        text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.8); /* Slightly darker shadow */
+    }
+    .stMarkdown div ul li { /* For list items */
+        color: white !important;
+    }
+    .stMarkdown div p { /* For paragraphs */
+        color: white !important;
+    }
+    .stAudioRecorder button span {
+        color: white !important;
+    }
+    /* Keep the chat container semi-transparent */
+    .stContainer {
+        background-color: rgba(0, 0, 0, 0.6) !important;
+        border-radius: 10px;
+        padding: 20px;
+    }
+"""
+
+def _css_for_image(background_image):
+    return f"""
+    <style>
+    .stApp {{
+        {background_image}
+        background-size: cover;
+        background-position: center center;
+        background-repeat: no-repeat;
+        background-attachment: fixed;
+        /* Add a dark, semi-transparent overlay */
+        background-color: rgba(0, 0, 0, 0.6); /* Adjust the alpha value (0 to 1) for darkness */
+        background-blend-mode: overlay; /* Blends the overlay with the image */
+    }}
+    {APP_TEXT_CSS}
+    </style>
+    """
+
+@lru_cache(maxsize=None)
+def background_css(asset):
+    """CSS that points the app background at the static files: a few hundred bytes per rerun instead of the
+    base64 image, and the browser caches the image itself. WebP where supported, progressive JPEG otherwise."""
+    return _css_for_image(
+        f'background-image: url("{asset.jpeg_url}");\n'
+        f'        background-image: image-set(url("{asset.webp_url}") type("image/webp"), url("{asset.jpeg_url}") type("image/jpeg"));'
+    )
+
+@lru_cache(maxsize=None)
+def inline_background_css(source_path):
+    """Fallback when static serving is unavailable: the display-sized JPEG inlined as base64, encoded only once."""
+    asset = build_background(_resolve(source_path))
+    with open(os.path.join(STATIC_DIR, BACKGROUND_SUBDIR, os.path.basename(asset.jpeg_url)), "rb") as f:
+        encoded_string = base64.b64encode(f.read()).decode()
+    return _css_for_image(f'background-image: url("data:image/jpeg;base64,{encoded_string}");')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build display-sized WebP/JPEG backgrounds into static/.")
+    parser.parse_args()
+    for source_path, asset in build_all_backgrounds().items():
+        source_size = os.path.getsize(_resolve(source_path))
+        print(f"{source_path}: {source_size:,} bytes -> {asset.webp_bytes:,} (webp) / {asset.jpeg_bytes:,} (jpeg)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import core_tutor as ct
+import resilient_client
+import tts_cache
+from instrumentation import event, record_duration, record_usage, span, trace_turn
+
+# --- Async Pipeline Configuration ---
+MAX_CONNECTIONS = int(os.getenv("SPEAKGENIE_MAX_CONNECTIONS", "50")) # Shared HTTP pool size per process
+MAX_KEEPALIVE_CONNECTIONS = 20
+MAX_CONCURRENT_REQUESTS = int(os.getenv("SPEAKGENIE_MAX_CONCURRENT_REQUESTS", "32")) # In-flight API calls per process
+
+
+# --- Async version of the core_tutor pipeline ---
+class AsyncTutor:
+    """Asyncio version of the core_tutor pipeline (Whisper -> GPT -> TTS). Per-learner state comes in as a ct.TutorSession.
+    One instance owns a bounded HTTP connection pool and a concurrency limiter, so a single worker
+    can serve many learners at once. Use get_shared_tutor() to share one instance per process."""
+
+    def __init__(self, api_key=None, max_connections=MAX_CONNECTIONS, max_concurrent_requests=MAX_CONCURRENT_REQUESTS, cache=None, base_url=None):
+        import httpx # The SDK is imported with the first client, not with this module
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        )
+        # base_url points at an OpenAI-compatible server instead (e.g. benchmarks/fake_openai_server.py).
+        # Retries, deadlines and hedging come from resilient_client, so the SDK's own retries are off
+        self.client = resilient_client.wrap(AsyncOpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"), base_url=base_url,
+                                                        http_client=http_client, max_retries=0))
+        self.cache = cache or tts_cache.default_cache
+        self._limiter = asyncio.Semaphore(max_concurrent_requests)
+
+    async def aclose(self):
+        """Closes the shared HTTP connection pool."""
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    # --- Speech-to-Text ---
+    async def transcribe_audio(self, audio):
+        """Transcribes audio using OpenAI Whisper. Accepts the same in-memory inputs as ct.transcribe_audio."""
+        try:
+            if isinstance(audio, str):
+                filename, audio_bytes = await asyncio.to_thread(ct.as_whisper_file, audio) # File paths are read off the event loop
+            else:
+                filename, audio_bytes = ct.as_whisper_file(audio)
+            async with self._limiter:
+                with span("stt.transcribe", upload_bytes=len(audio_bytes), audio_format=filename.rsplit(".", 1)[-1]) as stage:
+                    transcription = await self.client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=(filename, bytes(audio_bytes)),
+                        language="en" # Force transcription to English
+                    )
+                    stage.set(transcript_chars=len(transcription.text))
+            return transcription.text
+        except Exception as e:
+            event("stt.error", level=logging.WARNING, error=str(e))
+            return None
+
+    # --- LLM ---
+    async def get_gpt_response(self, session, prompt_text, conversation_history=None):
+        """Gets an AI response from GPT, with optional translation and general child-appropriate persona.
+        Reads language, mode and scenario from session (a ct.TutorSession); session.client is not used."""
+        try:
+            if conversation_history is None:
+                conversation_history = session.history
+            if session.history_manager is not None:
+                conversation_history = await session.history_manager.aprepare(self.client, conversation_history)
+            messages = ct.build_gpt_messages(session, prompt_text, conversation_history)
+            async with self._limiter:
+                with span("llm.chat", mode=session.mode, messages=len(messages)) as stage:
+                    chat_completion = await self.client.chat.completions.create(
+                        model="gpt-3.5-turbo",
+                        messages=messages
+                    )
+                    record_usage(stage, chat_completion)
+            return chat_completion.choices[0].message.content
+        except Exception as e:
+            event("llm.error", level=logging.WARNING, error=str(e))
+            return None
+
+    # --- Text-to-Speech ---
+    async def synthesize_speech_bytes(self, text, voice="alloy", model="tts-1", response_format="mp3", store=True):
+        """Returns TTS audio bytes for text, served from the shared TTS cache when possible.
+        Raises on API errors, like ct.synthesize_speech_bytes."""
+        cache_key = self.cache.make_key(model, voice, response_format, text)
+        # Cache lookups read disk (and a shared SQLite/Redis backend), so they run off the event loop
+        audio_bytes = await asyncio.to_thread(self.cache.get, cache_key)
+        if audio_bytes is not None:
+            return audio_bytes
+
+        async with self._limiter:
+            with span("tts.synthesize", text_chars=len(text)) as stage:
+                response = await self.client.audio.speech.create(
+                    model=model,
+                    voice=voice,
+                    input=text,
+                    response_format=response_format
+                )
+                audio_bytes = await response.aread()
+                stage.set(audio_bytes=len(audio_bytes))
+        if store:
+            await asyncio.to_thread(self.cache.put, cache_key, audio_bytes)
+        return audio_bytes
+
+    async def text_to_speech_openai(self, text, voice="alloy"):
+        """Converts text to speech using OpenAI TTS and returns the MP3 bytes (nothing is written to disk)."""
+        try:
+            return await self.synthesize_speech_bytes(text, voice=voice, store=False)
+        except Exception as e:
+            event("tts.error", level=logging.WARNING, error=str(e))
+            return None
+
+    # --- Conversation turns ---
+    async def handle_conversation_turn(self, session, user_input_text, current_conversation_history=None):
+        """Async version of ct.handle_conversation_turn. Returns (ai_response_text, history, audio_bytes)."""
+        if current_conversation_history is None:
+            current_conversation_history = session.history
+        with trace_turn("turn.handle", mode=session.mode, scenario=session.scenario.key):
+            return await self._run_conversation_turn(session, user_input_text, current_conversation_history)
+
+    # --- Bilingual replies ---
+    async def translate_static_phrase(self, phrase, language):
+        """Async version of ct.translate_static_phrase; shares its per-language cache."""
+        if not phrase or language == "English":
+            return ""
+        translation = ct._static_translations.get((language, phrase))
+        if translation is not None:
+            return translation
+        try:
+            async with self._limiter:
+                with span("llm.translate", language=language) as stage:
+                    completion = await self.client.chat.completions.create(
+                        model="gpt-3.5-turbo",
+                        messages=[
+                            {"role": "system", "content": ct.scenario_registry.static_translation_instruction.replace("{language}", language)},
+                            {"role": "user", "content": phrase},
+                        ]
+                    )
+                    record_usage(stage, completion)
+            translation = completion.choices[0].message.content.strip()
+        except Exception as e:
+            event("llm.error", level=logging.WARNING, source="translate", error=str(e))
+            return ""
+        with ct._static_translations_lock:
+            ct._static_translations[(language, phrase)] = translation
+        return translation
+
+    async def synthesize_bilingual(self, english_text, native_text, voice="alloy", store=True):
+        """Async version of ct.synthesize_bilingual: both segments rendered concurrently, English clip first."""
+        if not (native_text and ct._has_speakable_text(native_text)):
+            return await self.synthesize_speech_bytes(english_text, voice=voice, store=store)
+        english_audio, native_audio = await asyncio.gather(
+            self.synthesize_speech_bytes(english_text, voice=voice, store=store),
+            self.synthesize_speech_bytes(native_text, voice=voice, store=store),
+        )
+        return english_audio + native_audio
+
+    async def _run_conversation_turn(self, session, user_input_text, current_conversation_history):
+        ai_response_text = ct.get_interceptor_reply(session, user_input_text, current_conversation_history)
+        store_audio = True # Hardcoded replies are canned phrases, so keep them in the cache
+        native_text = ""
+        cached_response = None if ai_response_text else await asyncio.to_thread(ct.get_cached_response, session, user_input_text, current_conversation_history)
+        if cached_response:
+            current_conversation_history.append({"role": "user", "content": user_input_text})
+            current_conversation_history.append({"role": "assistant", "content": cached_response[0]})
+            return cached_response[0], current_conversation_history, cached_response[1]
+        if ai_response_text:
+            native_text = await self.translate_static_phrase(ai_response_text, session.language)
+        else:
+            ai_response_text = await self.get_gpt_response(session, user_input_text, current_conversation_history)
+            store_audio = False
+            if ai_response_text:
+                ai_response_text, native_text = ct.split_bilingual(ai_response_text)
+            else: # GPT is unreachable: canned, pre-rendered fallback (kept out of the response cache)
+                ai_response_text = ct.scenario_registry.fallback_reply
+                native_text = await self.translate_static_phrase(ai_response_text, session.language)
+                store_audio = True
+
+        english_text = ai_response_text
+        ai_response_text = ct.format_bilingual(english_text, native_text)
+        current_conversation_history.append({"role": "user", "content": user_input_text})
+        current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+        try:
+            audio_bytes = await self.synthesize_bilingual(english_text, native_text, voice=session.voice, store=store_audio)
+            if not store_audio:
+                await asyncio.to_thread(ct.cache_response, session, user_input_text, ai_response_text, audio_bytes)
+            return ai_response_text, current_conversation_history, audio_bytes
+        except Exception as e:
+            event("tts.error", level=logging.WARNING, source="llm" if not store_audio else "interceptor", error=str(e))
+            return ai_response_text, current_conversation_history, None
+
+    async def stream_conversation_turn(self, session, user_input_text, current_conversation_history=None):
+        """Async version of ct.stream_conversation_turn: yields ordered ct.SpokenSentence (sentence_text, audio_bytes)
+        pairs while GPT is still streaming. The history is updated once the reply is complete."""
+        if current_conversation_history is None:
+            current_conversation_history = session.history
+        voice = session.voice
+        turn_start = time.perf_counter()
+        ai_response_text = ct.get_interceptor_reply(session, user_input_text, current_conversation_history)
+        if ai_response_text:
+            native_text = await self.translate_static_phrase(ai_response_text, session.language)
+            current_conversation_history.append({"role": "user", "content": user_input_text})
+            current_conversation_history.append({"role": "assistant", "content": ct.format_bilingual(ai_response_text, native_text)})
+            native_task = None
+            if native_text:
+                native_task = asyncio.create_task(self.synthesize_speech_bytes(native_text, voice=voice))
+            try:
+                for text, segment in ((ai_response_text, ct.ENGLISH_SEGMENT), (native_text, ct.NATIVE_SEGMENT)):
+                    if not text:
+                        continue
+                    try:
+                        audio_bytes = await (native_task if segment == ct.NATIVE_SEGMENT else self.synthesize_speech_bytes(text, voice=voice))
+                    except Exception as e:
+                        event("tts.error", level=logging.WARNING, source="interceptor", error=str(e))
+                        audio_bytes = None
+                    yield ct.SpokenSentence(text, audio_bytes, segment)
+            finally:
+                if native_task is not None:
+                    native_task.cancel()
+            return
+
+        # Lesson packs and the response cache, like ct.stream_conversation_turn
+        cached_response = await asyncio.to_thread(ct.get_cached_response, session, user_input_text, current_conversation_history)
+        if cached_response:
+            current_conversation_history.append({"role": "user", "content": user_input_text})
+            current_conversation_history.append({"role": "assistant", "content": cached_response[0]})
+            yield ct.SpokenSentence(*cached_response)
+            return
+
+        pending = [] # (sentence_text, tts_task, segment) in speaking order
+        response_parts = []
+        audio_clips = [] # Rendered clips, kept so a complete reply can go into the response cache
+        first_audio_recorded = False
+        splitter = ct.BilingualSentenceSplitter()
+
+        def submit(sentence_text, segment):
+            task = None
+            if ct._has_speakable_text(sentence_text):
+                task = asyncio.create_task(self.synthesize_speech_bytes(sentence_text, voice=voice, store=False))
+            pending.append((sentence_text, task, segment))
+
+        async def pop_ready():
+            nonlocal first_audio_recorded
+            sentence_text, task, segment = pending.pop(0)
+            if task is None:
+                return ct.SpokenSentence(sentence_text, None, segment)
+            try:
+                audio_bytes = await task
+            except Exception as e:
+                event("tts.error", level=logging.WARNING, source="stream", sentence=sentence_text, error=str(e))
+                audio_clips.append(None)
+                return ct.SpokenSentence(sentence_text, None, segment)
+            audio_clips.append(audio_bytes)
+            if not first_audio_recorded:
+                first_audio_recorded = True
+                record_duration("turn.first_audio", time.perf_counter() - turn_start)
+            return ct.SpokenSentence(sentence_text, audio_bytes, segment)
+
+        try:
+            try:
+                history_for_llm = current_conversation_history
+                if session.history_manager is not None:
+                    history_for_llm = await session.history_manager.aprepare(self.client, current_conversation_history)
+                messages = ct.build_gpt_messages(session, user_input_text, history_for_llm)
+                # Only the request start is gated; holding a slot while the caller consumes
+                # yielded audio would let slow listeners starve everyone else
+                async with self._limiter:
+                    chunk_stream = await self.client.chat.completions.create(
+                        model="gpt-3.5-turbo",
+                        messages=messages,
+                        stream=True
+                    )
+                with span("llm.stream", mode=session.mode, messages=len(messages)) as stage:
+                    async for chunk in chunk_stream:
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if not response_parts:
+                            stage.set(first_token_ms=round(stage.elapsed() * 1000, 2))
+                        response_parts.append(delta)
+                        for sentence_text, segment in splitter.feed(delta):
+                            submit(sentence_text, segment)
+                        while pending and (pending[0][1] is None or pending[0][1].done()):
+                            yield await pop_ready()
+                    stage.set(chunks=len(response_parts), response_chars=sum(len(part) for part in response_parts))
+            except Exception as e:
+                event("llm.error", level=logging.WARNING, source="stream", error=str(e))
+            for sentence_text, segment in splitter.flush():
+                submit(sentence_text, segment)
+            while pending:
+                yield await pop_ready()
+        finally:
+            for _, task, _ in pending:
+                if task is not None:
+                    task.cancel()
+
+        ai_response_text = ct.format_bilingual(*ct.split_bilingual("".join(response_parts)))
+        record_duration("turn.stream", time.perf_counter() - turn_start, mode=session.mode, sentences=len(audio_clips))
+        if ai_response_text:
+            current_conversation_history.append({"role": "user", "content": user_input_text})
+            current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+            if audio_clips and None not in audio_clips:
+                await asyncio.to_thread(ct.cache_response, session, user_input_text, ai_response_text, b"".join(audio_clips))
+            return
+
+        # GPT failed before saying anything: canned fallback, like ct.stream_conversation_turn
+        fallback_text = ct.scenario_registry.fallback_reply
+        native_text = await self.translate_static_phrase(fallback_text, session.language)
+        ai_response_text = ct.format_bilingual(fallback_text, native_text)
+        current_conversation_history.append({"role": "user", "content": user_input_text})
+        current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+        try:
+            audio_bytes = await self.synthesize_bilingual(fallback_text, native_text, voice=voice)
+        except Exception as e:
+            event("tts.error", level=logging.WARNING, source="fallback", error=str(e))
+            audio_bytes = None
+        yield ct.SpokenSentence(ai_response_text, audio_bytes)
+
+
+# --- Process-wide shared instance ---
+_shared_tutor = None
+_shared_tutor_lock = threading.Lock()
+
+def get_shared_tutor(api_key=None):
+    """Returns the process-wide AsyncTutor, creating it on first use.
+    All callers share its connection pool and concurrency limit; use it from a single event loop."""
+    global _shared_tutor
+    with _shared_tutor_lock:
+        if _shared_tutor is None:
+            ct.load_dotenv()
+            _shared_tutor = AsyncTutor(api_key=api_key)
+        return _shared_tutor
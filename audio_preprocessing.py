@@ -0,0 +1,113 @@
+import io
+import logging
+
+from pydub import AudioSegment
+
+from instrumentation import event, span
+
+# --- Preprocessing Configuration ---
+WHISPER_SAMPLE_RATE = 16000 # Whisper resamples to 16 kHz mono internally, so sending more is wasted bytes
+VAD_FRAME_MS = 30
+VAD_MIN_THRESHOLD_DBFS = -50.0 # Frames quieter than this are always silence
+VAD_RELATIVE_THRESHOLD_DB = 16.0 # ...and so are frames this far below the clip's average loudness
+VAD_PADDING_MS = 150 # Silence kept around speech so word edges are not clipped
+ENCODE_FORMAT = "ogg"
+ENCODE_CODEC = "libopus"
+ENCODE_BITRATE = "24k"
+FALLBACK_FORMAT = "mp3" # Used when FFmpeg was built without libopus
+FALLBACK_BITRATE = "32k"
+
+
+# --- Energy-based voice activity detection ---
+def detect_voiced_frames(segment, frame_ms=VAD_FRAME_MS):
+    """Returns one bool per frame: True where the frame's energy is above the silence threshold."""
+    threshold_dbfs = max(VAD_MIN_THRESHOLD_DBFS, segment.dBFS - VAD_RELATIVE_THRESHOLD_DB)
+    voiced = []
+    for start_ms in range(0, len(segment), frame_ms):
+        frame = segment[start_ms:start_ms + frame_ms]
+        voiced.append(frame.rms > 0 and frame.dBFS >= threshold_dbfs)
+    return voiced
+
+def trim_silence(segment, frame_ms=VAD_FRAME_MS, padding_ms=VAD_PADDING_MS):
+    """Removes leading/trailing silence and shortens long pauses to 2 x padding_ms.
+    Returns the original segment if no speech is detected (leave that call to the caller)."""
+    voiced = detect_voiced_frames(segment, frame_ms)
+    if not any(voiced):
+        return segment
+
+    padding_frames = max(1, padding_ms // frame_ms)
+    keep = [False] * len(voiced)
+    for index, is_voiced in enumerate(voiced):
+        if is_voiced:
+            for padded in range(max(0, index - padding_frames), min(len(voiced), index + padding_frames + 1)):
+                keep[padded] = True
+
+    # Merge consecutive kept frames into (start_ms, end_ms) ranges and stitch them together
+    kept_ranges = []
+    for index, is_kept in enumerate(keep):
+        if not is_kept:
+            continue
+        start_ms = index * frame_ms
+        if kept_ranges and kept_ranges[-1][1] == start_ms:
+            kept_ranges[-1][1] = start_ms + frame_ms
+        else:
+            kept_ranges.append([start_ms, start_ms + frame_ms])
+    trimmed = segment[kept_ranges[0][0]:kept_ranges[0][1]]
+    for start_ms, end_ms in kept_ranges[1:]:
+        trimmed += segment[start_ms:end_ms]
+    return trimmed
+
+
+# --- Resample + encode in memory ---
+def encode_segment(segment, audio_format=ENCODE_FORMAT, codec=ENCODE_CODEC, bitrate=ENCODE_BITRATE):
+    """Encodes an AudioSegment into an in-memory buffer. Returns (filename, audio_bytes)."""
+    buffer = io.BytesIO()
+    segment.export(buffer, format=audio_format, codec=codec, bitrate=bitrate)
+    return f"speech.{audio_format}", buffer.getvalue()
+
+def preprocess_for_whisper(segment):
+    """VAD-trims, downmixes to mono, resamples to 16 kHz and encodes to a compact codec, all in memory.
+    Returns a (filename, audio_bytes) tuple that can be passed straight to transcribe_audio."""
+    with span("audio.export", input_ms=len(segment)) as stage:
+        speech = trim_silence(segment)
+        speech = speech.set_channels(1).set_frame_rate(WHISPER_SAMPLE_RATE).set_sample_width(2)
+        try:
+            filename, audio_bytes = encode_segment(speech)
+        except Exception as e:
+            event("audio.encode_fallback", level=logging.WARNING, fallback=FALLBACK_FORMAT, error=str(e))
+            filename, audio_bytes = encode_segment(speech, audio_format=FALLBACK_FORMAT, codec=None, bitrate=FALLBACK_BITRATE)
+        stage.set(speech_ms=len(speech), output_bytes=len(audio_bytes))
+        return filename, audio_bytes
+
+def wav_bytes(segment):
+    """Encodes a segment as uncompressed WAV in memory (the pre-optimization upload format)."""
+    buffer = io.BytesIO()
+    segment.export(buffer, format="wav")
+    return buffer.getvalue()
+
+def load_segment(audio_bytes):
+    """Decodes audio bytes (any FFmpeg-readable format) into an AudioSegment."""
+    return AudioSegment.from_file(io.BytesIO(audio_bytes))
+
+
+# --- Reply audio (TTS MP3) ---
+MP3_BITRATES_KBPS = { # Layer III bitrate index -> kbps, for MPEG-1 (3) and for MPEG-2/2.5 (2)
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+def mp3_duration_seconds(audio_bytes):
+    """Playback length of a constant-bitrate MP3 (what TTS returns), from its first frame header; no decoding
+    and no FFmpeg. Returns None when the bytes do not start with an MP3 frame (after an optional ID3 tag)."""
+    offset = 0
+    if audio_bytes[:3] == b"ID3" and len(audio_bytes) >= 10:
+        offset = 10 + ((audio_bytes[6] & 0x7F) << 21 | (audio_bytes[7] & 0x7F) << 14 | (audio_bytes[8] & 0x7F) << 7 | (audio_bytes[9] & 0x7F))
+    header = audio_bytes[offset:offset + 4]
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0 or (header[1] >> 1) & 3 != 1: # Sync + Layer III
+        return None
+    version = (header[1] >> 3) & 3 # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5, 1 = reserved
+    bitrate_index = header[2] >> 4
+    if version == 1 or bitrate_index in (0, 15): # Free-format or invalid
+        return None
+    kbps = MP3_BITRATES_KBPS[3 if version == 3 else 2][bitrate_index]
+    return (len(audio_bytes) - offset) * 8 / (kbps * 1000)
@@ -0,0 +1,85 @@
+"""Compares Whisper upload size and end-to-end STT time for raw WAV vs. preprocessed audio.
+
+Usage (from the project root):
+    python -m benchmarks.bench_audio_preprocessing recording1.wav recording2.wav --runs 3
+    python -m benchmarks.bench_audio_preprocessing recording.wav --skip-stt   # sizes only, no API calls
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+from openai import OpenAI
+from pydub import AudioSegment
+
+import audio_preprocessing as ap
+import core_tutor as ct
+
+
+def time_stt(client_obj, whisper_file, runs):
+    """Returns the median seconds for transcribe_audio over several runs."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        ct.transcribe_audio(client_obj, whisper_file)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_file(client_obj, path, runs, skip_stt):
+    segment = AudioSegment.from_file(path)
+
+    # Before: what the app used to upload (full-rate WAV of the whole recording)
+    raw_file = ("speech.wav", ap.wav_bytes(segment))
+
+    # After: VAD trim + 16 kHz mono + compact codec, all in memory
+    start = time.perf_counter()
+    processed_file = ap.preprocess_for_whisper(segment)
+    preprocess_seconds = time.perf_counter() - start
+
+    result = {
+        "file": os.path.basename(path),
+        "duration_seconds": round(len(segment) / 1000, 2),
+        "before_bytes": len(raw_file[1]),
+        "after_bytes": len(processed_file[1]),
+        "after_format": processed_file[0].rsplit(".", 1)[-1],
+        "preprocess_ms": round(preprocess_seconds * 1000, 1),
+    }
+    if not skip_stt:
+        result["before_stt_seconds"] = round(time_stt(client_obj, raw_file, runs), 3)
+        result["after_stt_seconds"] = round(time_stt(client_obj, processed_file, runs) + preprocess_seconds, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Whisper upload size and STT latency before/after preprocessing.")
+    parser.add_argument("files", nargs="+", help="Recorded audio files (WAV or anything FFmpeg can read).")
+    parser.add_argument("--runs", type=int, default=3, help="STT calls per variant (median is reported).")
+    parser.add_argument("--skip-stt", action="store_true", help="Only report sizes and preprocessing time.")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible base URL (e.g. a local stand-in server).")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this JSON file.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client_obj = None if args.skip_stt else OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=args.base_url)
+    results = [bench_file(client_obj, path, args.runs, args.skip_stt) for path in args.files]
+
+    for result in results:
+        ratio = result["before_bytes"] / max(1, result["after_bytes"])
+        line = (f"{result['file']}: {result['duration_seconds']}s audio, "
+                f"{result['before_bytes']:,} -> {result['after_bytes']:,} bytes ({ratio:.1f}x smaller, {result['after_format']}), "
+                f"preprocess {result['preprocess_ms']} ms")
+        if "before_stt_seconds" in result:
+            line += f", STT {result['before_stt_seconds']}s -> {result['after_stt_seconds']}s"
+        print(line)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
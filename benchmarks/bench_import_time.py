@@ -0,0 +1,87 @@
+"""Measures the import time of the server modules in a fresh interpreter (`python -X importtime`) and fails
+when it exceeds a budget, so a heavy top-level import (an API SDK, PortAudio bindings...) cannot creep back
+into every worker's cold start unnoticed.
+
+Usage (from the project root):
+    python -m benchmarks.bench_import_time                      # exit code 1 when over budget
+    python -m benchmarks.bench_import_time --budget-ms 150 --runs 5 --top 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What a Streamlit worker imports from this project before it can render (Streamlit itself is not counted)
+SERVER_MODULES = ("core_tutor", "turn_jobs", "session_history", "history_manager", "response_cache", "scenario_registry",
+                  "resilient_client", "instrumentation", "asset_pipeline", "lesson_pack", "state_backend", "tts_cache",
+                  "scheduler", "media_server")
+# Loaded on first use only; importing any of them at server start is a failure regardless of the time
+DEFERRED_MODULES = ("pyaudio", "pydub.playback", "console_audio", "openai", "dotenv")
+DEFAULT_BUDGET_MS = 250
+
+
+def parse_importtime(stderr):
+    """Parses `-X importtime` output into (self_us, cumulative_us, depth, module) tuples, in import order."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((int(self_us), int(cumulative_us), (len(name) - len(name.lstrip())) // 2, name.strip()))
+    return entries
+
+def measure_once(modules):
+    """Imports modules in a fresh interpreter. Returns (total_ms, entries, loaded module names)."""
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.getenv("PYTHONPATH")])))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+                               cwd=PROJECT_ROOT, env=environment, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing the server modules failed:\n{completed.stderr[-2000:]}")
+    entries = parse_importtime(completed.stderr)
+    # Top-level entries for the requested modules cover everything they pulled in (interpreter startup excluded)
+    total_us = sum(cumulative_us for _, cumulative_us, depth, name in entries if depth == 0 and name in modules)
+    return total_us / 1000, entries, {name for _, _, _, name in entries}
+
+def run_benchmark(modules=SERVER_MODULES, runs=3):
+    """Returns the best (fastest) of several runs, which filters out disk-cache and scheduling noise."""
+    return min((measure_once(modules) for _ in range(runs)), key=lambda result: result[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the server cold-start import time against a budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help=f"Allowed import time (default: {DEFAULT_BUDGET_MS} ms).")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to measure (the fastest counts).")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports (by self time) to list.")
+    parser.add_argument("--modules", nargs="+", default=list(SERVER_MODULES), help="Modules to import.")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this JSON file.")
+    args = parser.parse_args()
+
+    total_ms, entries, loaded = run_benchmark(tuple(args.modules), args.runs)
+    deferred_loaded = sorted(name for name in DEFERRED_MODULES if name in loaded)
+    print(f"Server modules imported in {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs}).")
+    print("Slowest imports (self time):")
+    for self_us, cumulative_us, _, name in sorted(entries, reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:7.1f} ms  {name} (cumulative {cumulative_us / 1000:.1f} ms)")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    if deferred_loaded:
+        failures.append(f"modules meant to load on first use were imported at start: {', '.join(deferred_loaded)}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"total_ms": round(total_ms, 2), "budget_ms": args.budget_ms, "deferred_loaded": deferred_loaded,
+                       "modules": {name: round(cumulative_us / 1000, 2) for _, cumulative_us, depth, name in entries if depth == 0}}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
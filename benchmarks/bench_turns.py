@@ -0,0 +1,272 @@
+"""Load-tests full conversation turns with N concurrent simulated learners, offline.
+
+Starts benchmarks/fake_openai_server.py in-process (or uses --base-url), then every learner runs --turns turns of
+Whisper -> GPT -> TTS through the real tutor code. Reports throughput, turn latency percentiles,
+time-to-first-audio and traced memory per session, and saves the results per commit for comparison.
+
+Usage (from the project root):
+    python -m benchmarks.bench_turns --learners 20 --turns 5 --variant stream
+    python -m benchmarks.bench_turns --learners 50 --variant async --time-scale 0.2
+    python -m benchmarks.bench_turns --compare benchmarks/results/<older>.json
+    python -m benchmarks.bench_turns --learners 20 --rate-limits chat=60,tts=60,stt=60   # queueing under a tight quota
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+import async_tutor
+import core_tutor as ct
+import instrumentation
+import scheduler
+import tts_cache
+from history_manager import HistoryManager
+
+from benchmarks.fake_openai_server import FakeServerConfig, start_fake_server
+
+VARIANTS = ("handle", "stream", "async", "async-stream")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+LEARNER_QUESTIONS = [
+    "What is the sun made of?",
+    "Can you tell me a story about a cat?",
+    "Why is the sky blue?",
+    "How many legs does a spider have?",
+    "What do elephants eat?",
+    "Can we play a word game?",
+]
+FAKE_RECORDING = ("speech.wav", b"RIFF" + bytes(32000)) # ~1 s of 16 kHz mono; the fake server ignores the content
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (same definition as the instrumentation histograms)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summarize_ms(values):
+    return {name: round(percentile(values, q) * 1000, 1) if values else None
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# --- One learner, sync variants (one thread per learner, like Streamlit sessions) ---
+def run_learner_sync(client_obj, learner_index, turns, variant, with_stt):
+    with scheduler.scope(f"learner-{learner_index}"): # Each learner is its own fair-share tenant
+        return _run_learner_sync(client_obj, learner_index, turns, variant, with_stt)
+
+def _run_learner_sync(client_obj, learner_index, turns, variant, with_stt):
+    session = ct.TutorSession(client_obj, history_manager=HistoryManager())
+    samples = []
+    for turn_index in range(turns):
+        start = time.perf_counter()
+        first_audio = None
+        question = LEARNER_QUESTIONS[(learner_index + turn_index) % len(LEARNER_QUESTIONS)]
+        if with_stt:
+            ct.transcribe_audio(client_obj, FAKE_RECORDING)
+        if variant == "handle":
+            reply, _, audio = ct.handle_conversation_turn(session, question)
+            ok = bool(reply and audio)
+            first_audio = time.perf_counter() - start if audio else None
+        else:
+            ok = False
+            for _, audio in ct.stream_conversation_turn(session, question):
+                if audio and first_audio is None:
+                    first_audio = time.perf_counter() - start
+                ok = ok or bool(audio)
+        samples.append((time.perf_counter() - start, first_audio, ok))
+    return session, samples
+
+
+# --- One learner, async variants (all learners on one event loop sharing one AsyncTutor) ---
+async def run_learner_async(tutor, learner_index, turns, variant, with_stt):
+    with scheduler.scope(f"learner-{learner_index}"): # Each gather() task has its own context, so this stays per learner
+        return await _run_learner_async(tutor, learner_index, turns, variant, with_stt)
+
+async def _run_learner_async(tutor, learner_index, turns, variant, with_stt):
+    session = ct.TutorSession(None, history_manager=HistoryManager())
+    samples = []
+    for turn_index in range(turns):
+        start = time.perf_counter()
+        first_audio = None
+        question = LEARNER_QUESTIONS[(learner_index + turn_index) % len(LEARNER_QUESTIONS)]
+        if with_stt:
+            await tutor.transcribe_audio(FAKE_RECORDING)
+        if variant == "async":
+            reply, _, audio = await tutor.handle_conversation_turn(session, question)
+            ok = bool(reply and audio)
+            first_audio = time.perf_counter() - start if audio else None
+        else:
+            ok = False
+            async for _, audio in tutor.stream_conversation_turn(session, question):
+                if audio and first_audio is None:
+                    first_audio = time.perf_counter() - start
+                ok = ok or bool(audio)
+        samples.append((time.perf_counter() - start, first_audio, ok))
+    return session, samples
+
+async def run_all_async(base_url, learners, turns, variant, with_stt, cache):
+    async with async_tutor.AsyncTutor(api_key="fake-key", base_url=base_url, cache=cache,
+                                      max_connections=max(learners * 2, 10), max_concurrent_requests=max(learners * 2, 10)) as tutor:
+        return await asyncio.gather(*(run_learner_async(tutor, index, turns, variant, with_stt) for index in range(learners)))
+
+
+def run_benchmark(args, base_url):
+    cache = tts_cache.TTSCache(cache_dir=tempfile.mkdtemp(prefix="speakgenie-bench-tts-"))
+    tts_cache.default_cache = cache # Fresh, private TTS cache: no hits carried over from earlier runs
+    client_obj = OpenAI(api_key="fake-key", base_url=base_url, max_retries=0)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+    start = time.perf_counter()
+    if args.variant in ("handle", "stream"):
+        with ThreadPoolExecutor(max_workers=args.learners) as pool:
+            futures = [pool.submit(run_learner_sync, client_obj, index, args.turns, args.variant, not args.skip_stt)
+                       for index in range(args.learners)]
+            learner_results = [future.result() for future in futures]
+    else:
+        learner_results = asyncio.run(run_all_async(base_url, args.learners, args.turns, args.variant, not args.skip_stt, cache))
+    elapsed = time.perf_counter() - start
+
+    memory = {}
+    if args.trace_memory:
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Sessions (history, summaries) are still alive here, so this is what each learner costs the process
+        memory = {
+            "per_session_kb": round((memory_after - memory_before) / args.learners / 1024, 1),
+            "peak_mb": round(memory_peak / 1024 / 1024, 1),
+        }
+
+    samples = [sample for _, learner_samples in learner_results for sample in learner_samples]
+    turn_seconds = [seconds for seconds, _, ok in samples if ok]
+    first_audio_seconds = [seconds for _, seconds, ok in samples if ok and seconds is not None]
+    return {
+        "turns": len(samples),
+        "failed_turns": sum(1 for _, _, ok in samples if not ok),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_turns_per_second": round(len(turn_seconds) / elapsed, 2) if elapsed else None,
+        "turn_ms": summarize_ms(turn_seconds),
+        "first_audio_ms": summarize_ms(first_audio_seconds),
+        "memory": memory,
+        "stages": instrumentation.metrics.summary()["stages"],
+        # Retries, hedges, timeouts and short-circuits from resilient_client (fault injection: --error-rate)
+        "client": {name: value for name, value in instrumentation.metrics.summary()["counters"].items() if name.startswith("client.")},
+        # Time spent queued for the API quota (--rate-limits), per bucket
+        "scheduler": {f"{name[len('scheduler.'):-len('.wait')]} queue ms p95": round(summary["p95"] * 1000, 1)
+                      for name, summary in instrumentation.metrics.summary()["stages"].items()
+                      if name.startswith("scheduler.") and name.endswith(".wait") and summary["count"]},
+    }
+
+
+def print_report(report, baseline=None):
+    results = report["results"]
+    print(f"{report['config']['variant']}: {report['config']['learners']} learners x {report['config']['turns']} turns "
+          f"@ commit {report['commit']}")
+    rows = [
+        ("throughput (turns/s)", results["throughput_turns_per_second"], baseline and baseline["throughput_turns_per_second"]),
+        ("failed turns", results["failed_turns"], baseline and baseline["failed_turns"]),
+    ]
+    for metric in ("turn_ms", "first_audio_ms"):
+        for name in ("p50", "p95", "p99"):
+            rows.append((f"{metric} {name}", results[metric][name], baseline and baseline[metric][name]))
+    if results["memory"]:
+        rows.append(("memory per session (KB)", results["memory"]["per_session_kb"],
+                     baseline and baseline.get("memory", {}).get("per_session_kb")))
+    if results.get("client"):
+        rows += [(name, value, baseline and baseline.get("client", {}).get(name)) for name, value in results["client"].items()]
+    if results.get("scheduler"):
+        rows += [(name, value, baseline and baseline.get("scheduler", {}).get(name)) for name, value in results["scheduler"].items()]
+    for label, value, old_value in rows:
+        line = f"  {label:<26} {value}"
+        if old_value not in (None, 0) and value is not None:
+            line += f"  (was {old_value}, {(value - old_value) / old_value:+.0%})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversation turns against a local fake OpenAI server.")
+    parser.add_argument("--learners", type=int, default=10, help="Concurrent simulated learners.")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per learner.")
+    parser.add_argument("--variant", choices=VARIANTS, default="handle",
+                        help="handle/stream = core_tutor (one thread per learner), async/async-stream = AsyncTutor.")
+    parser.add_argument("--skip-stt", action="store_true", help="Start each turn at GPT instead of Whisper.")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="Skip tracemalloc (it slows Python code down a little).")
+    parser.add_argument("--base-url", default=None, help="Use an already running OpenAI-compatible server instead.")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier for all fake server latencies.")
+    parser.add_argument("--chat-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--tts-ms", type=float, default=250)
+    parser.add_argument("--stt-ms", type=float, default=300)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limits", default=None, help="API quota (RPM/TPM, e.g. chat=600/40000,tts=300) to schedule against (default: scheduler.py's).")
+    parser.add_argument("--output", default=None, help="Results file (default: benchmarks/results/<commit>-<variant>.json).")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against.")
+    args = parser.parse_args()
+    # Quotas are real-world RPM/TPM; the fake server runs --time-scale times faster, so scale them the same way
+    limits = scheduler.parse_rate_limits(args.rate_limits) if args.rate_limits else scheduler.DEFAULT_RATE_LIMITS
+    scheduler.default_scheduler.configure({name: (rpm / args.time_scale, tpm and tpm / args.time_scale)
+                                           for name, (rpm, tpm) in limits.items()})
+
+    server = None
+    base_url = args.base_url
+    server_config = None
+    if base_url is None:
+        server_config = FakeServerConfig(stt_ms=args.stt_ms, chat_ms=args.chat_ms, token_ms=args.token_ms,
+                                         tts_ms=args.tts_ms, error_rate=args.error_rate, time_scale=args.time_scale, seed=1)
+        server, base_url = start_fake_server(server_config)
+    try:
+        results = run_benchmark(args, base_url)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "variant": args.variant, "learners": args.learners, "turns": args.turns, "stt": not args.skip_stt,
+            "rate_limits": args.rate_limits,
+            "server": "external" if args.base_url else dict(stt_ms=args.stt_ms, chat_ms=args.chat_ms, token_ms=args.token_ms,
+                                                              tts_ms=args.tts_ms, error_rate=args.error_rate, time_scale=args.time_scale),
+        },
+        "results": results,
+    }
+    if server_config is not None:
+        report["server_requests"] = server_config.request_counts
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_report(report, baseline)
+
+    if not args.no_save:
+        output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}-{args.variant}-{args.learners}x{args.turns}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+    return 0 if results["failed_turns"] == 0 or args.error_rate else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
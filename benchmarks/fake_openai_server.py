@@ -0,0 +1,219 @@
+"""A local stand-in for the OpenAI endpoints the tutor uses, so the pipeline can be load-tested offline.
+
+Serves /v1/audio/transcriptions, /v1/chat/completions (plain and SSE streaming) and /v1/audio/speech with
+configurable latency, jitter and injected failures. Nothing leaves the machine and no API key is needed.
+
+Usage (from the project root):
+    python -m benchmarks.fake_openai_server --port 8808 --chat-ms 400 --token-ms 20
+    # then point any OpenAI client at base_url="http://127.0.0.1:8808/v1" with any api_key
+
+Or in-process (as benchmarks.bench_turns does):
+    server, base_url = start_fake_server(FakeServerConfig(time_scale=0.1))
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = ("That is a great question! The sun is a big, hot star in the sky. "
+                 "It gives us light and keeps us warm every day. What do you like to do on sunny days?")
+FAKE_MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413) # One 128 kbps MPEG frame worth of (silent) bytes
+
+
+class FakeServerConfig:
+    """Latencies are in milliseconds and are multiplied by time_scale (e.g. 0.1 for a quick smoke run)."""
+
+    def __init__(self, stt_ms=300, chat_ms=400, token_ms=20, tts_ms=250, tts_ms_per_char=2, jitter=0.2,
+                 error_rate=0.0, error_status=500, reply=DEFAULT_REPLY, transcript="Tell me about the sun please",
+                 chunk_chars=4, time_scale=1.0, seed=None):
+        self.stt_ms = stt_ms
+        self.chat_ms = chat_ms # Until the first token (or the whole reply, when not streaming)
+        self.token_ms = token_ms # Between streamed chunks
+        self.tts_ms = tts_ms # Until the first audio byte
+        self.tts_ms_per_char = tts_ms_per_char # Rendering time for the rest of the clip
+        self.jitter = jitter # +/- fraction applied to every delay
+        self.error_rate = error_rate # Fraction of requests answered with error_status
+        self.error_status = error_status
+        self.reply = reply
+        self.transcript = transcript
+        self.chunk_chars = chunk_chars
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.request_counts = {}
+        self._lock = threading.Lock()
+
+    def delay(self, milliseconds):
+        """Sleeps for milliseconds (scaled, with jitter)."""
+        if milliseconds <= 0:
+            return
+        with self._lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(milliseconds * factor * self.time_scale / 1000)
+
+    def should_fail(self):
+        with self._lock:
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def count(self, endpoint):
+        with self._lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+
+
+def fake_mp3_bytes(text):
+    """Deterministic MP3-looking bytes, roughly as long as real TTS output for text (~60 ms of audio per character)."""
+    return FAKE_MP3_FRAME * max(1, len(text) * 60 // 26)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so client connection pooling behaves like against the real API
+    config = None # Set per server by start_fake_server
+
+    def log_message(self, format, *args):
+        pass # Quiet: a load test makes thousands of requests
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path.split("?", 1)[0].rstrip("/")
+        routes = {
+            "/v1/audio/transcriptions": self._transcriptions,
+            "/v1/chat/completions": self._chat_completions,
+            "/v1/audio/speech": self._speech,
+        }
+        route = routes.get(path)
+        if route is None:
+            self._send_json({"error": {"message": f"Unknown endpoint {path}", "type": "invalid_request_error"}}, status=404)
+            return
+        self.config.count(path)
+        if self.config.should_fail():
+            self.config.delay(20)
+            self._send_json({"error": {"message": "Injected failure", "type": "server_error"}}, status=self.config.error_status)
+            return
+        route(body)
+
+    # --- Endpoints ---
+    def _transcriptions(self, body):
+        self.config.delay(self.config.stt_ms)
+        self._send_json({"text": self.config.transcript})
+
+    def _chat_completions(self, body):
+        request = json.loads(body or b"{}")
+        model = request.get("model", "gpt-3.5-turbo")
+        reply = self.config.reply
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+        usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(reply) // 4,
+                 "total_tokens": prompt_chars // 4 + len(reply) // 4}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        if not request.get("stream"):
+            chunk_count = max(1, len(reply) // self.config.chunk_chars)
+            self.config.delay(self.config.chat_ms + chunk_count * self.config.token_ms)
+            self._send_json({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        # Server-sent events, one small delta per chunk, like the real streaming API
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close") # No Content-Length: the stream ends when the connection closes
+        self.end_headers()
+        self.close_connection = True
+        self.config.delay(self.config.chat_ms)
+        try:
+            for start in range(0, len(reply), self.config.chunk_chars):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {"content": reply[start:start + self.config.chunk_chars]}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.config.delay(self.config.token_ms)
+            final_chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self.wfile.write(f"data: {json.dumps(final_chunk)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client stopped listening (e.g. barge-in); nothing to clean up
+
+    def _speech(self, body):
+        request = json.loads(body or b"{}")
+        text = request.get("input", "")
+        audio = fake_mp3_bytes(text)
+        self.config.delay(self.config.tts_ms)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        # First bytes go out right away, the rest trickles in while "rendering", so streamed TTS can be measured
+        pieces = 4
+        piece_size = -(-len(audio) // pieces)
+        try:
+            for start in range(0, len(audio), piece_size):
+                self.wfile.write(audio[start:start + piece_size])
+                self.wfile.flush()
+                if start + piece_size < len(audio):
+                    self.config.delay(self.config.tts_ms_per_char * len(text) / pieces)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+# --- Server lifecycle ---
+def start_fake_server(config=None, host="127.0.0.1", port=0):
+    """Starts the fake server on a background thread. Returns (server, base_url); call server.shutdown() when done."""
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), {"config": config or FakeServerConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fake-openai-server", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI stand-in (Whisper, chat, TTS) with configurable latency.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--stt-ms", type=float, default=300)
+    parser.add_argument("--chat-ms", type=float, default=400, help="Time to first token.")
+    parser.add_argument("--token-ms", type=float, default=20, help="Delay between streamed chunks.")
+    parser.add_argument("--tts-ms", type=float, default=250, help="Time to first audio byte.")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (fault injection).")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    config = FakeServerConfig(stt_ms=args.stt_ms, chat_ms=args.chat_ms, token_ms=args.token_ms, tts_ms=args.tts_ms,
+                              jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+                              time_scale=args.time_scale)
+    server, base_url = start_fake_server(config, host=args.host, port=args.port)
+    print(f"Fake OpenAI server listening on {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""A local stand-in for a Redis server, so the redis:// state backend can be tried and tested offline.
+
+Speaks enough RESP2 for state_backend.RedisBackend: PING, AUTH, SELECT, GET, SET (with EX/PX), DEL, EXISTS,
+DBSIZE, FLUSHDB and QUIT. Data lives in memory and is lost when the process exits.
+
+Usage (from the project root):
+    python -m benchmarks.fake_redis_server --port 6390
+    SPEAKGENIE_STATE_URL=redis://127.0.0.1:6390/0 streamlit run streamlit_app.py
+
+Or in-process:
+    server, url = start_fake_redis_server()
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class FakeRedisStore:
+    """Keys -> (value, expires_at or None), one keyspace per SELECTed db."""
+
+    def __init__(self):
+        self.databases = {}
+        self.command_counts = {}
+        self._lock = threading.Lock()
+
+    def keyspace(self, db):
+        return self.databases.setdefault(db, {})
+
+    def count(self, command):
+        with self._lock:
+            self.command_counts[command] = self.command_counts.get(command, 0) + 1
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    store = None # Set per server by start_fake_redis_server
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"): # Inline command (e.g. typed into telnet)
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _reply(self, value):
+        if value is None:
+            data = b"$-1\r\n"
+        elif isinstance(value, bool):
+            data = b"+OK\r\n"
+        elif isinstance(value, int):
+            data = b":%d\r\n" % value
+        elif isinstance(value, str):
+            data = b"+%s\r\n" % value.encode("utf-8")
+        elif isinstance(value, Exception):
+            data = b"-ERR %s\r\n" % str(value).encode("utf-8")
+        else:
+            data = b"$%d\r\n%s\r\n" % (len(value), value)
+        self.wfile.write(data)
+
+    def handle(self):
+        db = 0
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if not args:
+                return
+            command = args[0].upper().decode("ascii", "replace")
+            self.store.count(command)
+            with self.store._lock:
+                keys = self.store.keyspace(db)
+                reply = self._execute(command, args[1:], keys)
+            if command == "SELECT" and not isinstance(reply, Exception):
+                db = int(args[1])
+            self._reply(reply)
+            if command == "QUIT":
+                return
+
+    def _execute(self, command, args, keys):
+        now = time.time()
+        if command in ("PING",):
+            return "PONG"
+        if command in ("AUTH", "SELECT", "QUIT"):
+            return True
+        if command == "GET":
+            item = keys.get(args[0])
+            if item is None or (item[1] is not None and item[1] <= now):
+                keys.pop(args[0], None)
+                return None
+            return item[0]
+        if command == "SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[2:]]
+            for index, option in enumerate(options):
+                if option in (b"EX", b"PX"):
+                    amount = float(args[2 + index + 1])
+                    expires_at = now + (amount if option == b"EX" else amount / 1000)
+            keys[args[0]] = (args[1], expires_at)
+            return True
+        if command == "DEL":
+            return sum(1 for key in args if keys.pop(key, None) is not None)
+        if command == "EXISTS":
+            return sum(1 for key in args if key in keys and (keys[key][1] is None or keys[key][1] > now))
+        if command == "DBSIZE":
+            return len(keys)
+        if command == "FLUSHDB":
+            keys.clear()
+            return True
+        return ValueError(f"unknown command '{command}'")
+
+
+# --- Server lifecycle ---
+def start_fake_redis_server(host="127.0.0.1", port=0, store=None):
+    """Starts the stand-in on a background thread. Returns (server, url); call server.shutdown() when done."""
+    handler = type("ConfiguredFakeRedisHandler", (FakeRedisHandler,), {"store": store or FakeRedisStore()})
+    server = socketserver.ThreadingTCPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fake-redis-server", daemon=True)
+    thread.start()
+    return server, f"redis://{host}:{server.server_address[1]}/0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local in-memory Redis stand-in for the redis:// state backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server, url = start_fake_redis_server(args.host, args.port)
+    print(f"Fake Redis server listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import io
+import wave
+
+import pyaudio
+from pydub import AudioSegment
+from pydub.playback import play
+
+# Console-only audio I/O (microphone recording and speaker playback). Needs PortAudio and an audio device,
+# so servers never import it: core_tutor loads it on first use of ct.record_audio / ct.play_audio.
+
+# --- Audio Configuration (parameters for recording/saving, not direct I/O) ---
+FORMAT = pyaudio.paInt16
+CHANNELS = 1
+RATE = 44100
+CHUNK = 1024
+RECORD_SECONDS = 5
+
+# --- Function to Record Audio from Microphone ---
+def record_audio(record_seconds=RECORD_SECONDS):
+    """Records audio from the default microphone and returns it as in-memory WAV bytes.
+    This function is primarily for console-based app, Streamlit uses st.audio_recorder."""
+    audio = pyaudio.PyAudio()
+    stream = audio.open(format=FORMAT, channels=CHANNELS,
+                        rate=RATE, input=True,
+                        frames_per_buffer=CHUNK)
+    print(f"\nRecording for {record_seconds} seconds... Speak now!")
+    frames = []
+    for _ in range(0, int(RATE / CHUNK * record_seconds)):
+        data = stream.read(CHUNK)
+        frames.append(data)
+    print("Finished recording.")
+    stream.stop_stream()
+    stream.close()
+    audio.terminate()
+    wav_buffer = io.BytesIO()
+    wf = wave.open(wav_buffer, 'wb')
+    wf.setnchannels(CHANNELS)
+    wf.setsampwidth(audio.get_sample_size(FORMAT))
+    wf.setframerate(RATE)
+    wf.writeframes(b''.join(frames))
+    wf.close()
+    print(f"Recorded {wav_buffer.tell()} bytes of audio.")
+    return wav_buffer.getvalue()
+
+# --- Function to Play Audio ---
+def play_audio(audio):
+    """Plays audio using pydub. audio is a file path or in-memory audio (bytes, memoryview or a binary buffer).
+    This function is primarily for console-based app, Streamlit uses st.audio()."""
+    try:
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            audio = io.BytesIO(audio)
+        song = AudioSegment.from_file(audio) 
+        print("Playing audio...")
+        play(song)
+        print("Finished playing.")
+    except FileNotFoundError:
+        print(f"Error: Audio file '{audio}' not found. Make sure it exists.")
+    except Exception as e:
+        print(f"An error occurred during playback: {e}")
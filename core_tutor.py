@@ -1,241 +1,603 @@
+import contextvars
+import io
+import logging
 import os
-import pyaudio 
-import wave    
-from pydub import AudioSegment
-from pydub.playback import play 
-from dotenv import load_dotenv
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from openai import OpenAI 
-
-# --- Global Language Variable (Can be set by Streamlit) ---
-current_ai_language = "English" 
+import lesson_pack
+import resilient_client
+import scheduler
+import tts_cache
+from instrumentation import event, record_duration, record_usage, span, trace_turn
+from scenario_registry import FREE_CHAT, registry as scenario_registry
+from intent_matcher import intent_matcher
 
 # --- API Key Loading ---
-load_dotenv()
-
-# --- Audio Configuration (parameters for recording/saving, not direct I/O) ---
-FORMAT = pyaudio.paInt16 
-CHANNELS = 1
-RATE = 44100
-CHUNK = 1024
-RECORD_SECONDS = 5 
-OUTPUT_FILENAME = "recorded_audio.wav"
-AI_RESPONSE_AUDIO_FILENAME = "ai_response.mp3" 
-
-# --- Function to Record Audio from Microphone ---
-def record_audio(filename, record_seconds=RECORD_SECONDS):
-    """Records audio from the default microphone and saves it to a WAV file.
-    This function is primarily for console-based app, Streamlit uses st.audio_recorder."""
-    audio = pyaudio.PyAudio()
-    stream = audio.open(format=FORMAT, channels=CHANNELS,
-                        rate=RATE, input=True,
-                        frames_per_buffer=CHUNK)
-    print(f"\nRecording for {record_seconds} seconds... Speak now!")
-    frames = []
-    for _ in range(0, int(RATE / CHUNK * record_seconds)):
-        data = stream.read(CHUNK)
-        frames.append(data)
-    print("Finished recording.")
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
-    wf = wave.open(filename, 'wb')
-    wf.setnchannels(CHANNELS)
-    wf.setsampwidth(audio.get_sample_size(FORMAT))
-    wf.setframerate(RATE)
-    wf.writeframes(b''.join(frames))
-    wf.close()
-    print(f"Audio saved to {filename}")
-    return filename
-
-# --- Function to Play Audio File ---
-def play_audio(filename):
-    """Plays an audio file using pydub.
-    This function is primarily for console-based app, Streamlit uses st.audio()."""
-    try:
-        song = AudioSegment.from_file(filename) 
-        print(f"Playing {filename}...")
-        play(song)
-        print("Finished playing.")
-    except FileNotFoundError:
-        print(f"Error: Audio file '{filename}' not found. Make sure it exists.")
-    except Exception as e:
-        print(f"An error occurred during playback: {e}")
+_dotenv_loaded = False
+
+def load_dotenv():
+    """Loads .env into the environment (once). Called by entry points, not at import, so importing core_tutor stays cheap."""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        import dotenv
+
+        dotenv.load_dotenv()
+        _dotenv_loaded = True
+
+# --- Console audio (microphone recording and local playback) ---
+# Needs PortAudio and an audio device, so it lives in console_audio.py and is imported on first use only;
+# servers without PortAudio can import core_tutor
+CONSOLE_AUDIO_NAMES = ("FORMAT", "CHANNELS", "RATE", "CHUNK", "RECORD_SECONDS", "record_audio", "play_audio")
+
+def __getattr__(name):
+    """Resolves ct.record_audio, ct.play_audio and the recording settings from console_audio when first used."""
+    if name in CONSOLE_AUDIO_NAMES:
+        import console_audio
+
+        return getattr(console_audio, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- In-memory audio helpers ---
+AUDIO_SIGNATURES = [
+    (b"RIFF", "wav"),
+    (b"OggS", "ogg"),
+    (b"fLaC", "flac"),
+    (b"ID3", "mp3"),
+    (b"\x1a\x45\xdf\xa3", "webm"),
+    (b"\xff\xfb", "mp3"),
+    (b"\xff\xf3", "mp3"),
+    (b"\xff\xf2", "mp3"),
+]
+
+def guess_audio_filename(audio_bytes):
+    """Picks a filename whose extension matches the audio container, so Whisper can detect the format."""
+    header = bytes(audio_bytes[:4])
+    for signature, extension in AUDIO_SIGNATURES:
+        if header.startswith(signature):
+            return f"speech.{extension}"
+    if bytes(audio_bytes[4:8]) == b"ftyp":
+        return "speech.m4a"
+    return "speech.wav"
+
+def as_whisper_file(audio):
+    """Normalizes any supported audio input into a (filename, bytes) tuple for the Whisper API.
+    Accepts a file path, bytes/bytearray/memoryview, a binary buffer (e.g. io.BytesIO) or a (filename, bytes) tuple."""
+    if isinstance(audio, tuple):
+        return audio
+    if isinstance(audio, str):
+        with open(audio, "rb") as audio_file:
+            return os.path.basename(audio), audio_file.read()
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return guess_audio_filename(audio), audio
+    if isinstance(audio, io.BytesIO):
+        audio_view = audio.getbuffer() # Zero-copy view of the buffer's contents
+    else:
+        audio_view = audio.read()
+    filename = os.path.basename(getattr(audio, "name", "") or "") or guess_audio_filename(audio_view)
+    return filename, audio_view
 
 # --- Function to Transcribe Audio using OpenAI Whisper ---
-def transcribe_audio(client_obj, audio_file_path):
-    """Transcribes audio from a file using OpenAI Whisper."""
-    print(f"Transcribing audio using OpenAI Whisper: {audio_file_path}...")
+def transcribe_audio(client_obj, audio):
+    """Transcribes audio using OpenAI Whisper, entirely in memory.
+    audio is bytes, a memoryview, a binary buffer (e.g. io.BytesIO), a (filename, bytes) tuple
+    such as audio_preprocessing.preprocess_for_whisper returns, or a file path."""
     try:
-        with open(audio_file_path, "rb") as audio_file:
+        client_obj = resilient_client.wrap(client_obj) # Deadline, retries and hedging for the Whisper call
+        filename, audio_bytes = as_whisper_file(audio)
+        with span("stt.transcribe", upload_bytes=len(audio_bytes), audio_format=filename.rsplit(".", 1)[-1]) as stage:
             transcription = client_obj.audio.transcriptions.create( 
                 model="whisper-1",
-                file=audio_file,
+                file=(filename, bytes(audio_bytes)),
                 language="en" # Force transcription to English
             )
-        text = transcription.text
-        print(f"Transcription: {text}")
+            text = transcription.text
+            stage.set(transcript_chars=len(text))
         return text
     except Exception as e:
-        print(f"Error during Whisper transcription: {e}")
+        event("stt.error", level=logging.WARNING, error=str(e))
         return None
 
-# --- Function to Get AI Response from OpenAI GPT ---
-def get_gpt_response(client_obj, prompt_text, conversation_history, mode="chat", roleplay_context=""):
-    """Gets an AI response from GPT, with optional translation and general child-appropriate persona."""
-    print(f"Getting AI response from GPT for: '{prompt_text}' (Mode: {mode})...")
-    global current_ai_language 
+# --- Per-session tutor state (replaces the old module-level language global) ---
+class TutorSession:
+    """Everything one learner's turns depend on: client, language, scenario (mode + roleplay context), history.
+    Core functions read only from this object, so turns of different learners can run in parallel threads."""
+    __slots__ = ("client", "language", "scenario", "history", "history_manager", "voice", "response_cache", "tenant")
 
+    def __init__(self, client, language="English", scenario_key=FREE_CHAT, history=None, history_manager=None, voice="alloy", response_cache=None, tenant=None):
+        self.client = resilient_client.wrap(client) # Every GPT/TTS call of the session gets deadlines, retries and circuit breaking
+        self.language = language
+        self.scenario = scenario_registry.get(scenario_key)
+        self.history = history if history is not None else []
+        self.history_manager = history_manager
+        self.voice = voice
+        self.response_cache = response_cache # Opt-in ResponseCache for Free Chat questions (None = off)
+        self.tenant = tenant # Learner session or classroom charged for this session's API calls (see scheduler.py)
+
+    @property
+    def mode(self):
+        """Prompt mode of the current scenario: "chat" or "roleplay"."""
+        return self.scenario.mode
+
+    @property
+    def roleplay_context(self):
+        return self.scenario.context
+
+    def set_scenario(self, scenario_key):
+        """Switches to another scenario from the registry (see scenarios.json)."""
+        self.scenario = scenario_registry.get(scenario_key)
+
+    def prompt_messages(self):
+        """Returns the pre-built (prefix_messages, suffix_messages) for the current scenario and language."""
+        return self.scenario.prompt_messages(self.language)
+
+    def set_language(self, language_name):
+        """Sets this session's AI response language. Called by Streamlit UI."""
+        self.language = language_name
+        event("session.language", language=language_name)
+        return f"Language set to {language_name}."
+
+    def reset_history(self):
+        """Clears the conversation and any running summary built from it."""
+        self.history = []
+        if self.history_manager is not None:
+            self.history_manager.reset()
+
+    def to_state(self):
+        """JSON-serializable settings and running summary (the history list itself is saved by its owner)."""
+        return {
+            "language": self.language,
+            "scenario": self.scenario.key,
+            "voice": self.voice,
+            "history_manager": self.history_manager.to_state() if self.history_manager is not None else None,
+        }
+
+    def restore_state(self, state):
+        """Applies a snapshot from to_state(); a scenario no longer in scenarios.json keeps the current one."""
+        self.language = state.get("language", self.language)
+        self.scenario = scenario_registry.scenarios.get(state.get("scenario"), self.scenario)
+        self.voice = state.get("voice", self.voice)
+        if self.history_manager is not None and state.get("history_manager"):
+            self.history_manager.restore_state(state["history_manager"])
+
+# --- Function to Build the GPT Message List ---
+def build_gpt_messages(session, prompt_text, conversation_history=None):
+    """Builds the [system] + history + [user] message list for one GPT call; only the history and user turn are new."""
+    prefix_messages, suffix_messages = session.prompt_messages()
+    if conversation_history is None:
+        conversation_history = session.history
+    return [*prefix_messages, *conversation_history, {"role": "user", "content": prompt_text}, *suffix_messages]
+
+# --- Function to Get AI Response from OpenAI GPT ---
+def get_gpt_response(session, prompt_text, conversation_history=None):
+    """Gets an AI response from GPT, with optional translation and general child-appropriate persona.
+    Uses session.history unless conversation_history is given; with a session HistoryManager only its
+    token-budgeted view of the history is sent."""
     try:
-        system_message_content = ""
+        if conversation_history is None:
+            conversation_history = session.history
+        if session.history_manager is not None:
+            conversation_history = session.history_manager.prepare(session.client, conversation_history)
+        messages = build_gpt_messages(session, prompt_text, conversation_history)
         
-        # General child persona (age-specific parts removed)
-        general_child_instruction = " You are talking to a young child (aged 5-10)."
-        simple_vocab_instruction = "Use words and concepts a 5-10 year old child would easily understand."
-
-        if mode == "chat":
-            system_message_content = (
-                f"You are SpeakGenie, a friendly, encouraging, and patient English tutor."
-                f"{general_child_instruction} Your responses should be simple, positive, and easy for them to understand. "
-                f"{simple_vocab_instruction} "
-                "Use short sentences and avoid complex vocabulary. "
-                "Encourage them to speak and ask simple follow-up questions. "
-                "Make learning fun! For factual questions, explain them in a very simple, fun way. "
-                "Always include relevant and positive emojis in your responses to make them more engaging! ✨😊📚"
-            )
-        elif mode == "roleplay":
-            system_message_content = (
-                f"You are SpeakGenie, a kind and helpful AI English tutor in Roleplay Mode."
-                f"{general_child_instruction} Your current scenario is: '{roleplay_context}'. "
-                "You must strictly act as the character appropriate to this scenario. "
-                f"{simple_vocab_instruction} "
-                "Stay in character always! Encourage the child to speak with simple questions. "
-                "Keep the conversation friendly, positive, and directly related to the roleplay. "
-                "If the child tries to exit or change the topic, gently guide them back to the scenario or remind them to say 'exit roleplay'."
+        with span("llm.chat", mode=session.mode, messages=len(messages)) as stage:
+            chat_completion = session.client.chat.completions.create( 
+                model="gpt-3.5-turbo", # Final model for stability
+                messages=messages
             )
-        
-        system_message = {"role": "system", "content": system_message_content}
-        
-        messages = [system_message] + conversation_history + [{"role": "user", "content": prompt_text}]
-
-        if current_ai_language != "English":
-            messages.append({"role": "system", "content": f"After your English response, provide a translation into {current_ai_language}. Format: 'English Response. ({current_ai_language} Translation)'"})
-        
-        chat_completion = client_obj.chat.completions.create( 
-            model="gpt-3.5-turbo", # Final model for stability
-            messages=messages
-        )
-        ai_response = chat_completion.choices[0].message.content
-        print(f"AI Response: {ai_response}")
+            ai_response = chat_completion.choices[0].message.content
+            record_usage(stage, chat_completion)
         return ai_response
     except Exception as e:
-        print(f"Error getting GPT response: {e}")
+        event("llm.error", level=logging.WARNING, error=str(e))
         return None
 
 # --- Function to Convert Text to Speech using OpenAI TTS ---
-def text_to_speech_openai(client_obj, text, filename=AI_RESPONSE_AUDIO_FILENAME, voice="alloy"):
-    """Converts text to speech using OpenAI TTS and saves/plays the audio (for console testing)."""
-    print(f"Converting AI response to speech using OpenAI TTS (voice: {voice})...")
+def text_to_speech_openai(client_obj, text, voice="alloy", play_now=True):
+    """Converts text to speech using OpenAI TTS and returns the MP3 bytes, optionally playing them
+    (for console testing). Nothing is written to disk."""
     try:
-        response = client_obj.audio.speech.create(
-            model="tts-1", 
-            voice=voice,   
+        audio_bytes = synthesize_speech_bytes(client_obj, text, voice=voice, store=False)
+        
+        if play_now:
+            import console_audio
+
+            console_audio.play_audio(audio_bytes)
+        return audio_bytes
+    except Exception as e:
+        event("tts.error", level=logging.WARNING, error=str(e))
+        return None
+
+# --- Function to get TTS audio bytes, served from the TTS cache when possible ---
+def synthesize_speech_bytes(client_obj, text, voice="alloy", model="tts-1", response_format="mp3", store=True, cache=None):
+    """Returns TTS audio bytes for text. Repeated phrases are served from the TTS cache instead of the API.
+    Raises on API errors, like client_obj.audio.speech.create does."""
+    cache = cache or tts_cache.default_cache
+    cache_key = cache.make_key(model, voice, response_format, text)
+    audio_bytes = cache.get(cache_key)
+    if audio_bytes is not None:
+        return audio_bytes
+
+    with span("tts.synthesize", text_chars=len(text)) as stage:
+        audio_stream = resilient_client.wrap(client_obj).audio.speech.create(
+            model=model,
+            voice=voice,
             input=text,
+            response_format=response_format
         )
-        
-        response.stream_to_file(filename)
-        print(f"AI response audio saved to {filename}")
-        
-        play_audio(filename) 
-        print("AI response played.")
-        return filename
+        audio_bytes = audio_stream.read()
+        stage.set(audio_bytes=len(audio_bytes))
+    if store:
+        cache.put(cache_key, audio_bytes)
+    return audio_bytes
+
+def get_static_phrases():
+    """Returns every fixed phrase the tutor speaks (greetings, farewells, interceptor replies) from the scenario registry."""
+    return scenario_registry.static_phrases()
+
+def warm_up_tts_cache(client_obj, phrases=None, voice="alloy", cache=None):
+    """Pre-renders static phrases into the TTS cache. Returns how many phrases had to be synthesized."""
+    cache = cache or tts_cache.default_cache
+    rendered = 0
+    for phrase in phrases or get_static_phrases():
+        if cache.make_key("tts-1", voice, "mp3", phrase) in cache:
+            continue
+        try:
+            with scheduler.scope("warm-up", scheduler.BACKGROUND): # Never ahead of a learner's turn
+                synthesize_speech_bytes(client_obj, phrase, voice=voice, cache=cache)
+            rendered += 1
+        except Exception as e:
+            event("tts.warm_up_error", level=logging.WARNING, phrase=phrase, error=str(e))
+    event("tts.warm_up", level=logging.INFO, rendered=rendered, **cache.stats())
+    return rendered
+
+# --- Bilingual replies (English segment + native-language segment, spoken as separate TTS jobs) ---
+BILINGUAL_SEPARATOR = "###" # GPT writes this line between its English reply and the translation (see scenarios.json)
+ENGLISH_SEGMENT = "english"
+NATIVE_SEGMENT = "native"
+
+def split_bilingual(text):
+    """Splits a GPT reply into (english_text, native_text); native_text is "" when there is no translation."""
+    english_text, _, native_text = text.partition(BILINGUAL_SEPARATOR)
+    return english_text.strip(), native_text.strip()
+
+def format_bilingual(english_text, native_text):
+    """Display/history form of a reply: "English Response. (Native Translation)"."""
+    return f"{english_text} ({native_text})" if native_text else english_text
+
+def synthesize_bilingual(client_obj, english_text, native_text, voice="alloy", store=True):
+    """Renders both segments as concurrent TTS jobs. Returns the English clip followed by the native clip
+    (MP3 frames concatenate cleanly), so the English part is what plays first. Raises on API errors."""
+    native_future = None
+    if native_text and _has_speakable_text(native_text):
+        native_future = _submit_tts(synthesize_speech_bytes, client_obj, native_text, voice=voice, store=store)
+    english_audio = synthesize_speech_bytes(client_obj, english_text, voice=voice, store=store)
+    return english_audio + (native_future.result() if native_future else b"")
+
+_static_translations = {} # (language, phrase) -> translation, shared by every session
+_static_translations_lock = threading.Lock()
+
+def translate_static_phrase(client_obj, phrase, language):
+    """Translation of a fixed phrase (greeting, farewell, interceptor reply) into language.
+    Asked from GPT once per language and process, then served from memory. Returns "" for English or on errors."""
+    if not phrase or language == "English":
+        return ""
+    key = (language, phrase)
+    translation = _static_translations.get(key)
+    if translation is not None:
+        return translation
+    try:
+        with span("llm.translate", language=language) as stage:
+            completion = client_obj.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": scenario_registry.static_translation_instruction.replace("{language}", language)},
+                    {"role": "user", "content": phrase},
+                ]
+            )
+            record_usage(stage, completion)
+        translation = completion.choices[0].message.content.strip()
     except Exception as e:
-        print(f"Error during OpenAI TTS: {e}")
+        event("llm.error", level=logging.WARNING, source="translate", error=str(e))
+        return "" # Not cached, so the next turn retries
+    with _static_translations_lock:
+        _static_translations[key] = translation
+    return translation
+
+def speak_static_phrase(session, phrase):
+    """Display text and audio for a fixed phrase in the session's language (English clip first, then the
+    cached translation). Both clips are stored in the TTS cache. Audio is None if TTS fails."""
+    packed = lesson_pack.default_library.lookup_static(session, phrase)
+    if packed is not None:
+        return packed
+    native_text = translate_static_phrase(session.client, phrase, session.language)
+    try:
+        audio_bytes = synthesize_bilingual(session.client, phrase, native_text, voice=session.voice)
+    except Exception as e:
+        event("tts.error", level=logging.WARNING, source="static", error=str(e))
+        audio_bytes = None
+    return format_bilingual(phrase, native_text), audio_bytes
+
+class SpokenSentence(tuple):
+    """A (sentence_text, audio_bytes) pair yielded by stream_conversation_turn, tagged with .segment
+    (ENGLISH_SEGMENT or NATIVE_SEGMENT). Unpacks like a plain 2-tuple."""
+
+    def __new__(cls, sentence_text, audio_bytes, segment=ENGLISH_SEGMENT):
+        spoken = super().__new__(cls, (sentence_text, audio_bytes))
+        spoken.segment = segment
+        return spoken
+
+# --- Local intent matching (exit phrases and canned in-character replies, no LLM call) ---
+def get_interceptor_reply(session, user_input_text, current_conversation_history):
+    """Returns a precomputed reply if the compiled local intent matcher recognizes the input
+    (an exit phrase, or one of the scenario's interceptor rules in scenarios.json), otherwise None."""
+    intent = intent_matcher.match(session.scenario.key, user_input_text, len(current_conversation_history))
+    if intent is None:
         return None
+    event("intent.matched", kind=intent.kind, scenario=session.scenario.key)
+    return intent.reply
 
-# --- Functions for managing language selection ---
-def set_global_language(language_name): 
-    """Sets the global AI response language. Called by Streamlit UI."""
-    global current_ai_language
-    current_ai_language = language_name
-    print(f"AI response language set to {current_ai_language}.")
-    return f"Language set to {language_name}."
+# --- Pre-generated lesson turns and the opt-in semantic response cache (Free Chat only) ---
+def get_cached_response(session, user_input_text, current_conversation_history=()):
+    """Returns a (reply_text, audio_bytes) pre-generated by a lesson pack (see lesson_pack.py) or cached for a
+    Free Chat question, or None (also when the session didn't opt in to the response cache)."""
+    scripted = lesson_pack.default_library.lookup_turn(session, user_input_text, current_conversation_history)
+    if scripted is not None:
+        return scripted
+    if session.response_cache is None or session.mode != "chat":
+        return None
+    return session.response_cache.get(session, user_input_text)
+
+def cache_response(session, user_input_text, ai_response_text, audio_bytes):
+    """Remembers a Free Chat reply and its audio for near-identical future questions (no-op unless opted in)."""
+    if session.response_cache is None or session.mode != "chat" or not audio_bytes:
+        return
+    session.response_cache.put(session, user_input_text, ai_response_text, audio_bytes)
 
 # --- Helper function to manage a conversation turn for Streamlit ---
-def handle_conversation_turn(client_obj, user_input_text, current_conversation_history, current_mode, current_roleplay_context=""):
-    """Handles one turn of conversation: gets AI response, updates history, generates speech bytes for Streamlit."""
-    
-    ai_response_text = None
-    ai_audio_bytes = None
-    
-    print(f"DEBUG: handle_conversation_turn called. Mode: {current_mode}, Context: {current_roleplay_context}, Input: '{user_input_text}'") # DEBUG
+def handle_conversation_turn(session, user_input_text, current_conversation_history=None):
+    """Handles one turn of conversation: gets AI response, updates history, generates speech bytes for Streamlit.
+    current_conversation_history defaults to session.history. The whole turn is traced as "turn.handle"."""
+    if current_conversation_history is None:
+        current_conversation_history = session.history
+    with trace_turn("turn.handle", mode=session.mode, scenario=session.scenario.key) as turn:
+        return _run_conversation_turn(session, user_input_text, current_conversation_history, turn)
+
+def _run_conversation_turn(session, user_input_text, current_conversation_history, turn):
+    ai_response_text = get_interceptor_reply(session, user_input_text, current_conversation_history)
     
-    # --- Rule-based interceptor for critical roleplay persona breaks ---
-    # This part tries to provide a hardcoded in-character response if certain phrases are detected.
-    # It only triggers for the Store roleplay and for very early turns.
-    if current_mode == "roleplay_mode" and \
-       current_roleplay_context == "At the Store: You are buying something from a helpful shopkeeper. Focus on asking for items and quantities." and \
-       len(current_conversation_history) < 3: # Only intercept for first few turns
-        
-        lower_input = user_input_text.lower()
-        print(f"DEBUG: Store interceptor active. Lower input: '{lower_input}'") # DEBUG
-
-        if "can i get" in lower_input or "do you have" in lower_input or "where is" in lower_input or "i need" in lower_input:
-            print("DEBUG: Interceptor caught a request phrase.") # DEBUG
-            if "pen" in lower_input:
-                ai_response_text = "Certainly! We have many pens. What color pen would you like? 🖊️"
-            elif "book" in lower_input:
-                ai_response_text = "Of course! What kind of book are you looking for? A storybook or a drawing book? 📚"
-            elif "apple" in lower_input:
-                ai_response_text = "Apples are delicious! How many apples would you like? 🍎"
-            elif "pet" in lower_input: 
-                ai_response_text = "Oh, a pet! We don't sell pets here in this store, but we have lovely books about animals! 🐾"
-            else: # General fallback for any other item asked about in the store
-                ai_response_text = "Hmm, let me check for you! What exactly are you looking for? ✨"
-            
-            # If a hardcoded response was generated by any of the above conditions
-            if ai_response_text: 
-                print(f"DEBUG: Hardcoded response chosen: '{ai_response_text}'") # DEBUG
-                current_conversation_history.append({"role": "user", "content": user_input_text})
-                current_conversation_history.append({"role": "assistant", "content": ai_response_text})
-                
-                try:
-                    audio_stream = client_obj.audio.speech.create(
-                        model="tts-1", 
-                        voice="alloy",   
-                        input=ai_response_text,
-                        response_format="mp3" 
-                    )
-                    ai_audio_bytes = audio_stream.read() 
-                    print("DEBUG: Hardcoded audio generated. Returning.") # DEBUG
-                    return ai_response_text, current_conversation_history, ai_audio_bytes
-                except Exception as e:
-                    print(f"Error generating speech bytes for Streamlit (hardcoded response): {e}")
-                    current_conversation_history.append({"role": "user", "content": user_input_text})
-                    current_conversation_history.append({"role": "assistant", "content": ai_response_text})
-                    print("DEBUG: Hardcoded audio failed. Returning.") # DEBUG
-                    return ai_response_text, current_conversation_history, None 
-    # --- END Rule-based Interceptor Logic ---
+    # If a hardcoded response was generated by the interceptor (translated once per language, then cached)
+    if ai_response_text: 
+        turn.set(source="interceptor")
+        ai_response_text, ai_audio_bytes = speak_static_phrase(session, ai_response_text)
+        current_conversation_history.append({"role": "user", "content": user_input_text})
+        current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+        return ai_response_text, current_conversation_history, ai_audio_bytes
+
+    # Frequent Free Chat questions can be answered from the (opt-in) response cache: no GPT, no TTS
+    cached_response = get_cached_response(session, user_input_text, current_conversation_history)
+    if cached_response:
+        turn.set(source="response_cache")
+        ai_response_text, audio_bytes = cached_response
+        current_conversation_history.append({"role": "user", "content": user_input_text})
+        current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+        return ai_response_text, current_conversation_history, audio_bytes
 
     # If no hardcoded response was returned, proceed to call GPT as usual
-    print(f"DEBUG: Interceptor did NOT trigger a return. Calling GPT.") # DEBUG
-    ai_response_text = get_gpt_response(client_obj, user_input_text, current_conversation_history, mode=current_mode, roleplay_context=current_roleplay_context)
+    turn.set(source="llm")
+    ai_response_text = get_gpt_response(session, user_input_text, current_conversation_history)
     
     if ai_response_text:
+        english_text, native_text = split_bilingual(ai_response_text)
+        ai_response_text = format_bilingual(english_text, native_text)
         current_conversation_history.append({"role": "user", "content": user_input_text})
         current_conversation_history.append({"role": "assistant", "content": ai_response_text})
         
         try:
-            audio_stream = client_obj.audio.speech.create(
-                model="tts-1", 
-                voice="alloy",   
-                input=ai_response_text,
-                response_format="mp3" 
-            )
-            audio_bytes = audio_stream.read() 
+            # English and translation are rendered concurrently instead of as one long clip.
+            # Free-form replies are looked up but not stored, so one-off text doesn't churn the cache
+            audio_bytes = synthesize_bilingual(session.client, english_text, native_text, voice=session.voice, store=False)
+            cache_response(session, user_input_text, ai_response_text, audio_bytes)
             return ai_response_text, current_conversation_history, audio_bytes
         except Exception as e:
-            print(f"Error generating speech bytes for Streamlit: {e}")
+            event("tts.error", level=logging.WARNING, source="llm", error=str(e))
             return ai_response_text, current_conversation_history, None 
+
+    # GPT is unreachable (retries used up or circuit open): answer with the canned, pre-rendered fallback
+    turn.set(source="fallback")
+    ai_response_text, audio_bytes = speak_static_phrase(session, scenario_registry.fallback_reply)
+    current_conversation_history.append({"role": "user", "content": user_input_text})
+    current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+    return ai_response_text, current_conversation_history, audio_bytes
+
+# --- Sentence splitting for the streaming turn ---
+SENTENCE_END_PATTERN = re.compile(r'[.!?।]+["\')\]]*\s+')
+MIN_SENTENCE_CHARS = 12 # Shorter fragments ("Hi!") are merged with the next sentence
+
+def split_complete_sentences(text_buffer):
+    """Splits streamed text into complete sentences. Returns (sentences, unfinished_remainder)."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text_buffer):
+        if match.end() - start < MIN_SENTENCE_CHARS:
+            continue
+        sentences.append(text_buffer[start:match.end()].strip())
+        start = match.end()
+    return sentences, text_buffer[start:]
+
+def _has_speakable_text(text):
+    return any(ch.isalnum() for ch in text)
+
+class BilingualSentenceSplitter:
+    """Turns streamed GPT deltas into complete sentences, tagging each with its segment: English until
+    BILINGUAL_SEPARATOR shows up, the native-language translation after it."""
+
+    def __init__(self):
+        self.text_buffer = ""
+        self.segment = ENGLISH_SEGMENT
+
+    def feed(self, delta):
+        """Adds a delta; returns the [(sentence_text, segment), ...] it completed."""
+        self.text_buffer += delta
+        ready = []
+        if self.segment == ENGLISH_SEGMENT and BILINGUAL_SEPARATOR in self.text_buffer:
+            english_text, _, self.text_buffer = self.text_buffer.partition(BILINGUAL_SEPARATOR)
+            ready += [(sentence_text, ENGLISH_SEGMENT) for sentence_text in self._flush_text(english_text)]
+            self.segment = NATIVE_SEGMENT
+        sentences, self.text_buffer = split_complete_sentences(self.text_buffer)
+        ready += [(sentence_text, self.segment) for sentence_text in sentences]
+        return ready
+
+    def flush(self):
+        """Returns whatever unfinished text is left once the stream has ended."""
+        ready = [(sentence_text, self.segment) for sentence_text in self._flush_text(self.text_buffer)]
+        self.text_buffer = ""
+        return ready
+
+    @staticmethod
+    def _flush_text(text):
+        sentences, remainder = split_complete_sentences(text)
+        if remainder.strip():
+            sentences.append(remainder.strip())
+        return sentences
+
+# Shared pool for per-sentence TTS requests (I/O bound, so threads are fine). Sized so every running turn
+# (SPEAKGENIE_TURN_WORKERS, see turn_jobs) can render its English and translated sentences at the same time
+TTS_WORKERS = int(os.getenv("SPEAKGENIE_TTS_WORKERS", str(2 * int(os.getenv("SPEAKGENIE_TURN_WORKERS", "16")))))
+_tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="speakgenie-tts")
+
+def _submit_tts(fn, *args, **kwargs):
+    """Runs fn on the TTS pool in a copy of the caller's context, so the turn's trace id and scheduler scope come along."""
+    return _tts_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+# --- Streaming conversation turn (generator next to handle_conversation_turn) ---
+def stream_conversation_turn(session, user_input_text, current_conversation_history=None):
+    """Streams one turn: GPT tokens are split into sentences, each sentence is sent to TTS concurrently,
+    and (sentence_text, audio_bytes) pairs are yielded in order as soon as each clip is ready.
+    audio_bytes is None for a fragment with nothing to speak (e.g. only emojis) or whose TTS failed.
+    The history (session.history unless given) is updated once the reply is complete."""
+    if current_conversation_history is None:
+        current_conversation_history = session.history
+    client_obj = session.client
+    voice = session.voice
+    turn_start = time.perf_counter()
+
+    ai_response_text = get_interceptor_reply(session, user_input_text, current_conversation_history)
+    if ai_response_text:
+        native_text = translate_static_phrase(client_obj, ai_response_text, session.language)
+        current_conversation_history.append({"role": "user", "content": user_input_text})
+        current_conversation_history.append({"role": "assistant", "content": format_bilingual(ai_response_text, native_text)})
+        native_future = None
+        if native_text:
+            native_future = _submit_tts(synthesize_speech_bytes, client_obj, native_text, voice=voice)
+        for text, future, segment in ((ai_response_text, None, ENGLISH_SEGMENT), (native_text, native_future, NATIVE_SEGMENT)):
+            if not text:
+                continue
+            try:
+                audio_bytes = future.result() if future else synthesize_speech_bytes(client_obj, text, voice=voice)
+            except Exception as e:
+                event("tts.error", level=logging.WARNING, source="interceptor", error=str(e))
+                audio_bytes = None
+            yield SpokenSentence(text, audio_bytes, segment)
+        return
+
+    cached_response = get_cached_response(session, user_input_text, current_conversation_history)
+    if cached_response:
+        current_conversation_history.append({"role": "user", "content": user_input_text})
+        current_conversation_history.append({"role": "assistant", "content": cached_response[0]})
+        yield SpokenSentence(*cached_response)
+        return
+
+    try:
+        history_for_llm = current_conversation_history
+        if session.history_manager is not None:
+            history_for_llm = session.history_manager.prepare(client_obj, current_conversation_history)
+        messages = build_gpt_messages(session, user_input_text, history_for_llm)
+        chunk_stream = client_obj.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            stream=True
+        )
+    except Exception as e:
+        event("llm.error", level=logging.WARNING, error=str(e))
+        yield from _stream_fallback_reply(session, user_input_text, current_conversation_history)
+        return
+    first_audio_recorded = False
+
+    pending = deque() # (sentence_text, tts_future, segment) in speaking order
+    response_parts = []
+    audio_clips = [] # Rendered clips, kept so a complete reply can go into the response cache
+    splitter = BilingualSentenceSplitter()
+
+    def submit(sentence_text, segment):
+        future = None
+        if _has_speakable_text(sentence_text):
+            future = _submit_tts(synthesize_speech_bytes, client_obj, sentence_text, voice=voice, store=False)
+        pending.append((sentence_text, future, segment))
+
+    def pop_ready():
+        nonlocal first_audio_recorded
+        sentence_text, future, segment = pending.popleft()
+        if future is None:
+            return SpokenSentence(sentence_text, None, segment)
+        try:
+            audio_bytes = future.result()
+        except Exception as e:
+            event("tts.error", level=logging.WARNING, source="stream", sentence=sentence_text, error=str(e))
+            audio_clips.append(None)
+            return SpokenSentence(sentence_text, None, segment)
+        audio_clips.append(audio_bytes)
+        if not first_audio_recorded: # What the learner waits for before hearing anything
+            first_audio_recorded = True
+            record_duration("turn.first_audio", time.perf_counter() - turn_start)
+        return SpokenSentence(sentence_text, audio_bytes, segment)
+
+    try:
+        try:
+            with span("llm.stream", mode=session.mode, messages=len(messages)) as stage:
+                for chunk in chunk_stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if not response_parts:
+                        stage.set(first_token_ms=round(stage.elapsed() * 1000, 2))
+                    response_parts.append(delta)
+                    for sentence_text, segment in splitter.feed(delta):
+                        submit(sentence_text, segment)
+                    # Hand over any clip that is already rendered while GPT keeps streaming
+                    while pending and (pending[0][1] is None or pending[0][1].done()):
+                        yield pop_ready()
+                stage.set(chunks=len(response_parts), response_chars=sum(len(part) for part in response_parts))
+        except Exception as e:
+            event("llm.error", level=logging.WARNING, source="stream", error=str(e))
+        for sentence_text, segment in splitter.flush():
+            submit(sentence_text, segment)
+        while pending:
+            yield pop_ready()
+    finally:
+        # Generator closed early (e.g. the child interrupted): drop TTS work nobody will hear
+        for _, future, _ in pending:
+            if future is not None:
+                future.cancel()
+
+    ai_response_text = format_bilingual(*split_bilingual("".join(response_parts)))
+    record_duration("turn.stream", time.perf_counter() - turn_start, mode=session.mode, sentences=len(audio_clips))
+    if ai_response_text:
+        current_conversation_history.append({"role": "user", "content": user_input_text})
+        current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+        if audio_clips and None not in audio_clips:
+            cache_response(session, user_input_text, ai_response_text, b"".join(audio_clips)) # MP3 frames concatenate cleanly
     else:
-        return None, current_conversation_history, None
+        yield from _stream_fallback_reply(session, user_input_text, current_conversation_history)
+
+def _stream_fallback_reply(session, user_input_text, current_conversation_history):
+    """Canned fallback for a stream that failed before GPT said anything; never goes into the response cache."""
+    ai_response_text, audio_bytes = speak_static_phrase(session, scenario_registry.fallback_reply)
+    current_conversation_history.append({"role": "user", "content": user_input_text})
+    current_conversation_history.append({"role": "assistant", "content": ai_response_text})
+    yield SpokenSentence(ai_response_text, audio_bytes)
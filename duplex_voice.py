@@ -0,0 +1,591 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.web
+import tornado.websocket
+from pydub import AudioSegment
+
+import audio_preprocessing as ap
+import core_tutor as ct
+import scheduler
+import turn_jobs
+from history_manager import HistoryManager
+from instrumentation import event, metrics, record_duration
+from intent_matcher import intent_matcher
+from scenario_registry import FREE_CHAT, registry as scenario_registry
+
+# --- Duplex Voice Configuration ---
+SAMPLE_RATE = 16000 # Clients stream 16 kHz mono 16-bit little-endian PCM (what Whisper works at anyway)
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * 2 * FRAME_MS // 1000
+CALIBRATION_MS = 300 # Opening audio used to measure the room's noise floor (never counted as speech)
+NOISE_MARGIN_DB = 12.0 # A frame is voiced when this far above the noise floor (and above ap.VAD_MIN_THRESHOLD_DBFS)
+NOISE_RISE_PER_FRAME = 0.002 # How fast the floor follows rising background noise (it drops to quieter frames at once)
+SPEECH_START_MS = 120 # Voiced audio needed to start an utterance (and to barge in), so clicks and pops are ignored
+SPEECH_END_MS = 700 # Trailing silence that ends an utterance
+PRE_ROLL_MS = 240 # Audio kept from before the start so the first syllable is not clipped
+MIN_UTTERANCE_MS = 300 # Shorter utterances (coughs, bumps) are dropped without a Whisper call
+MAX_UTTERANCE_MS = 15000 # Longer monologues are cut and sent anyway
+DUPLEX_HOST = os.getenv("SPEAKGENIE_DUPLEX_HOST", "127.0.0.1")
+DUPLEX_PORT = int(os.getenv("SPEAKGENIE_DUPLEX_PORT", "8765"))
+# Pages allowed to open the WebSocket besides the server's own: the Streamlit app's origin(s), comma-separated.
+# Any other site could otherwise drive a visitor's microphone session (cross-site WebSocket hijacking)
+DUPLEX_ALLOWED_ORIGINS = {origin.strip().rstrip("/").lower() for origin in
+                          os.getenv("SPEAKGENIE_DUPLEX_ORIGINS", "http://localhost:8501,http://127.0.0.1:8501").split(",") if origin.strip()}
+
+# VAD events
+SPEECH_START = "speech_start"
+SPEECH_END = "speech_end"
+
+# Transcription and replies for every duplex connection of this process
+_reply_executor = ThreadPoolExecutor(max_workers=turn_jobs.TURN_WORKERS, thread_name_prefix="speakgenie-duplex")
+
+
+# --- Streaming voice activity detection ---
+def frame_dbfs(frame):
+    """Loudness of one PCM frame in dBFS (-100 for digital silence)."""
+    samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+    rms = math.sqrt(float(np.mean(samples * samples))) if samples.size else 0.0
+    return 20 * math.log10(rms / 32768) if rms > 0 else -100.0
+
+class StreamingVAD:
+    """Energy VAD for a live PCM stream, one FRAME_MS frame at a time. Unlike audio_preprocessing.trim_silence
+    it cannot look at the whole clip, so it compares each frame to a running noise floor instead."""
+
+    def __init__(self):
+        self._buffer = bytearray() # Incomplete frame carried over to the next chunk
+        self._calibration = []
+        self._pre_roll = deque(maxlen=PRE_ROLL_MS // FRAME_MS)
+        self._utterance = None # bytearray while speech is in progress
+        self._voiced_run = 0
+        self._silent_run = 0
+        self.noise_floor = ap.VAD_MIN_THRESHOLD_DBFS - NOISE_MARGIN_DB
+
+    @property
+    def in_speech(self):
+        return self._utterance is not None
+
+    def feed(self, pcm_bytes):
+        """Consumes a chunk of any size and returns the events it completed: (SPEECH_START, None) and
+        (SPEECH_END, utterance_pcm_bytes)."""
+        self._buffer += pcm_bytes
+        events = []
+        while len(self._buffer) >= FRAME_BYTES:
+            frame = bytes(self._buffer[:FRAME_BYTES])
+            del self._buffer[:FRAME_BYTES]
+            events.extend(self._process(frame))
+        return events
+
+    def flush(self):
+        """Ends an utterance still in progress (the stream closed mid-sentence)."""
+        return [self._end()] if self.in_speech else []
+
+    def _process(self, frame):
+        level = frame_dbfs(frame)
+        if len(self._calibration) < CALIBRATION_MS // FRAME_MS:
+            self._calibration.append(level)
+            self.noise_floor = sum(self._calibration) / len(self._calibration)
+            self._pre_roll.append(frame)
+            return []
+        voiced = level >= max(ap.VAD_MIN_THRESHOLD_DBFS, self.noise_floor + NOISE_MARGIN_DB)
+        if level < self.noise_floor:
+            self.noise_floor = level
+        else:
+            self.noise_floor += NOISE_RISE_PER_FRAME * (level - self.noise_floor)
+
+        if not self.in_speech:
+            self._pre_roll.append(frame)
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run * FRAME_MS < SPEECH_START_MS:
+                return []
+            self._utterance = bytearray(b"".join(self._pre_roll))
+            self._pre_roll.clear()
+            self._voiced_run = 0
+            self._silent_run = 0
+            return [(SPEECH_START, None)]
+
+        self._utterance += frame
+        self._silent_run = 0 if voiced else self._silent_run + 1
+        if self._silent_run * FRAME_MS >= SPEECH_END_MS or len(self._utterance) >= MAX_UTTERANCE_MS * FRAME_BYTES // FRAME_MS:
+            return [self._end()]
+        return []
+
+    def _end(self):
+        utterance = bytes(self._utterance)
+        self._utterance = None
+        self._silent_run = 0
+        return SPEECH_END, utterance
+
+
+def pcm_duration_ms(pcm_bytes):
+    return len(pcm_bytes) * 1000 // (SAMPLE_RATE * 2)
+
+def utterance_for_whisper(pcm_bytes):
+    """Encodes one utterance for transcribe_audio (Opus via FFmpeg, or plain WAV when FFmpeg is missing)."""
+    segment = AudioSegment(data=pcm_bytes, sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+    try:
+        return ap.preprocess_for_whisper(segment)
+    except Exception as e:
+        event("duplex.encode_fallback", level=logging.WARNING, error=str(e))
+        return "speech.wav", ap.wav_bytes(segment)
+
+
+# --- One hands-free conversation ---
+class ReplyTurn:
+    """The AI's answer to one utterance, from transcription until the client has played the last clip."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.cancelled = False
+        self.audio_started = False # Set once a clip has gone to the client; only then can the child interrupt it
+        self.unanswered_transcript = None # What the child said, when this reply was superseded before any audio
+        self.finished = threading.Event()
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class DuplexSession:
+    """Mic PCM in; transcripts, reply text and MP3 clips out, with no record/stop clicks.
+    The VAD ends each utterance and sends it to Whisper right away. When the child starts speaking while
+    the AI is talking, the reply is interrupted (barge-in): the client is told to drop its queued audio and
+    the reply's TTS clips that have not been rendered yet are cancelled. Speech before the reply has any audio
+    is a pause mid-sentence, not an interruption: the unanswered transcript is carried into the next utterance.
+    send(message) receives dicts (JSON events) and bytes (one MP3 clip, announced by an "audio" event);
+    it is called from worker threads, so the transport must make it thread-safe."""
+
+    def __init__(self, tutor_session, send, history=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.session = tutor_session
+        self.send = send
+        self.history = history if history is not None else []
+        self.vad = StreamingVAD()
+        self._reply = None # ReplyTurn being generated or played
+        self._client_playing = False
+        self._lock = threading.Lock()
+
+    def feed_audio(self, pcm_bytes):
+        """Feeds mic audio; called for every chunk the client sends."""
+        for kind, utterance in self.vad.feed(pcm_bytes):
+            if kind == SPEECH_START:
+                self._on_speech_start()
+            else:
+                self._on_utterance(utterance)
+
+    def end_of_stream(self):
+        for _, utterance in self.vad.flush():
+            self._on_utterance(utterance)
+
+    def playback_finished(self, reply_id):
+        """The client has played every clip of reply_id."""
+        with self._lock:
+            if self._reply is not None and self._reply.id == reply_id:
+                self._client_playing = False
+
+    def greet(self):
+        """Speaks the scenario greeting (roleplays start with the character talking)."""
+        reply, _ = self._start_reply()
+        self._submit(self._run_greeting, reply)
+
+    def barge_in(self):
+        """Interrupts the current reply: generation stops and the client drops the audio it has queued."""
+        with self._lock:
+            reply = self._reply # Kept, so the next reply waits for it to wind down before touching the history
+            self._client_playing = False
+        if reply is not None:
+            reply.cancel()
+        metrics.increment("duplex.barge_ins")
+        event("duplex.barge_in", session=self.id, reply=reply.id if reply else None)
+        self.send({"type": "barge_in", "reply": reply.id if reply else None})
+
+    def close(self):
+        with self._lock:
+            reply = self._reply
+        if reply is not None:
+            reply.cancel()
+
+    def _ai_speaking(self):
+        """True while the current reply's audio is being sent or played."""
+        with self._lock:
+            reply = self._reply
+            return (reply is not None and not reply.cancelled and reply.audio_started
+                    and (not reply.finished.is_set() or self._client_playing))
+
+    def _on_speech_start(self):
+        if self._ai_speaking():
+            self.barge_in()
+        self.send({"type": "speech_start"})
+
+    def _on_utterance(self, pcm_bytes):
+        duration_ms = pcm_duration_ms(pcm_bytes)
+        if duration_ms < MIN_UTTERANCE_MS:
+            event("duplex.short_utterance", session=self.id, duration_ms=duration_ms)
+            return
+        metrics.increment("duplex.utterances")
+        if self._ai_speaking(): # The reply's audio started while the child was still talking
+            self.barge_in()
+        reply, previous = self._start_reply()
+        self.send({"type": "utterance_end", "reply": reply.id, "duration_ms": duration_ms})
+        self._submit(self._run_reply, reply, previous, pcm_bytes, time.perf_counter())
+
+    def _submit(self, fn, *args):
+        """Runs fn on the reply pool, with its API calls charged to this session's tenant (see scheduler.py)."""
+        return _reply_executor.submit(self._run_scoped, fn, *args)
+
+    def _run_scoped(self, fn, *args):
+        with scheduler.scope(self.session.tenant):
+            return fn(*args)
+
+    def _start_reply(self):
+        reply = ReplyTurn()
+        with self._lock:
+            previous, self._reply = self._reply, reply
+            self._client_playing = False
+        if previous is not None:
+            previous.cancel() # Superseded by the new utterance
+        return reply, previous
+
+    def _send_for(self, reply, message):
+        """Sends a message of reply, unless the reply was interrupted meanwhile."""
+        if not reply.cancelled:
+            self.send(message)
+            return True
+        return False
+
+    def _send_clip(self, reply, text, audio_bytes, segment):
+        self._send_for(reply, {"type": "reply", "reply": reply.id, "text": text, "segment": segment})
+        if audio_bytes and self._send_for(reply, {"type": "audio", "reply": reply.id, "format": "mp3", "bytes": len(audio_bytes)}):
+            with self._lock:
+                self._client_playing = True
+                reply.audio_started = True
+            self.send(audio_bytes)
+            return True
+        return False
+
+    def _run_greeting(self, reply):
+        try:
+            greeting_text, greeting_audio = ct.speak_static_phrase(self.session, self.session.scenario.greeting)
+            self.history.append({"role": "assistant", "content": greeting_text})
+            self._send_clip(reply, greeting_text, greeting_audio, ct.ENGLISH_SEGMENT)
+        except Exception as e:
+            event("duplex.error", level=logging.ERROR, session=self.id, error=str(e))
+        finally:
+            reply.finished.set()
+            self._send_for(reply, {"type": "reply_end", "reply": reply.id})
+
+    def _run_reply(self, reply, previous, pcm_bytes, utterance_end):
+        try:
+            transcript = ct.transcribe_audio(self.session.client, utterance_for_whisper(pcm_bytes))
+            if previous is not None:
+                previous.finished.wait() # One reply touches the history at a time (an interrupted one stops quickly)
+                if previous.unanswered_transcript:
+                    # The child paused mid-sentence: answer both halves together
+                    transcript = f"{previous.unanswered_transcript} {transcript or ''}".strip()
+            if reply.cancelled: # Superseded while transcribing: the next utterance continues this one
+                reply.unanswered_transcript = transcript
+                return
+            if not self._send_for(reply, {"type": "transcript", "reply": reply.id, "text": transcript}) or not transcript:
+                return
+
+            if intent_matcher.is_exit(self.session.scenario.key, transcript):
+                farewell_text, farewell_audio = ct.speak_static_phrase(self.session, self.session.scenario.farewell)
+                self.history.clear()
+                self.session.reset_history()
+                self._send_clip(reply, farewell_text, farewell_audio, ct.ENGLISH_SEGMENT)
+                self._send_for(reply, {"type": "exit", "reply": reply.id})
+                return
+
+            history_length = len(self.history)
+            spoken = []
+            first_audio = True
+            stream = ct.stream_conversation_turn(self.session, transcript, self.history)
+            try:
+                for spoken_sentence in stream:
+                    if reply.cancelled:
+                        break
+                    sentence_text, audio_bytes = spoken_sentence
+                    segment = getattr(spoken_sentence, "segment", ct.ENGLISH_SEGMENT)
+                    if self._send_clip(reply, sentence_text, audio_bytes, segment) and first_audio:
+                        first_audio = False # What the child waits for after they stop talking
+                        record_duration("duplex.first_audio", time.perf_counter() - utterance_end, session=self.id)
+                    spoken.append(sentence_text)
+            finally:
+                stream.close() # On barge-in: cancels the TTS clips that are still queued
+            if reply.cancelled and not reply.audio_started:
+                # Superseded before the child heard anything: the next reply answers this transcript too
+                del self.history[history_length:] # Cached and scripted replies are recorded before they are spoken
+                reply.unanswered_transcript = transcript
+            elif reply.cancelled and len(self.history) == history_length:
+                # Keep the interrupted exchange in context, cut where the child stopped listening
+                self.history.append({"role": "user", "content": transcript})
+                self.history.append({"role": "assistant", "content": " ".join(spoken) + " …" if spoken else "…"})
+        except Exception as e:
+            event("duplex.error", level=logging.ERROR, session=self.id, error=str(e))
+            self._send_for(reply, {"type": "error", "reply": reply.id, "message": f"Something went wrong during this turn: {e}"})
+        finally:
+            reply.finished.set()
+            self._send_for(reply, {"type": "reply_end", "reply": reply.id})
+
+
+# --- WebSocket transport (Tornado, already installed with Streamlit) ---
+class DuplexSocketHandler(tornado.websocket.WebSocketHandler):
+    """ws://host:port/duplex?language=Hindi&scenario=2[&classroom=7b] - binary messages are mic PCM, text messages are JSON
+    control events ({"type": "playback_end", "reply": id}, {"type": "stop"} or {"type": "end"})."""
+
+    def initialize(self, client_obj):
+        self.client_obj = client_obj
+        self.duplex = None
+
+    def check_origin(self, origin):
+        """Same-origin pages (the client served at "/") and the configured app origins only. Clients that send
+        no Origin header, like `feed`, are not browsers and are not checked."""
+        if super().check_origin(origin) or origin.rstrip("/").lower() in DUPLEX_ALLOWED_ORIGINS:
+            return True
+        metrics.increment("duplex.rejected_origins")
+        event("duplex.origin_rejected", level=logging.WARNING, origin=origin)
+        return False
+
+    def open(self):
+        self.loop = tornado.ioloop.IOLoop.current()
+        scenario_key = self.get_argument("scenario", FREE_CHAT)
+        if scenario_key not in scenario_registry.scenarios:
+            scenario_key = FREE_CHAT
+        tutor_session = ct.TutorSession(self.client_obj, language=self.get_argument("language", "English"),
+                                        scenario_key=scenario_key, history_manager=HistoryManager())
+        self.duplex = DuplexSession(tutor_session, self.send_threadsafe)
+        tutor_session.tenant = self.get_argument("classroom", None) or self.duplex.id # Fair-share unit for the API quota
+        event("duplex.open", session=self.duplex.id, scenario=scenario_key, language=tutor_session.language)
+        self.send_threadsafe({"type": "ready", "session": self.duplex.id, "sample_rate": SAMPLE_RATE, "frame_ms": FRAME_MS})
+        if tutor_session.scenario in scenario_registry.roleplay_scenarios():
+            self.duplex.greet()
+
+    def send_threadsafe(self, message):
+        self.loop.add_callback(self._write, message)
+
+    def _write(self, message):
+        try:
+            if isinstance(message, bytes):
+                self.write_message(message, binary=True)
+            else:
+                self.write_message(json.dumps(message, ensure_ascii=False))
+        except tornado.websocket.WebSocketClosedError:
+            pass
+
+    def on_message(self, message):
+        if isinstance(message, bytes):
+            self.duplex.feed_audio(message)
+            return
+        try:
+            control = json.loads(message)
+        except ValueError:
+            return
+        if control.get("type") == "playback_end":
+            self.duplex.playback_finished(control.get("reply"))
+        elif control.get("type") == "stop":
+            self.duplex.barge_in()
+        elif control.get("type") == "end":
+            self.duplex.end_of_stream()
+
+    def on_close(self):
+        if self.duplex is not None:
+            self.duplex.close()
+            event("duplex.close", session=self.duplex.id)
+
+
+class DuplexPageHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/html; charset=utf-8")
+        self.write(DUPLEX_PAGE)
+
+
+def make_app(client_obj):
+    return tornado.web.Application([
+        (r"/", DuplexPageHandler),
+        (r"/duplex", DuplexSocketHandler, {"client_obj": client_obj}),
+    ])
+
+def make_client(base_url=None):
+    from openai import OpenAI
+
+    ct.load_dotenv()
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY") or "missing-key", base_url=base_url, max_retries=0)
+
+
+# Minimal hands-free client: mic -> 16 kHz PCM frames -> WebSocket; MP3 clips are queued and stopped on barge-in
+DUPLEX_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SpeakGenie hands-free</title>
+<style>body{font-family:sans-serif;max-width:40em;margin:2em auto}#log p{margin:.3em 0}</style></head>
+<body><h1>SpeakGenie 🗣️ hands-free</h1><button id="start">Start talking</button> <span id="state"></span><div id="log"></div>
+<script>
+const log = (who, text) => { const p = document.createElement("p"); p.innerHTML = `<b>${who}:</b> `; p.append(text); document.getElementById("log").append(p); };
+const state = text => document.getElementById("state").textContent = text;
+document.getElementById("start").onclick = async () => {
+  const ctx = new AudioContext({sampleRate: 16000});
+  const ws = new WebSocket(`${location.protocol === "https:" ? "wss" : "ws"}://${location.host}/duplex${location.search}`);
+  ws.binaryType = "arraybuffer";
+  let currentReply = null, clipReply = null, sources = [], playUntil = 0, replyDone = false;
+  const stopPlayback = () => { sources.forEach(s => s.stop()); sources = []; playUntil = 0; };
+  const maybeFinished = () => { if (replyDone && !sources.length && currentReply) ws.send(JSON.stringify({type: "playback_end", reply: currentReply})); };
+  ws.onmessage = async message => {
+    if (message.data instanceof ArrayBuffer) {
+      if (clipReply !== currentReply) return; // Audio of an interrupted reply
+      const buffer = await ctx.decodeAudioData(message.data);
+      const source = ctx.createBufferSource();
+      source.buffer = buffer; source.connect(ctx.destination);
+      playUntil = Math.max(playUntil, ctx.currentTime); source.start(playUntil); playUntil += buffer.duration;
+      sources.push(source);
+      source.onended = () => { sources = sources.filter(s => s !== source); maybeFinished(); };
+      return;
+    }
+    const msg = JSON.parse(message.data);
+    if (msg.type === "ready") state("Listening...");
+    else if (msg.type === "speech_start") state("Hearing you...");
+    else if (msg.type === "barge_in") { stopPlayback(); currentReply = null; }
+    else if (msg.type === "utterance_end") { currentReply = msg.reply; replyDone = false; state("Thinking..."); }
+    else if (msg.type === "transcript" && msg.text) log("You", msg.text);
+    else if (msg.type === "reply") { if (!currentReply) currentReply = msg.reply; if (msg.reply === currentReply) log("SpeakGenie", msg.text); }
+    else if (msg.type === "audio") clipReply = msg.reply;
+    else if (msg.type === "reply_end" && msg.reply === currentReply) { replyDone = true; state("Listening..."); maybeFinished(); }
+    else if (msg.type === "error") log("Error", msg.message);
+  };
+  // Echo cancellation keeps SpeakGenie's own voice from triggering a barge-in
+  const mic = await navigator.mediaDevices.getUserMedia({audio: {channelCount: 1, echoCancellation: true, noiseSuppression: true}});
+  const source = ctx.createMediaStreamSource(mic);
+  const processor = ctx.createScriptProcessor(1024, 1, 1);
+  processor.onaudioprocess = e => {
+    if (ws.readyState !== WebSocket.OPEN) return;
+    const input = e.inputBuffer.getChannelData(0), pcm = new Int16Array(input.length);
+    for (let i = 0; i < input.length; i++) pcm[i] = Math.max(-1, Math.min(1, input[i])) * 0x7fff;
+    ws.send(pcm.buffer);
+  };
+  source.connect(processor); processor.connect(ctx.destination);
+  document.getElementById("start").disabled = true;
+};
+</script></body></html>
+"""
+
+
+# --- Feeding recorded audio through the stream (local testing without a microphone) ---
+def load_pcm(path):
+    """Reads a recording as 16 kHz mono 16-bit PCM. .pcm/.raw files must already be in that format."""
+    if path.endswith((".pcm", ".raw")):
+        with open(path, "rb") as pcm_file:
+            return pcm_file.read()
+    segment = AudioSegment.from_file(path)
+    return segment.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(2).raw_data
+
+async def feed_recordings(url, recordings, gap_seconds=1.0, speed=1.0, idle_seconds=10.0, on_message=print):
+    """Streams the recordings to a duplex server in FRAME_MS frames at `speed` x real time, with gap_seconds of
+    silence between them (each gap must exceed SPEECH_END_MS; one shorter than the reply makes the next recording barge in).
+    on_message gets every server event dict (clips as {"type": "clip", "bytes": n}). Returns all events."""
+    connection = await tornado.websocket.websocket_connect(url)
+    received = []
+    silence = bytes(FRAME_BYTES)
+
+    async def receive():
+        while True:
+            message = await connection.read_message()
+            if message is None:
+                return
+            message = {"type": "clip", "bytes": len(message)} if isinstance(message, bytes) else json.loads(message)
+            received.append(message)
+            on_message(message)
+
+    receiver = asyncio.ensure_future(receive())
+    stream = bytes(CALIBRATION_MS * FRAME_BYTES // FRAME_MS) # Room tone first, so the VAD can calibrate
+    for index, pcm_bytes in enumerate(recordings):
+        stream += pcm_bytes
+        stream += silence * max(1, int((gap_seconds if index < len(recordings) - 1 else 1.0) * 1000 / FRAME_MS))
+    for start in range(0, len(stream), FRAME_BYTES):
+        connection.write_message(stream[start:start + FRAME_BYTES], binary=True)
+        await asyncio.sleep(FRAME_MS / 1000 / speed)
+    connection.write_message(json.dumps({"type": "end"}))
+
+    # Wait until the last reply is done (or nothing has arrived for idle_seconds)
+    while True:
+        count = len(received)
+        await asyncio.sleep(0.2)
+        replies = [message["reply"] for message in received if message["type"] == "utterance_end"]
+        ended = {message["reply"] for message in received if message["type"] == "reply_end"}
+        if replies and replies[-1] in ended:
+            break
+        if len(received) == count:
+            idle_seconds -= 0.2
+            if idle_seconds <= 0:
+                break
+    connection.close()
+    receiver.cancel()
+    return received
+
+async def _feed_in_process(args, recordings):
+    """Starts a duplex server on a free local port, feeds the recordings through it and returns the events."""
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+    server = tornado.httpserver.HTTPServer(make_app(make_client(args.base_url)))
+    server.add_sockets(sockets)
+    port = sockets[0].getsockname()[1]
+    try:
+        return await feed_recordings(f"ws://127.0.0.1:{port}/duplex?language={args.language}&scenario={args.scenario}",
+                                     recordings, args.gap, args.speed, on_message=_print_event)
+    finally:
+        server.stop()
+
+def _print_event(message):
+    if message["type"] == "clip":
+        print(f"  [clip] {message['bytes']} bytes")
+    elif message["type"] != "audio":
+        print(f"  {json.dumps(message, ensure_ascii=False)}")
+
+
+# --- Command-line entry point ---
+def main():
+    """`python duplex_voice.py serve` runs the hands-free server; `feed` streams recordings through it."""
+    parser = argparse.ArgumentParser(description="SpeakGenie hands-free (duplex) voice mode.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Run the WebSocket server and its browser page.")
+    serve.add_argument("--host", default=DUPLEX_HOST)
+    serve.add_argument("--port", type=int, default=DUPLEX_PORT)
+    serve.add_argument("--base-url", default=None, help="OpenAI-compatible server (e.g. benchmarks/fake_openai_server.py).")
+    feed = commands.add_parser("feed", help="Stream recordings (WAV/MP3, or raw 16 kHz mono s16le .pcm) through the duplex pipeline.")
+    feed.add_argument("recordings", nargs="+")
+    feed.add_argument("--url", default=None, help="Duplex server to use (default: start one in this process).")
+    feed.add_argument("--base-url", default=None, help="OpenAI-compatible server for the in-process duplex server.")
+    feed.add_argument("--language", default="English")
+    feed.add_argument("--scenario", default=FREE_CHAT)
+    feed.add_argument("--gap", type=float, default=1.5, help="Seconds of silence between recordings (short gaps barge in on the reply).")
+    feed.add_argument("--speed", type=float, default=1.0, help="Feeding speed relative to real time.")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        make_app(make_client(args.base_url)).listen(args.port, args.host)
+        print(f"Hands-free voice mode on http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+        tornado.ioloop.IOLoop.current().start()
+        return 0
+
+    recordings = [load_pcm(path) for path in args.recordings]
+    if args.url:
+        events = asyncio.run(feed_recordings(args.url, recordings, args.gap, args.speed, on_message=_print_event))
+    else:
+        events = asyncio.run(_feed_in_process(args, recordings))
+    print(f"{sum(1 for message in events if message['type'] == 'utterance_end')} utterance(s), "
+          f"{sum(1 for message in events if message['type'] == 'barge_in')} barge-in(s), "
+          f"{sum(1 for message in events if message['type'] == 'clip')} clip(s) received. "
+          f"Metrics: {metrics.summary()['stages'].get('duplex.first_audio', {})}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
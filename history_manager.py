@@ -0,0 +1,121 @@
+import logging
+import math
+from functools import lru_cache
+
+from instrumentation import event, record_usage, span
+
+# --- History Budget Configuration ---
+DEFAULT_TOKEN_BUDGET = 1200 # Tokens allowed for summary + verbatim history per GPT call
+DEFAULT_KEEP_LAST_TURNS = 6 # Most recent user/assistant turns always sent verbatim (if they fit)
+SUMMARY_MAX_TOKENS = 150
+MESSAGE_OVERHEAD_TOKENS = 4 # Role and separator tokens the chat format adds per message
+
+
+# --- Local token estimation (no tokenizer download, no network call) ---
+@lru_cache(maxsize=4096)
+def estimate_tokens(text):
+    """Cheap token estimate: ~4 ASCII characters per token, ~1 token per non-ASCII character
+    (Hindi, Tamil, emojis...). Errs on the high side, which is what a budget needs."""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+def estimate_message_tokens(messages):
+    """Estimates the prompt tokens used by a list of chat messages."""
+    return sum(MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") or "") for message in messages)
+
+
+# --- Token-budgeted history with a rolling summary ---
+class HistoryManager:
+    """Builds the history part of each GPT prompt under a token budget.
+    The last few turns are sent verbatim; older turns are folded, once each, into a cached running summary."""
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, keep_last_turns=DEFAULT_KEEP_LAST_TURNS, summary_model="gpt-3.5-turbo"):
+        self.token_budget = token_budget
+        self.keep_last_turns = keep_last_turns
+        self.summary_model = summary_model
+        self.reset()
+
+    def reset(self):
+        """Forgets the running summary (call whenever the conversation history is cleared)."""
+        self.summary = ""
+        self.summarized_count = 0 # How many leading history messages are already folded into the summary
+
+    def to_state(self):
+        return {"summary": self.summary, "summarized_count": self.summarized_count}
+
+    def restore_state(self, state):
+        """Restores a running summary saved with to_state() (e.g. by another worker)."""
+        self.summary = state.get("summary", "")
+        self.summarized_count = state.get("summarized_count", 0)
+
+    def _summary_message(self):
+        return {"role": "system", "content": f"Summary of the earlier conversation with the child: {self.summary}"}
+
+    def _plan(self, conversation_history):
+        """Splits history into (messages still to fold into the summary, messages to send verbatim)."""
+        if len(conversation_history) < self.summarized_count:
+            self.reset() # History was cleared or replaced since the last call
+
+        window_start = max(self.summarized_count, len(conversation_history) - 2 * self.keep_last_turns)
+        summary_tokens = SUMMARY_MAX_TOKENS if (self.summary or window_start > self.summarized_count) else 0
+        # Shrink the verbatim window until it fits the budget (always keep the latest exchange)
+        while window_start < len(conversation_history) - 2 and \
+              summary_tokens + estimate_message_tokens(conversation_history[window_start:]) > self.token_budget:
+            window_start += 1
+            summary_tokens = SUMMARY_MAX_TOKENS
+        return conversation_history[self.summarized_count:window_start], conversation_history[window_start:]
+
+    def _summary_request(self, messages_to_fold):
+        transcript = "\n".join(f"{message['role']}: {message.get('content') or ''}" for message in messages_to_fold)
+        return [
+            {"role": "system", "content": (
+                "You keep a short running summary of a conversation between SpeakGenie (an English tutor) and a young child. "
+                f"Update the summary with the new messages. Keep names, topics, items and open questions. Use at most {SUMMARY_MAX_TOKENS // 2} words."
+            )},
+            {"role": "user", "content": f"Current summary: {self.summary or '(none yet)'}\n\nNew messages:\n{transcript}"}
+        ]
+
+    def _llm_view(self, recent_messages):
+        if self.summary:
+            return [self._summary_message()] + recent_messages
+        return recent_messages
+
+    def prepare(self, client_obj, conversation_history):
+        """Returns the history to send to GPT: [running summary] + recent turns, within the token budget.
+        Only messages that newly fell out of the verbatim window are summarized (one small GPT call)."""
+        messages_to_fold, recent_messages = self._plan(conversation_history)
+        if messages_to_fold:
+            try:
+                with span("history.summarize", folded_messages=len(messages_to_fold)) as stage:
+                    completion = client_obj.chat.completions.create(
+                        model=self.summary_model,
+                        messages=self._summary_request(messages_to_fold),
+                        max_tokens=SUMMARY_MAX_TOKENS
+                    )
+                    self.summary = completion.choices[0].message.content.strip()
+                    self.summarized_count += len(messages_to_fold)
+                    record_usage(stage, completion)
+            except Exception as e:
+                # Keep the old summary; the unfolded messages are retried on the next turn
+                event("history.summary_error", level=logging.WARNING, error=str(e))
+        return self._llm_view(recent_messages)
+
+    async def aprepare(self, async_client_obj, conversation_history):
+        """Async version of prepare() for AsyncOpenAI clients."""
+        messages_to_fold, recent_messages = self._plan(conversation_history)
+        if messages_to_fold:
+            try:
+                with span("history.summarize", folded_messages=len(messages_to_fold)) as stage:
+                    completion = await async_client_obj.chat.completions.create(
+                        model=self.summary_model,
+                        messages=self._summary_request(messages_to_fold),
+                        max_tokens=SUMMARY_MAX_TOKENS
+                    )
+                    self.summary = completion.choices[0].message.content.strip()
+                    self.summarized_count += len(messages_to_fold)
+                    record_usage(stage, completion)
+            except Exception as e:
+                event("history.summary_error", level=logging.WARNING, error=str(e))
+        return self._llm_view(recent_messages)
@@ -0,0 +1,236 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# --- Instrumentation Configuration ---
+LOGGER_NAME = "speakgenie"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # Seconds (Prometheus "le" bounds)
+RESERVOIR_SIZE = 2048 # Most recent samples kept per stage for exact p50/p95/p99
+RECENT_EVENTS = 500 # Structured events kept in memory for local inspection
+METRICS_DIR = os.getenv("SPEAKGENIE_METRICS_DIR") # If set, metrics.prom / metrics.json are refreshed after each turn
+
+logger = logging.getLogger(LOGGER_NAME)
+logger.addHandler(logging.NullHandler())
+
+# Trace id of the conversation turn running in the current thread / asyncio task
+_current_trace_id = contextvars.ContextVar("speakgenie_trace_id", default=None)
+
+
+# --- Metric types ---
+class Histogram:
+    """Latency histogram with cumulative buckets (for Prometheus) plus a reservoir of recent samples (for percentiles)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self.samples.append(value)
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        """Returns {quantile: seconds} over the recent samples (nearest-rank)."""
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in quantiles}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in quantiles}
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.bucket_counts), self.count, self.total
+
+
+class MetricsRegistry:
+    """Per-process histograms (seconds per stage), counters (tokens, bytes, hits...) and gauges (queue depths)."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.recent_events = deque(maxlen=RECENT_EVENTS)
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def summary(self):
+        """Returns {stage: {count, mean, p50, p95, p99}} plus counters and gauges, as plain dicts (JSON-ready)."""
+        stages = {}
+        for name, histogram in sorted(self.histograms.items()):
+            _, count, total = histogram.snapshot()
+            quantiles = histogram.percentiles()
+            stages[name] = {
+                "count": count,
+                "mean": total / count if count else 0.0,
+                "p50": quantiles[0.5],
+                "p95": quantiles[0.95],
+                "p99": quantiles[0.99],
+            }
+        with self._lock:
+            counters = dict(sorted(self.counters.items()))
+            gauges = dict(sorted(self.gauges.items()))
+        return {"stages": stages, "counters": counters, "gauges": gauges}
+
+    def to_prometheus(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP speakgenie_stage_seconds Latency of each conversation pipeline stage.",
+            "# TYPE speakgenie_stage_seconds histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            bucket_counts, count, total = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'speakgenie_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'speakgenie_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'speakgenie_stage_seconds_sum{{stage="{name}"}} {total}')
+            lines.append(f'speakgenie_stage_seconds_count{{stage="{name}"}} {count}')
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        for name, value in counters:
+            metric = "speakgenie_" + name.replace(".", "_") + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in gauges:
+            metric = "speakgenie_" + name.replace(".", "_")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+# --- Structured events ---
+def event(name, level=logging.DEBUG, **fields):
+    """Records a structured event (kept in memory and logged as one JSON line). Cheap when logging is off."""
+    fields["event"] = name
+    fields["ts"] = round(time.time(), 3)
+    trace_id = _current_trace_id.get()
+    if trace_id:
+        fields["trace_id"] = trace_id
+    metrics.recent_events.append(fields)
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps(fields, ensure_ascii=False, default=str))
+
+
+# --- Timing spans ---
+class Span:
+    """One timed pipeline stage. Attach numbers with set(), e.g. span.set(prompt_tokens=120, audio_bytes=48000)."""
+    __slots__ = ("name", "attributes", "start", "duration")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+@contextmanager
+def span(name, **attributes):
+    """Times a block as pipeline stage `name`: records it in the stage histogram, adds numeric attributes
+    to counters (e.g. "llm.chat.prompt_tokens") and emits one structured event."""
+    current = Span(name, attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        metrics.histogram(name).observe(current.duration)
+        for key, value in current.attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics.increment(f"{name}.{key}", value)
+        event(name, duration_ms=round(current.duration * 1000, 2), **current.attributes)
+
+def record_usage(stage, completion):
+    """Attaches the token counts an OpenAI completion reported (if any) to a span."""
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        stage.set(prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                  completion_tokens=getattr(usage, "completion_tokens", 0) or 0)
+
+def record_duration(name, seconds, **attributes):
+    """Records an already-measured duration (e.g. time-to-first-audio) as stage `name`."""
+    metrics.histogram(name).observe(seconds)
+    event(name, duration_ms=round(seconds * 1000, 2), **attributes)
+
+@contextmanager
+def trace_turn(name, **attributes):
+    """Span for a whole conversation turn; nested spans and events carry the same trace_id."""
+    token = _current_trace_id.set(uuid.uuid4().hex[:12])
+    try:
+        with span(name, **attributes) as turn_span:
+            yield turn_span
+    finally:
+        _current_trace_id.reset(token)
+
+
+# --- Local export ---
+def export_metrics(directory=None):
+    """Writes metrics.prom (Prometheus textfile format) and metrics.json into directory. Returns the paths."""
+    directory = directory or METRICS_DIR or "."
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for filename, content in (("metrics.prom", metrics.to_prometheus()),
+                              ("metrics.json", json.dumps(metrics.summary(), indent=2))):
+        path = os.path.join(directory, filename)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path) # Scrapers never read a half-written file
+        paths.append(path)
+    return paths
+
+def maybe_export_metrics():
+    """Exports metrics if SPEAKGENIE_METRICS_DIR is set; never raises."""
+    if not METRICS_DIR:
+        return
+    try:
+        export_metrics(METRICS_DIR)
+    except OSError as e:
+        logger.warning("Could not export metrics to %s: %s", METRICS_DIR, e)
+
+def configure_logging(level=None):
+    """Sends SpeakGenie events to stderr as JSON lines. Level comes from SPEAKGENIE_LOG_LEVEL (default INFO)."""
+    level = level or os.getenv("SPEAKGENIE_LOG_LEVEL", "INFO")
+    if not any(not isinstance(handler, logging.NullHandler) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
@@ -0,0 +1,102 @@
+import re
+
+from scenario_registry import registry as scenario_registry
+
+# --- Intent kinds ---
+EXIT = "exit"
+REPLY = "reply"
+
+
+def phrase_pattern(phrase):
+    """Word-bounded regex for a phrase: "exit" matches "Exit!" but not "exciting"; "pet" matches "pets" but not "carpet"."""
+    words = [re.escape(word) for word in phrase.lower().split()]
+    return r"\b" + r"\s+".join(words) + r"(?:s|es)?\b"
+
+
+# --- Result of a local match ---
+class Intent:
+    """A locally matched intent: an exit request, or a canned in-character reply."""
+    __slots__ = ("kind", "scenario_key", "reply")
+
+    def __init__(self, kind, scenario_key, reply=None):
+        self.kind = kind
+        self.scenario_key = scenario_key
+        self.reply = reply
+
+    def __repr__(self):
+        return f"Intent({self.kind!r}, {self.scenario_key!r}, {self.reply!r})"
+
+
+# --- One compiled matcher per scenario ---
+class ScenarioMatcher:
+    """All exit phrases, interceptor triggers and keywords of one scenario compiled into a single regex
+    with named groups, so one finditer() pass over the input finds every hit."""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.replies = {} # group name -> canned reply
+        self.rule_order = [] # keyword group names in rule priority order
+        alternatives = [] # (phrase, group name)
+
+        for index, phrase in enumerate(scenario.exit_phrases):
+            alternatives.append((phrase, f"exit_{index}"))
+        interceptor = scenario.interceptor
+        if interceptor:
+            for index, trigger in enumerate(interceptor["triggers"]):
+                alternatives.append((trigger, f"trigger_{index}"))
+            for rule_index, rule in enumerate(interceptor["rules"]):
+                group = f"rule_{rule_index}"
+                self.replies[group] = rule["reply"]
+                self.rule_order.append(group)
+                for keyword_index, keyword in enumerate(rule["keywords"]):
+                    alternatives.append((keyword, f"{group}_{keyword_index}"))
+
+        # Longest phrases first so "exit roleplay" wins over "exit" at the same position
+        alternatives.sort(key=lambda item: -len(item[0]))
+        self.pattern = None
+        if alternatives:
+            self.pattern = re.compile("|".join(f"(?P<{group}>{phrase_pattern(phrase)})" for phrase, group in alternatives), re.IGNORECASE)
+
+    def match(self, text, history_length=0):
+        """Returns an Intent for text, or None when the turn should go to GPT."""
+        if self.pattern is None:
+            return None
+        hits = {match.lastgroup for match in self.pattern.finditer(text)}
+        if not hits:
+            return None
+        if any(group.startswith("exit_") for group in hits):
+            return Intent(EXIT, self.scenario.key, self.scenario.farewell)
+
+        interceptor = self.scenario.interceptor
+        if not interceptor or history_length >= interceptor["max_history"]:
+            return None
+        if not any(group.startswith("trigger_") for group in hits):
+            return None
+        matched_rules = {group.rsplit("_", 1)[0] for group in hits if group.startswith("rule_")}
+        for group in self.rule_order: # First rule in scenarios.json order wins, as before
+            if group in matched_rules:
+                return Intent(REPLY, self.scenario.key, self.replies[group])
+        return Intent(REPLY, self.scenario.key, interceptor["fallback"])
+
+
+# --- Matcher over all scenarios ---
+class IntentMatcher:
+    """Compiled local intent matcher for every scenario in the registry (built once at import)."""
+
+    def __init__(self, registry=scenario_registry):
+        self.matchers = {key: ScenarioMatcher(scenario) for key, scenario in registry.scenarios.items()}
+
+    def match(self, scenario_key, text, history_length=0):
+        """Matches text against one scenario's exit phrases and interceptor rules. Returns an Intent or None."""
+        matcher = self.matchers.get(scenario_key)
+        if matcher is None or not text:
+            return None
+        return matcher.match(text, history_length)
+
+    def is_exit(self, scenario_key, text):
+        """True if text asks to leave the current chat/scenario (word-bounded, so "exciting" is not an exit)."""
+        intent = self.match(scenario_key, text)
+        return intent is not None and intent.kind == EXIT
+
+
+intent_matcher = IntentMatcher()
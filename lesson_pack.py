@@ -0,0 +1,344 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import scheduler
+from instrumentation import event
+from response_cache import normalize_question
+
+# --- Lesson Pack Configuration ---
+LESSON_PACK_DIR = os.getenv("SPEAKGENIE_LESSON_PACK_DIR", "lesson_packs") # Every pack in here is loaded at app startup
+PACK_FORMAT = 2 # 2: scripted turns are keyed by the utterances before them
+INDEX_FILE = "index.json"
+AUDIO_FILE = "audio.bin" # All clips of the pack back to back; the index holds (offset, length) per entry
+DEFAULT_WORKERS = 4 # Scripts generated at once (each scenario and language is one sequential conversation)
+LESSON_PACK_TENANT = "lesson-pack" # Scheduler tenant the build's requests are charged to (at background priority)
+
+TURN = "turn" # A scripted child utterance, the utterances before it, and the pre-generated reply
+STATIC = "static" # A fixed phrase (greeting, farewell, interceptor reply) with its translation
+
+
+# --- Reading packs ---
+class LessonPack:
+    """One pre-generated lesson on disk: index.json plus audio.bin, which is memory-mapped so only the
+    clips that are actually played are paged in."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("format") != PACK_FORMAT:
+            raise ValueError(f"{path}: unsupported lesson pack format {self.index.get('format')!r}")
+        self.name = self.index["name"]
+        self.entries = self.index["entries"]
+        self._audio_file = open(os.path.join(path, AUDIO_FILE), "rb")
+        size = os.fstat(self._audio_file.fileno()).st_size
+        self._audio = mmap.mmap(self._audio_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def audio(self, entry):
+        if not entry["length"]:
+            return None
+        return bytes(self._audio[entry["offset"]:entry["offset"] + entry["length"]])
+
+    def close(self):
+        if isinstance(self._audio, mmap.mmap):
+            self._audio.close()
+        self._audio_file.close()
+
+
+def _turn_key(scenario_key, language, voice, earlier_utterances, utterance):
+    return scenario_key, language, voice, tuple(map(normalize_question, earlier_utterances)), normalize_question(utterance)
+
+def _conversation_so_far(conversation_history):
+    """(child utterances so far, last assistant message or None) of a conversation."""
+    utterances = [message["content"] for message in conversation_history if message["role"] == "user"]
+    replies = [message["content"] for message in conversation_history if message["role"] == "assistant"]
+    return utterances, replies[-1] if replies else None
+
+
+class LessonLibrary:
+    """All loaded lesson packs, indexed for per-turn lookups. A scripted turn matches when the child's utterances
+    so far and the new one are the script's, word for word after normalization (as in the response cache)."""
+
+    def __init__(self):
+        self.packs = []
+        self._turns = {} # (scenario, language, voice, normalized earlier utterances, normalized utterance) -> (pack, entry)
+        self._static = {} # (language, voice, phrase) -> (pack, entry)
+        self._lock = threading.Lock()
+
+    def add(self, pack):
+        """Indexes a LessonPack; entries of later packs win over earlier ones."""
+        with self._lock:
+            self.packs.append(pack)
+            for entry in pack.entries:
+                if entry["kind"] == STATIC:
+                    self._static[(entry["language"], entry["voice"], entry["phrase"])] = (pack, entry)
+                    continue
+                self._turns[_turn_key(entry["scenario"], entry["language"], entry["voice"], entry["earlier"], entry["utterance"])] = (pack, entry)
+
+    def lookup_turn(self, session, user_input_text, conversation_history=()):
+        """Returns the pre-generated (reply_text, audio_bytes) for a scripted utterance, or None. The reply was
+        generated after the script's earlier turns, so it is only served when the conversation so far followed
+        the script: same child utterances, and the previous reply is the pack's (unless that turn was answered locally)."""
+        if not self._turns:
+            return None
+        earlier_utterances, last_reply = _conversation_so_far(conversation_history)
+        found = self._turns.get(_turn_key(session.scenario.key, session.language, session.voice, earlier_utterances, user_input_text))
+        if found is None:
+            return None
+        pack, entry = found
+        if entry["after_reply"] is not None and entry["after_reply"] != last_reply:
+            return None # GPT answered an earlier turn differently, so this reply may not fit anymore
+        event("lesson_pack.hit", pack=pack.name, scenario=entry["scenario"], language=entry["language"])
+        return entry["reply"], pack.audio(entry)
+
+    def lookup_static(self, session, phrase):
+        """Returns the pre-generated (display_text, audio_bytes) for a fixed phrase, or None."""
+        found = self._static.get((session.language, session.voice, phrase)) if self._static else None
+        if found is None:
+            return None
+        pack, entry = found
+        return entry["reply"], pack.audio(entry)
+
+    def stats(self):
+        with self._lock:
+            return {"packs": len(self.packs), "turns": len(self._turns), "static_phrases": len(self._static)}
+
+
+# Process-wide library consulted by core_tutor before any API call
+default_library = LessonLibrary()
+
+def load_lesson_packs(directory=LESSON_PACK_DIR, library=None):
+    """Loads every pack found in directory (one sub-directory per pack) into library. Returns how many loaded;
+    broken packs are skipped with a warning."""
+    library = library or default_library
+    loaded = 0
+    if not os.path.isdir(directory):
+        return loaded
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(os.path.join(path, INDEX_FILE)):
+            continue
+        try:
+            library.add(LessonPack(path))
+            loaded += 1
+        except (OSError, ValueError, KeyError) as e:
+            event("lesson_pack.load_error", level=logging.WARNING, path=path, error=str(e))
+    event("lesson_pack.loaded", level=logging.INFO, directory=directory, **library.stats())
+    return loaded
+
+
+# --- Building packs ---
+def load_lesson_script(path):
+    """Reads a lesson script: {"name", "languages", "voice", "scenarios": {scenario_key: [utterance, ...]}}."""
+    from scenario_registry import registry as scenario_registry
+
+    with open(path, encoding="utf-8") as f:
+        script = json.load(f)
+    script.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    script.setdefault("languages", ["English"])
+    script.setdefault("voice", "alloy")
+    for scenario_key in script["scenarios"]:
+        scenario_registry.get(scenario_key) # KeyError for scenarios that are not in scenarios.json
+    return script
+
+
+def _generate_script(client_obj, scenario_key, language, voice, utterances, previous):
+    """Plays one scenario's script through in order, as a child would in the live app: each reply is generated with
+    the greeting and the script's earlier turns as history. Entries in previous are reused while the conversation
+    they were generated in is unchanged. Returns ([(entry, audio_bytes), ...], reused, failed)."""
+    import core_tutor as ct
+    from intent_matcher import intent_matcher
+
+    session = ct.TutorSession(client_obj, language=language, scenario_key=scenario_key, voice=voice)
+    client_obj = session.client # Wrapped, so every request goes through resilient_client and the scheduler
+    history = []
+    if session.scenario.greeting:
+        greeting = session.scenario.greeting
+        history.append({"role": "assistant", "content": ct.format_bilingual(greeting, ct.translate_static_phrase(client_obj, greeting, language))})
+    results = []
+    reused = 0
+    earlier_utterances = []
+    after_reply = None # The pack's previous reply; None after the greeting or a locally answered turn
+    for utterance in utterances:
+        interceptor_reply = ct.get_interceptor_reply(session, utterance, history)
+        if interceptor_reply:
+            if intent_matcher.is_exit(scenario_key, utterance):
+                break # The conversation ends here in the live app
+            # Answered locally at runtime; later replies are generated after it, as they would be live
+            reply_text = ct.format_bilingual(interceptor_reply, ct.translate_static_phrase(client_obj, interceptor_reply, language))
+            history += [{"role": "user", "content": utterance}, {"role": "assistant", "content": reply_text}]
+            earlier_utterances.append(utterance)
+            after_reply = None
+            continue
+        old = previous.get((TURN,) + _turn_key(scenario_key, language, voice, earlier_utterances, utterance))
+        if old is not None and old[0]["after_reply"] == after_reply:
+            entry, audio_bytes = old
+            reused += 1
+        else:
+            try:
+                ai_response_text = ct.get_gpt_response(session, utterance, history)
+                if not ai_response_text:
+                    raise RuntimeError("no reply from GPT")
+                english_text, native_text = ct.split_bilingual(ai_response_text)
+                audio_bytes = ct.synthesize_bilingual(client_obj, english_text, native_text, voice=voice, store=False)
+            except Exception as e:
+                # Later turns depend on this reply, so the rest of the script is left out of the pack
+                event("lesson_pack.job_error", level=logging.WARNING, scenario=scenario_key, language=language, utterance=utterance, error=str(e))
+                return results, reused, 1
+            entry = {"kind": TURN, "scenario": scenario_key, "language": language, "voice": voice, "earlier": list(earlier_utterances),
+                     "after_reply": after_reply, "utterance": utterance, "reply": ct.format_bilingual(english_text, native_text)}
+        results.append((entry, audio_bytes))
+        history += [{"role": "user", "content": utterance}, {"role": "assistant", "content": entry["reply"]}]
+        earlier_utterances.append(utterance)
+        after_reply = entry["reply"]
+    return results, reused, 0
+
+def _generate_static(client_obj, language, voice, phrase):
+    import core_tutor as ct
+
+    session = ct.TutorSession(client_obj, language=language, voice=voice)
+    display_text, audio_bytes = ct.speak_static_phrase(session, phrase)
+    if not audio_bytes:
+        raise RuntimeError("no audio from TTS")
+    if language != "English" and display_text == phrase:
+        raise RuntimeError("no translation") # Left out, so the live app translates it instead of playing English only
+    return {"kind": STATIC, "language": language, "voice": voice, "phrase": phrase, "reply": display_text}, audio_bytes
+
+def _run_in_background(function, *args):
+    """Runs a build job at background priority in the process-wide scheduler, so the build shares the API quota
+    with live sessions and only uses what their turns leave free."""
+    with scheduler.scope(LESSON_PACK_TENANT, scheduler.BACKGROUND):
+        return function(*args)
+
+def _entry_id(entry):
+    if entry["kind"] == STATIC:
+        return STATIC, entry["language"], entry["voice"], entry["phrase"]
+    return (TURN,) + _turn_key(entry["scenario"], entry["language"], entry["voice"], entry["earlier"], entry["utterance"])
+
+
+def build_lesson_pack(script, client_obj, output_dir=LESSON_PACK_DIR, workers=DEFAULT_WORKERS, rebuild=False):
+    """Pre-generates the replies to every scenario script in every language, and every fixed phrase of the lesson's
+    scenarios, into output_dir/<name>/. Entries of an existing pack with the same name are reused unless rebuild is
+    set, so an interrupted or extended build only pays for what is new. API requests wait in scheduler.default_scheduler
+    at background priority. Returns (pack_path, built, reused, failed)."""
+    from scenario_registry import registry as scenario_registry
+
+    pack_path = os.path.join(output_dir, script["name"])
+    voice = script["voice"]
+    previous = {}
+    if not rebuild and os.path.isfile(os.path.join(pack_path, INDEX_FILE)):
+        try:
+            old_pack = LessonPack(pack_path)
+            previous = {_entry_id(entry): (entry, old_pack.audio(entry)) for entry in old_pack.entries}
+            old_pack.close()
+        except (OSError, ValueError, KeyError) as e:
+            event("lesson_pack.load_error", level=logging.WARNING, path=pack_path, error=str(e))
+
+    jobs = [] # (job id, function, args)
+    for scenario_key, utterances in script["scenarios"].items():
+        for language in script["languages"]:
+            jobs.append(((TURN, scenario_key, language), _generate_script, (scenario_key, language, voice, utterances, previous)))
+    for phrase in dict.fromkeys(phrase for key in script["scenarios"] for phrase in scenario_registry.get(key).static_phrases()):
+        for language in script["languages"]:
+            jobs.append(((STATIC, language, voice, phrase), _generate_static, (language, voice, phrase)))
+
+    results = [] # (entry, audio_bytes)
+    reused = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speakgenie-lesson") as pool:
+        futures = {}
+        for job_id, function, args in dict((job[0], job) for job in jobs).values():
+            if job_id in previous:
+                results.append(previous[job_id])
+                reused += 1
+                continue
+            futures[pool.submit(_run_in_background, function, client_obj, *args)] = job_id
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                event("lesson_pack.job_error", level=logging.WARNING, job=futures[future], error=str(e))
+                continue
+            if futures[future][0] == TURN:
+                script_results, script_reused, script_failed = result
+                results += script_results
+                reused += script_reused
+                failed += script_failed
+            else:
+                results.append(result)
+
+    write_lesson_pack(pack_path, script, results)
+    return pack_path, len(results) - reused, reused, failed
+
+def write_lesson_pack(pack_path, script, results):
+    """Writes index.json + audio.bin for [(entry, audio_bytes), ...], replacing any previous pack atomically per file."""
+    os.makedirs(pack_path, exist_ok=True)
+    entries = []
+    audio_temp = os.path.join(pack_path, AUDIO_FILE + ".tmp")
+    offset = 0
+    with open(audio_temp, "wb") as audio_file:
+        for entry, audio_bytes in sorted(results, key=lambda result: _entry_id(result[0])):
+            entry = dict(entry, offset=offset, length=len(audio_bytes or b""))
+            if audio_bytes:
+                audio_file.write(audio_bytes)
+                offset += len(audio_bytes)
+            entries.append(entry)
+    index = {"format": PACK_FORMAT, "name": script["name"], "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+             "voice": script["voice"], "languages": script["languages"], "audio_bytes": offset, "entries": entries}
+    index_temp = os.path.join(pack_path, INDEX_FILE + ".tmp")
+    with open(index_temp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(audio_temp, os.path.join(pack_path, AUDIO_FILE))
+    os.replace(index_temp, os.path.join(pack_path, INDEX_FILE))
+
+
+# --- Command-line entry point ---
+def main():
+    """`python lesson_pack.py build lessons/store_week1.json` pre-generates a lesson; `inspect` lists a pack."""
+    parser = argparse.ArgumentParser(description="Pre-generate SpeakGenie lesson replies and audio into lesson packs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Generate a pack from a lesson script.")
+    build.add_argument("script", help="Lesson script (JSON).")
+    build.add_argument("--output", default=LESSON_PACK_DIR, help=f"Pack directory (default: {LESSON_PACK_DIR}).")
+    build.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Scripts and fixed phrases generated at once.")
+    build.add_argument("--rate-limits", default=None, help="API quota (RPM/TPM, e.g. chat=600/40000,tts=300) shared by all workers "
+                                                           "(default: SPEAKGENIE_RATE_LIMITS or scheduler.py's).")
+    build.add_argument("--rebuild", action="store_true", help="Regenerate entries that already exist in the pack.")
+    build.add_argument("--base-url", default=None, help="OpenAI-compatible server (e.g. benchmarks/fake_openai_server.py).")
+    inspect = commands.add_parser("inspect", help="Summarize a built pack.")
+    inspect.add_argument("pack", help="Pack directory.")
+    args = parser.parse_args()
+
+    if args.command == "inspect":
+        pack = LessonPack(args.pack)
+        turns = [entry for entry in pack.entries if entry["kind"] == TURN]
+        print(f"{pack.name}: {len(turns)} scripted turns, {len(pack.entries) - len(turns)} fixed phrases, "
+              f"{pack.index['audio_bytes']:,} bytes of audio, built {pack.index['created']}")
+        for entry in turns:
+            print(f"  [{entry['scenario']}/{entry['language']}] {' / '.join(entry['earlier'] + [entry['utterance']])} -> {entry['reply']}")
+        return 0
+
+    from openai import OpenAI
+
+    import core_tutor as ct
+
+    ct.load_dotenv()
+    if args.rate_limits:
+        scheduler.default_scheduler.configure(scheduler.parse_rate_limits(args.rate_limits))
+    client_obj = OpenAI(api_key=os.getenv("OPENAI_API_KEY") or "missing-key", base_url=args.base_url, max_retries=0)
+    script = load_lesson_script(args.script)
+    start = time.perf_counter()
+    pack_path, built, reused, failed = build_lesson_pack(script, client_obj, args.output, args.workers, args.rebuild)
+    print(f"Wrote {pack_path}: {built} generated, {reused} reused, {failed} failed in {time.perf_counter() - start:.1f}s.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
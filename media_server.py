@@ -0,0 +1,147 @@
+import logging
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import session_history
+from instrumentation import event, metrics
+
+# --- Media Server Configuration ---
+# Public base URL the browser fetches clips from, e.g. https://tutor.example.org/media behind the app's own
+# reverse proxy. Off unless set: a bare http://127.0.0.1 URL only works on the server machine itself and is
+# blocked as mixed content on HTTPS pages, so without it the app embeds clip bytes as before
+MEDIA_URL = os.getenv("SPEAKGENIE_MEDIA_URL")
+MEDIA_HOST = os.getenv("SPEAKGENIE_MEDIA_HOST", "127.0.0.1") # Where the server listens (the proxy forwards /media here)
+MEDIA_PORT = int(os.getenv("SPEAKGENIE_MEDIA_PORT", "8799"))
+CLIP_CACHE_CONTROL = "public, max-age=31536000, immutable" # Clip ids are content hashes, so a URL never changes meaning
+
+CLIP_PATH = re.compile(r"^/media/([0-9a-f]{16,64})\.mp3$")
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """Parses a single-range `Range: bytes=...` header. Returns (start, end) inclusive, None to send the whole
+    clip (no header, or several ranges), or "unsatisfiable"."""
+    match = RANGE_HEADER.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first: # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "unsatisfiable"
+    return start, end
+
+
+# --- HTTP handler: GET/HEAD /media/<clip_id>.mp3 from the AudioStore ---
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves reply clips by content hash with long-lived cache headers, ETag revalidation and byte ranges
+    (browsers seek and resume <audio> with Range requests)."""
+    audio_store = None # Set by start_media_server()
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        metrics.increment("media.requests")
+        match = CLIP_PATH.match(self.path.split("?", 1)[0])
+        audio_bytes = self.audio_store.get(match.group(1)) if match else None
+        if audio_bytes is None: # Unknown, or evicted from the store
+            metrics.increment("media.not_found")
+            self._send_empty(404)
+            return
+        etag = f'"{match.group(1)}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            metrics.increment("media.not_modified")
+            self._send_empty(304, etag)
+            return
+
+        size = len(audio_bytes)
+        byte_range = None
+        if self.headers.get("If-Range") in (None, etag): # A stale If-Range means "send the whole new version"
+            byte_range = parse_range(self.headers.get("Range"), size)
+        if byte_range == "unsatisfiable":
+            self._send_empty(416, etag, {"Content-Range": f"bytes */{size}"})
+            return
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self._send_clip_headers(etag)
+        if byte_range:
+            metrics.increment("media.range_requests")
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(audio_bytes[start:end + 1])
+            metrics.increment("media.bytes_sent", end - start + 1)
+
+    def _send_clip_headers(self, etag):
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Cache-Control", CLIP_CACHE_CONTROL)
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+
+    def _send_empty(self, status, etag=None, headers=None):
+        self.send_response(status)
+        if etag is not None:
+            self._send_clip_headers(etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass # Request counts go to metrics; per-request lines would flood the app log
+
+
+# --- Process-wide server, started on first use ---
+_server = None
+_base_url = None
+_start_lock = threading.Lock()
+_start_failed = False
+
+
+def start_media_server(audio_store=None, host=MEDIA_HOST, port=MEDIA_PORT):
+    """Starts a media server for audio_store on a background thread. Returns (server, base_url);
+    call server.shutdown() when done."""
+    handler = type("StoreMediaHandler", (MediaHandler,), {"audio_store": audio_store or session_history.default_audio_store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="media-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/media"
+
+def ensure_started():
+    """Starts the process-wide media server once. Returns its public base URL, or None when SPEAKGENIE_MEDIA_URL
+    is not set or the port is taken (the app then embeds clip bytes as before)."""
+    global _server, _base_url, _start_failed
+    if not MEDIA_URL or _start_failed:
+        return None
+    if _server is None:
+        with _start_lock:
+            if _server is None and not _start_failed:
+                try:
+                    _server, _ = start_media_server()
+                except OSError as e: # e.g. a second worker on this host: set SPEAKGENIE_MEDIA_PORT per worker
+                    _start_failed = True
+                    event("media.unavailable", level=logging.WARNING, host=MEDIA_HOST, port=MEDIA_PORT, error=str(e))
+                    return None
+                _base_url = MEDIA_URL.rstrip("/")
+                event("media.started", url=_base_url)
+    return _base_url
+
+def clip_url(clip_id):
+    """Returns the URL the browser fetches clip_id from, or None to fall back to embedding the bytes."""
+    base_url = ensure_started()
+    return f"{base_url}/{clip_id}.mp3" if base_url and clip_id else None
@@ -0,0 +1,378 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+import scheduler
+from instrumentation import event, metrics
+
+# --- Resilience Configuration ---
+HEDGING_ENABLED = os.getenv("SPEAKGENIE_HEDGING", "1") != "0" # Set to 0 to never send duplicate requests
+HEDGE_MIN_SAMPLES = 20 # Successful calls needed before the measured p95 replaces a policy's hedge_after
+BREAKER_FAILURES = 5 # Consecutive failed calls (after retries) that open an endpoint's circuit
+BREAKER_RESET_SECONDS = 30.0 # How long an open circuit fails fast before one probe request is let through
+# Threads running sync attempts, so a caller can give up at its deadline. Every turn and TTS thread may be
+# waiting on one attempt (plus a hedge), so keep this above SPEAKGENIE_TURN_WORKERS + SPEAKGENIE_TTS_WORKERS
+ATTEMPT_WORKERS = int(os.getenv("SPEAKGENIE_ATTEMPT_WORKERS", "64"))
+
+
+class EndpointPolicy:
+    """Deadline and retry settings for one OpenAI endpoint, in seconds. deadline bounds the whole call
+    (all attempts and backoff), attempt_timeout a single request."""
+    __slots__ = ("deadline", "attempt_timeout", "max_attempts", "backoff_base", "backoff_max", "hedge", "hedge_after")
+
+    def __init__(self, deadline, attempt_timeout, max_attempts=3, backoff_base=0.25, backoff_max=2.0, hedge=False, hedge_after=2.0):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge # Send a duplicate request when the first one is slower than p95
+        self.hedge_after = hedge_after # Hedge delay until enough latencies have been measured
+
+
+ENDPOINT_POLICIES = {
+    "stt": EndpointPolicy(deadline=20.0, attempt_timeout=10.0, hedge=True, hedge_after=3.0),
+    "chat": EndpointPolicy(deadline=25.0, attempt_timeout=15.0), # Not hedged: a duplicate completion doubles the token bill
+    "chat_stream": EndpointPolicy(deadline=15.0, attempt_timeout=10.0), # Until the stream opens; the caller reads the tokens
+    "tts": EndpointPolicy(deadline=15.0, attempt_timeout=8.0, hedge=True, hedge_after=2.0),
+}
+
+# Client methods that go through an endpoint; everything else on the client is passed through untouched
+ROUTES = {
+    "audio.transcriptions.create": "stt",
+    "chat.completions.create": "chat",
+    "audio.speech.create": "tts",
+}
+_ROUTE_PREFIXES = {route.rsplit(".", i)[0] for route in ROUTES for i in range(1, route.count(".") + 1)}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while an endpoint's circuit is open."""
+
+class DeadlineExceededError(TimeoutError):
+    """An attempt (or the whole call) ran past its deadline."""
+
+
+def is_retryable(error):
+    """Transport errors, timeouts, 408/409/429 and 5xx are worth retrying; other API errors (bad request,
+    auth, content policy) would fail the same way again."""
+    import openai # Already loaded by the time a call fails; importing it at module level slows every cold start
+
+    if isinstance(error, (DeadlineExceededError, openai.APIConnectionError)): # Includes APITimeoutError
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in (408, 409, 429) or (status_code is not None and status_code >= 500)
+
+def _retry_after(error):
+    """Seconds from a Retry-After header on a 429/503 response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """Closed -> open after BREAKER_FAILURES failed calls in a row -> half-open after BREAKER_RESET_SECONDS
+    (one probe call) -> closed again on success, open again on failure."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN # This caller is the probe; others keep failing fast until it finishes
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                event("client.circuit_closed", level=logging.INFO, endpoint=self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def release_probe(self):
+        """The half-open probe never reached the API (e.g. it timed out in the rate-limit queue): let the next call probe."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                metrics.increment(f"client.{self.name}.circuit_opened")
+                event("client.circuit_open", level=logging.WARNING, endpoint=self.name, failures=self.failures)
+
+
+# Shared by every sync endpoint; attempts abandoned at a deadline finish here (bounded by the SDK timeout)
+_attempt_executor = ThreadPoolExecutor(max_workers=ATTEMPT_WORKERS, thread_name_prefix="speakgenie-api")
+
+
+# --- One endpoint: deadline, jittered retries, hedging, circuit breaker ---
+class ResilientEndpoint:
+    """Runs calls to one endpoint under its EndpointPolicy and CircuitBreaker, counting retries, hedges,
+    timeouts and short-circuits as "client.<endpoint>.*" metrics."""
+
+    def __init__(self, name, policy):
+        self.name = name
+        self.policy = policy
+        self.breaker = CircuitBreaker(name)
+        self.latency = metrics.histogram(f"client.{name}")
+
+    def _count(self, what):
+        metrics.increment(f"client.{self.name}.{what}")
+
+    def hedge_delay(self):
+        """How long to wait before sending a duplicate: the measured p95, once there are enough samples."""
+        _, count, _ = self.latency.snapshot()
+        if count < HEDGE_MIN_SAMPLES:
+            return self.policy.hedge_after
+        return self.latency.percentiles((0.95,))[0.95]
+
+    def backoff(self, attempt, error):
+        """Full-jitter exponential backoff, stretched to the server's Retry-After when it sent one."""
+        delay = random.uniform(0, min(self.policy.backoff_max, self.policy.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after else delay
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("short_circuits")
+            raise CircuitOpenError(f"{self.name} circuit is open; not calling the API")
+        return time.monotonic() + self.policy.deadline
+
+    def _queue_timeout(self, error):
+        """Called when a call gave up in the scheduler queue: the API was never asked, so it is not a breaker failure."""
+        self.breaker.release_probe()
+        self._count("queue_timeouts")
+        return error
+
+    def _failed(self, error):
+        """Called when a call gives up. Returns the error to raise."""
+        self.breaker.record_failure()
+        self._count("failures")
+        event("client.failed", level=logging.WARNING, endpoint=self.name, error=str(error))
+        return error
+
+    def call(self, fn, kwargs, hedge=True):
+        """Calls fn(**kwargs) with retries until it succeeds, fails for good or the deadline passes."""
+        deadline = self._admit()
+        last_error = DeadlineExceededError(f"{self.name} deadline of {self.policy.deadline}s exceeded")
+        for attempt in range(self.policy.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                self._count("retries")
+                event("client.retry", level=logging.INFO, endpoint=self.name, attempt=attempt, error=str(last_error))
+            try: # Every attempt (retries too) waits for its share of the rate limit
+                tokens = scheduler.default_scheduler.acquire(self.name, kwargs, remaining)
+            except scheduler.QueueTimeoutError as e:
+                raise self._queue_timeout(e)
+            remaining = max(0.001, deadline - time.monotonic())
+            try:
+                result = self._attempt(fn, kwargs, min(self.policy.attempt_timeout, remaining), hedge)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success() # The API answered; the request itself was bad
+                    raise
+                last_error = e
+                delay = self.backoff(attempt, e)
+                if attempt + 1 >= self.policy.max_attempts or time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            scheduler.default_scheduler.settle(self.name, tokens, result)
+            return result
+        raise self._failed(last_error)
+
+    def _submit(self, fn, kwargs):
+        # Copies the caller's context, so events from the attempt keep the turn's trace_id
+        return _attempt_executor.submit(contextvars.copy_context().run, partial(fn, **kwargs))
+
+    def _attempt(self, fn, kwargs, timeout, hedge):
+        start = time.monotonic()
+        kwargs = dict(kwargs, timeout=timeout) # The SDK also stops waiting on the socket after this
+        primary = self._submit(fn, kwargs)
+        running = [primary]
+        hedge_delay = self.hedge_delay() if hedge and self.policy.hedge and HEDGING_ENABLED else None
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(running, timeout=hedge_delay)
+            if not done and not scheduler.default_scheduler.try_acquire(self.name, kwargs):
+                self._count("hedges_throttled") # No spare quota: a duplicate would only delay other learners
+            elif not done:
+                self._count("hedges")
+                event("client.hedge", endpoint=self.name, after_ms=round(hedge_delay * 1000, 1))
+                running.append(self._submit(fn, kwargs))
+        error = None
+        while running:
+            done, _ = wait(running, timeout=max(0.0, start + timeout - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                running.remove(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for other in running:
+                    other.cancel() # Only stops it if it hasn't started; a started duplicate is left to finish
+                if future is not primary:
+                    self._count("hedge_wins")
+                self.latency.observe(time.monotonic() - start)
+                return future.result()
+        if error is not None and not running:
+            raise error
+        self._count("timeouts")
+        raise DeadlineExceededError(f"{self.name} attempt timed out after {timeout:.1f}s")
+
+    async def acall(self, fn, kwargs, hedge=True):
+        """Async version of call(); fn returns an awaitable (an AsyncOpenAI method)."""
+        deadline = self._admit()
+        last_error = DeadlineExceededError(f"{self.name} deadline of {self.policy.deadline}s exceeded")
+        for attempt in range(self.policy.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                self._count("retries")
+                event("client.retry", level=logging.INFO, endpoint=self.name, attempt=attempt, error=str(last_error))
+            try:
+                tokens = await scheduler.default_scheduler.aacquire(self.name, kwargs, remaining)
+            except scheduler.QueueTimeoutError as e:
+                raise self._queue_timeout(e)
+            remaining = max(0.001, deadline - time.monotonic())
+            try:
+                result = await self._aattempt(fn, kwargs, min(self.policy.attempt_timeout, remaining), hedge)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success()
+                    raise
+                last_error = e
+                delay = self.backoff(attempt, e)
+                if attempt + 1 >= self.policy.max_attempts or time.monotonic() + delay >= deadline:
+                    break
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            scheduler.default_scheduler.settle(self.name, tokens, result)
+            return result
+        raise self._failed(last_error)
+
+    async def _aattempt(self, fn, kwargs, timeout, hedge):
+        start = time.monotonic()
+        kwargs = dict(kwargs, timeout=timeout)
+        primary = asyncio.ensure_future(fn(**kwargs))
+        running = {primary}
+        try:
+            hedge_delay = self.hedge_delay() if hedge and self.policy.hedge and HEDGING_ENABLED else None
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(running, timeout=hedge_delay)
+                if not done and not scheduler.default_scheduler.try_acquire(self.name, kwargs):
+                    self._count("hedges_throttled")
+                elif not done:
+                    self._count("hedges")
+                    event("client.hedge", endpoint=self.name, after_ms=round(hedge_delay * 1000, 1))
+                    running.add(asyncio.ensure_future(fn(**kwargs)))
+            error = None
+            while running:
+                done, running = await asyncio.wait(running, timeout=max(0.0, start + timeout - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is not primary:
+                        self._count("hedge_wins")
+                    self.latency.observe(time.monotonic() - start)
+                    return task.result()
+            if error is not None and not running:
+                raise error
+            self._count("timeouts")
+            raise DeadlineExceededError(f"{self.name} attempt timed out after {timeout:.1f}s")
+        finally:
+            for task in running:
+                task.cancel() # Unlike threads, a losing or timed-out coroutine can really be stopped
+
+
+# Process-wide, so every session sees the same view of the API's health
+endpoints = {name: ResilientEndpoint(name, policy) for name, policy in ENDPOINT_POLICIES.items()}
+
+
+# --- Drop-in client wrapper ---
+class _ResilientNamespace:
+    """Mirrors one level of an OpenAI client (client.audio, client.chat.completions, ...). Routed methods
+    go through their endpoint; any other attribute is the client's own."""
+
+    def __init__(self, target, path, is_async):
+        self._target = target
+        self._path = path
+        self._is_async = is_async
+
+    def __getattr__(self, name):
+        path = f"{self._path}.{name}" if self._path else name
+        if path in ROUTES:
+            return partial(_call, ROUTES[path], getattr(self._target, name), self._is_async)
+        value = getattr(self._target, name)
+        if path in _ROUTE_PREFIXES:
+            return _ResilientNamespace(value, path, self._is_async)
+        return value
+
+def _call(endpoint_name, fn, is_async, **kwargs):
+    hedge = True
+    if endpoint_name == "chat" and kwargs.get("stream"):
+        endpoint_name, hedge = "chat_stream", False # Retried until the stream opens, never duplicated
+    endpoint = endpoints[endpoint_name]
+    if is_async:
+        return endpoint.acall(fn, kwargs, hedge=hedge)
+    return endpoint.call(fn, kwargs, hedge=hedge)
+
+
+class ResilientClient(_ResilientNamespace):
+    """Wraps an OpenAI or AsyncOpenAI client so that transcription, chat and TTS requests get per-endpoint
+    deadlines, jittered retries, hedging and circuit breaking. Create the underlying client with
+    max_retries=0, or the SDK's own retries run inside every attempt."""
+
+    def __init__(self, client, is_async=None):
+        import openai
+
+        super().__init__(client, "", isinstance(client, openai.AsyncOpenAI) if is_async is None else is_async)
+
+    @property
+    def client(self):
+        return self._target
+
+def wrap(client_obj):
+    """Returns client_obj wrapped in a ResilientClient (unchanged if it already is one, or None)."""
+    if client_obj is None or isinstance(client_obj, ResilientClient):
+        return client_obj
+    return ResilientClient(client_obj)
+
+def status():
+    """{endpoint: circuit state}, for the UI and logs."""
+    return {name: endpoint.breaker.state for name, endpoint in endpoints.items()}
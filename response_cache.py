@@ -0,0 +1,228 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import state_backend
+
+# --- Response Cache Configuration ---
+RESPONSE_CACHE_MAX_ENTRIES = 2000
+RESPONSE_CACHE_TTL_SECONDS = 24 * 60 * 60 # Cached answers are re-asked to GPT after a day
+SIMILARITY_THRESHOLD = 0.6 # Trigram cosine similarity needed for a near-duplicate hit (content words must match too)
+MIN_QUESTION_CHARS = 6 # Too-short inputs ("yes", "ok") depend on context, never cache them
+
+FILLER_WORDS = {"um", "uh", "hmm", "hey", "hi", "please", "genie", "speakgenie", "so", "okay", "ok"}
+NON_WORD_PATTERN = re.compile(r"[^\w\s]+")
+# Words that don't change what is being asked; all other (content) words must agree for a near-duplicate hit
+STOP_WORDS = {"a", "an", "the", "is", "are", "was", "me", "you", "can", "could", "would", "tell", "about", "do",
+              "does", "what", "whats", "i", "to", "of", "please", "some", "something", "know", "want"}
+# Follow-ups whose answer depends on the previous turn ("tell me more about it", "why did they do that?"):
+# the same words after another answer need another reply, so they are never cached
+REFERRING_WORDS = {"it", "its", "itself", "this", "that", "these", "those", "they", "them", "their", "he", "him",
+                   "his", "she", "her", "more", "again", "else", "another", "same", "also", "too"}
+FOLLOW_UP_WORDS = {"why", "how", "come", "really", "not", "yes", "no", "then"} # "why?", "how come?", "why not?"
+
+
+# --- Question normalization and similarity ---
+def normalize_question(text):
+    """Lower-cases, strips punctuation and filler words: "Um, what is the SUN?" -> "what is the sun"."""
+    words = NON_WORD_PATTERN.sub(" ", text.lower()).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+def content_words(normalized_text):
+    """Set of crudely stemmed content words: "tell me about the dogs" -> {"dog"}. Guards against
+    trigram look-alikes with a different meaning ("what is a dog" vs "what is a dot")."""
+    words = set()
+    for word in normalized_text.split():
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        words.add(word)
+    return frozenset(words)
+
+def depends_on_context(normalized_text):
+    """True for questions that only make sense after the previous answer, or too short to stand alone."""
+    if len(normalized_text) < MIN_QUESTION_CHARS:
+        return True
+    if REFERRING_WORDS.intersection(normalized_text.split()):
+        return True
+    return content_words(normalized_text) <= FOLLOW_UP_WORDS
+
+def trigram_vector(normalized_text):
+    """Character trigram counts of the padded text (a tiny local 'embedding' for near-duplicate lookup)."""
+    padded = f" {normalized_text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def cosine_similarity(vector_a, norm_a, vector_b, norm_b):
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(vector_a) > len(vector_b):
+        vector_a, vector_b = vector_b, vector_a
+    return sum(count * vector_b.get(gram, 0) for gram, count in vector_a.items()) / (norm_a * norm_b)
+
+
+class _Entry:
+    __slots__ = ("partition", "normalized", "reply", "audio", "created", "vector", "norm", "words")
+
+    def __init__(self, partition, normalized, reply, audio):
+        self.partition = partition
+        self.normalized = normalized
+        self.reply = reply
+        self.audio = audio
+        self.created = time.monotonic()
+        self.vector = trigram_vector(normalized)
+        self.norm = math.sqrt(sum(count * count for count in self.vector.values()))
+        self.words = content_words(normalized)
+
+
+# --- Semantic response cache ---
+class ResponseCache:
+    """Caches (reply text, TTS audio) for frequent questions, keyed on (mode, language, scenario, normalized question).
+    Exact matches are a dict lookup; near-duplicates ("tell me about dogs" / "can you tell me about the dogs") are
+    found through a trigram inverted index and must share the same content words. Entries expire after a TTL and are evicted least-recently-used.
+    With a shared state backend, exact matches are also shared with other workers (near-duplicate search stays local)."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, similarity_threshold=SIMILARITY_THRESHOLD, backend=None):
+        backend = backend or state_backend.default_backend
+        self.backend = backend if backend.shared else None
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict() # (partition, normalized) -> _Entry, least recently used first
+        self._trigram_index = {} # (partition, trigram) -> set of entry keys
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def partition_for(session):
+        return (session.mode, session.language, session.scenario.key, session.voice) # Voice too, since audio is stored
+
+    @staticmethod
+    def _shared_key(partition, normalized):
+        return hashlib.sha256("\x1f".join((*partition, normalized)).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _encode_shared(reply_text, audio_bytes):
+        reply_bytes = reply_text.encode("utf-8")
+        return len(reply_bytes).to_bytes(4, "big") + reply_bytes + audio_bytes
+
+    @staticmethod
+    def _decode_shared(value):
+        reply_length = int.from_bytes(value[:4], "big")
+        return value[4:4 + reply_length].decode("utf-8"), value[4 + reply_length:]
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key)
+        for gram in entry.vector:
+            keys = self._trigram_index.get((entry.partition, gram))
+            if keys is not None:
+                keys.discard(entry_key)
+                if not keys:
+                    del self._trigram_index[(entry.partition, gram)]
+
+    def _expired(self, entry):
+        return time.monotonic() - entry.created > self.ttl_seconds
+
+    def get(self, session, question_text):
+        """Returns (reply_text, audio_bytes) for question_text in this session's mode/language/scenario, or None."""
+        normalized = normalize_question(question_text)
+        if depends_on_context(normalized):
+            return None
+        partition = self.partition_for(session)
+        with self._lock:
+            entry_key = (partition, normalized)
+            entry = self._entries.get(entry_key)
+            if entry is not None and self._expired(entry):
+                self._remove(entry_key)
+                entry = None
+            if entry is not None:
+                self.exact_hits += 1
+            else:
+                entry_key = self._find_similar(partition, normalized)
+                entry = self._entries.get(entry_key) if entry_key else None
+                if entry is None and self.backend is None:
+                    self.misses += 1
+                    return None
+                if entry is not None:
+                    self.similar_hits += 1
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+                return entry.reply, entry.audio
+        # Another worker may have answered the exact question already
+        value = self.backend.get("response", self._shared_key(partition, normalized))
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        reply_text, audio_bytes = self._decode_shared(value)
+        self._store(partition, normalized, reply_text, audio_bytes) # Locally too, so near-duplicates find it
+        with self._lock:
+            self.shared_hits += 1
+        return reply_text, audio_bytes
+
+    def _find_similar(self, partition, normalized):
+        """Best near-duplicate entry key above the similarity threshold, or None. Only entries sharing a trigram are scored."""
+        vector = trigram_vector(normalized)
+        norm = math.sqrt(sum(count * count for count in vector.values()))
+        words = content_words(normalized)
+        candidates = set()
+        for gram in vector:
+            candidates |= self._trigram_index.get((partition, gram), set())
+        best_key, best_score = None, self.similarity_threshold
+        for candidate_key in candidates:
+            entry = self._entries[candidate_key]
+            if self._expired(entry):
+                self._remove(candidate_key)
+                continue
+            if entry.words != words:
+                continue
+            score = cosine_similarity(vector, norm, entry.vector, entry.norm)
+            if score >= best_score:
+                best_key, best_score = candidate_key, score
+        return best_key
+
+    def put(self, session, question_text, reply_text, audio_bytes):
+        """Stores a GPT reply and its TTS audio for later identical or near-identical questions."""
+        normalized = normalize_question(question_text)
+        if depends_on_context(normalized) or not reply_text:
+            return
+        partition = self.partition_for(session)
+        if self.backend is not None:
+            self.backend.set("response", self._shared_key(partition, normalized),
+                             self._encode_shared(reply_text, audio_bytes), self.ttl_seconds)
+        self._store(partition, normalized, reply_text, audio_bytes)
+
+    def _store(self, partition, normalized, reply_text, audio_bytes):
+        entry_key = (partition, normalized)
+        with self._lock:
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            entry = _Entry(partition, normalized, reply_text, audio_bytes)
+            self._entries[entry_key] = entry
+            for gram in entry.vector:
+                self._trigram_index.setdefault((partition, gram), set()).add(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        """Returns hit/miss counters and the hit rate."""
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.shared_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.similar_hits + self.shared_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# Process-wide cache; sessions opt in by setting TutorSession.response_cache
+default_response_cache = ResponseCache()
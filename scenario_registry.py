@@ -0,0 +1,112 @@
+import json
+import os
+
+# --- Registry Configuration ---
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios.json")
+FREE_CHAT = "free_chat" # Scenario key used for Free Chat mode
+ROLEPLAY_SELECTION = "roleplay_selection" # Roleplay Mode before a scenario is picked
+
+# UI / legacy mode names -> prompt modes understood by the registry
+MODE_ALIASES = {
+    "chat": "chat",
+    "free_chat": "chat",
+    "free chat": "chat",
+    "roleplay": "roleplay",
+    "roleplay_mode": "roleplay",
+    "roleplay mode": "roleplay",
+}
+
+
+def normalize_mode(mode):
+    """Maps any mode spelling used by the UI ("Roleplay Mode", "roleplay_mode", ...) to "chat" or "roleplay"."""
+    return MODE_ALIASES.get(mode.strip().lower(), mode)
+
+
+# --- One scenario (persona, greeting, background, exits, interceptor) ---
+class Scenario:
+    """A declarative scenario from scenarios.json with its GPT message prefix/suffixes pre-built,
+    so assembling a prompt per turn is only a list concatenation."""
+    __slots__ = ("key", "label", "mode", "context", "greeting", "background", "farewell",
+                 "exit_phrases", "interceptor", "message_prefix", "message_suffixes", "translation_instruction")
+
+    def __init__(self, key, spec, personas, translation_instruction, languages):
+        self.key = key
+        self.label = spec["label"]
+        self.mode = normalize_mode(spec["mode"])
+        self.context = spec.get("context", "")
+        self.greeting = spec.get("greeting")
+        self.background = spec.get("background")
+        self.farewell = spec.get("farewell", "")
+        self.exit_phrases = tuple(phrase.lower() for phrase in spec.get("exit_phrases", ()))
+        self.interceptor = spec.get("interceptor")
+
+        persona_prompt = personas[self.mode].replace("{roleplay_context}", self.context)
+        self.message_prefix = ({"role": "system", "content": persona_prompt},)
+        self.translation_instruction = translation_instruction
+        self.message_suffixes = {"English": ()}
+        for language in languages:
+            if language != "English":
+                self.message_suffixes[language] = (
+                    {"role": "system", "content": translation_instruction.replace("{language}", language)},
+                )
+
+    @property
+    def is_roleplay(self):
+        return self.mode == "roleplay"
+
+    def prompt_messages(self, language):
+        """Returns the pre-built (prefix_messages, suffix_messages) for language. Treat both as read-only."""
+        suffix_messages = self.message_suffixes.get(language)
+        if suffix_messages is None: # A language not listed in scenarios.json: build once, then reuse
+            suffix_messages = ({"role": "system", "content": self.translation_instruction.replace("{language}", language)},)
+            self.message_suffixes[language] = suffix_messages
+        return self.message_prefix, suffix_messages
+
+    def static_phrases(self):
+        """Every fixed phrase this scenario can speak (greeting, farewell, interceptor replies)."""
+        phrases = [self.greeting, self.farewell]
+        if self.interceptor:
+            phrases += [rule["reply"] for rule in self.interceptor["rules"]]
+            phrases.append(self.interceptor["fallback"])
+        return [phrase for phrase in phrases if phrase]
+
+
+# --- Registry ---
+class ScenarioRegistry:
+    """All scenarios from the declarative scenarios file, loaded once."""
+
+    def __init__(self, path=SCENARIOS_PATH):
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        self.languages = tuple(spec["languages"])
+        self.static_translation_instruction = spec["static_translation_instruction"]
+        self.fallback_reply = spec["fallback_reply"] # Spoken when GPT is unreachable (pre-rendered like every static phrase)
+        self.scenarios = {
+            key: Scenario(key, scenario_spec, spec["personas"], spec["translation_instruction"], self.languages)
+            for key, scenario_spec in spec["scenarios"].items()
+        }
+
+    def get(self, key):
+        """Returns the Scenario for key (KeyError if unknown)."""
+        return self.scenarios[key]
+
+    def roleplay_scenarios(self):
+        """Selectable roleplay scenarios, in file order."""
+        return [scenario for scenario in self.scenarios.values() if scenario.is_roleplay and scenario.key != ROLEPLAY_SELECTION]
+
+    def for_mode(self, mode, scenario_key=None):
+        """Picks the scenario for a UI mode plus (optional) selected roleplay scenario key."""
+        if normalize_mode(mode) == "chat":
+            return self.scenarios[FREE_CHAT]
+        return self.scenarios.get(scenario_key) or self.scenarios[ROLEPLAY_SELECTION]
+
+    def static_phrases(self):
+        """De-duplicated fixed phrases across all scenarios (for TTS cache warm-up)."""
+        phrases = [self.fallback_reply]
+        for scenario in self.scenarios.values():
+            phrases += scenario.static_phrases()
+        return list(dict.fromkeys(phrases))
+
+
+# Loaded once at import; every session shares these immutable scenario objects
+registry = ScenarioRegistry()
@@ -0,0 +1,331 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from history_manager import estimate_message_tokens
+from instrumentation import event, metrics
+
+# --- Scheduler Configuration ---
+SCHEDULER_ENABLED = os.getenv("SPEAKGENIE_SCHEDULER", "1") != "0"
+# Quota shared by every session of this process, per API bucket: (requests per minute, tokens per minute or None).
+# With several workers on one API key, divide the account's limits between them (SPEAKGENIE_RATE_LIMITS).
+DEFAULT_RATE_LIMITS = {"stt": (500, None), "chat": (3500, 200000), "tts": (500, None)}
+ENDPOINT_BUCKETS = {"stt": "stt", "chat": "chat", "chat_stream": "chat", "tts": "tts"} # resilient_client endpoint -> bucket
+BURST_SECONDS = 2.0 # Bucket capacity: up to this many seconds of quota can be spent at once
+DEFAULT_COMPLETION_TOKENS = 300 # Counted against TPM when a chat request sets no max_tokens
+ASYNC_POLL_SECONDS = 0.01 # How often a waiting coroutine re-checks the queue
+
+# Priorities: every interactive request is served before any background one
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+DEFAULT_TENANT = "default"
+
+
+def parse_rate_limits(spec):
+    """"chat=3500/200000,tts=100" -> {"chat": (3500, 200000), "tts": (100, None)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        bucket, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        limits[bucket.strip()] = (float(rpm), float(tpm) if tpm else None)
+    return limits
+
+def parse_weights(spec):
+    """"class-7a=2,class-7b=1" -> {"class-7a": 2.0, "class-7b": 1.0}."""
+    return {tenant.strip(): float(weight) for tenant, _, weight in
+            (item.partition("=") for item in spec.split(",") if item.strip())}
+
+
+class QueueTimeoutError(TimeoutError):
+    """A request could not get a rate-limit slot before its deadline (the API was not called)."""
+
+
+# --- Who a request is for (per thread / asyncio task) ---
+_current_scope = contextvars.ContextVar("speakgenie_scheduler_scope", default=(DEFAULT_TENANT, INTERACTIVE))
+
+@contextmanager
+def scope(tenant=None, priority=INTERACTIVE):
+    """Charges API calls made inside to tenant (a learner session or classroom) at priority.
+    Work handed to core_tutor's TTS pool and resilient_client's attempts carries the scope along."""
+    token = _current_scope.set((tenant or DEFAULT_TENANT, priority))
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+def current_scope():
+    return _current_scope.get()
+
+
+# --- Token bucket ---
+class TokenBucket:
+    """Refills at rate_per_minute / 60 per second, holding at most BURST_SECONDS worth (and at least one request)."""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount is available (call refill first)."""
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+
+class Ticket:
+    __slots__ = ("tenant", "priority", "tokens", "finish", "seq", "enqueued", "granted")
+
+    def __init__(self, tenant, priority, tokens, finish, seq):
+        self.tenant = tenant
+        self.priority = priority
+        self.tokens = tokens
+        self.finish = finish # Virtual finish time (weighted fair queuing)
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.finish, self.seq) < (other.priority, other.finish, other.seq)
+
+
+# --- One API bucket: RPM/TPM limits and a weighted fair queue in front of them ---
+class BucketScheduler:
+    """Requests wait in one queue ordered by (priority, virtual finish time). A tenant's finish time advances
+    by cost / weight per request, so a classroom firing many requests at once queues behind its own earlier
+    requests while other tenants' requests slot in between (self-clocked weighted fair queuing).
+    Only the head of the queue may take RPM/TPM tokens."""
+
+    def __init__(self, name, rpm, tpm=None, weights=None):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.weights = weights if weights is not None else {}
+        self._queue = [] # Heap of waiting Tickets
+        self._virtual_time = {} # priority -> finish time of the last granted ticket
+        self._last_finish = {} # (priority, tenant) -> finish time of the tenant's last queued ticket
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._wait_histogram = metrics.histogram(f"scheduler.{name}.wait")
+
+    def _cost(self, tokens):
+        if self.token_bucket is None:
+            return 1.0
+        return min(tokens, self.token_bucket.capacity) # A request bigger than the burst would never fit
+
+    def _enqueue(self, tenant, priority, tokens):
+        """Queues a ticket (lock held)."""
+        cost = self._cost(tokens)
+        start = max(self._virtual_time.get(priority, 0.0), self._last_finish.get((priority, tenant), 0.0))
+        finish = start + cost / self.weights.get(tenant, 1.0)
+        self._last_finish[(priority, tenant)] = finish
+        ticket = Ticket(tenant, priority, cost, finish, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        self._update_depth()
+        return ticket
+
+    def _forget_idle_tenants(self, priority, virtual_time):
+        """Drops finish times the virtual clock has passed (lock held): those tenants have nothing queued, and
+        their next ticket starts at the virtual time anyway. Keeps the dict from growing with every learner session."""
+        idle = [key for key, finish in self._last_finish.items() if key[0] == priority and finish <= virtual_time]
+        for key in idle:
+            del self._last_finish[key]
+
+    def _update_depth(self):
+        metrics.set_gauge(f"scheduler.{self.name}.queue_depth", len(self._queue))
+
+    def _try_grant(self, ticket):
+        """Grants ticket if it is at the head of the queue and the buckets have room (lock held).
+        Returns seconds to wait before trying again, or None when another ticket is ahead."""
+        if self._queue[0] is not ticket:
+            return None
+        now = time.monotonic()
+        self.requests.refill(now)
+        wait_seconds = self.requests.wait_time(1)
+        if self.token_bucket is not None:
+            self.token_bucket.refill(now)
+            wait_seconds = max(wait_seconds, self.token_bucket.wait_time(ticket.tokens))
+        if wait_seconds > 0:
+            return wait_seconds
+        self.requests.tokens -= 1
+        if self.token_bucket is not None:
+            self.token_bucket.tokens -= ticket.tokens
+        heapq.heappop(self._queue)
+        self._virtual_time[ticket.priority] = ticket.finish
+        self._forget_idle_tenants(ticket.priority, ticket.finish)
+        ticket.granted = True
+        self._granted(ticket)
+        self._condition.notify_all() # The next ticket is now at the head
+        return 0.0
+
+    def _granted(self, ticket):
+        waited = time.monotonic() - ticket.enqueued
+        self._wait_histogram.observe(waited)
+        metrics.increment(f"scheduler.{self.name}.{PRIORITY_NAMES[ticket.priority]}.granted")
+        self._update_depth()
+        if waited > 1.0:
+            event("scheduler.slow_grant", level=logging.INFO, bucket=self.name, tenant=ticket.tenant,
+                  priority=PRIORITY_NAMES[ticket.priority], waited_ms=round(waited * 1000), queued=len(self._queue))
+
+    def _abandon(self, ticket):
+        """Removes a ticket whose caller gave up (lock held)."""
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._update_depth()
+        self._condition.notify_all()
+        metrics.increment(f"scheduler.{self.name}.queue_timeouts")
+        event("scheduler.queue_timeout", level=logging.WARNING, bucket=self.name, tenant=ticket.tenant,
+              priority=PRIORITY_NAMES[ticket.priority], queued=len(self._queue))
+        return QueueTimeoutError(f"no {self.name} rate-limit slot within the deadline ({len(self._queue)} requests queued)")
+
+    def acquire(self, tokens=1, timeout=None, tenant=DEFAULT_TENANT, priority=INTERACTIVE):
+        """Blocks until the request may be sent. Returns seconds waited; raises QueueTimeoutError after timeout."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            ticket = self._enqueue(tenant, priority, tokens)
+            while True:
+                wait_seconds = self._try_grant(ticket)
+                if wait_seconds == 0.0:
+                    return time.monotonic() - ticket.enqueued
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise self._abandon(ticket)
+                if wait_seconds is None: # Not at the head: woken when the head is granted or leaves
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait(wait_seconds if remaining is None else min(wait_seconds, remaining))
+
+    async def aacquire(self, tokens=1, timeout=None, tenant=DEFAULT_TENANT, priority=INTERACTIVE):
+        """Async version of acquire(): waits without blocking the event loop."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            ticket = self._enqueue(tenant, priority, tokens)
+        try:
+            while True:
+                with self._condition:
+                    wait_seconds = self._try_grant(ticket)
+                if wait_seconds == 0.0:
+                    return time.monotonic() - ticket.enqueued
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    with self._condition:
+                        raise self._abandon(ticket)
+                sleep_seconds = min(wait_seconds or ASYNC_POLL_SECONDS, ASYNC_POLL_SECONDS * 10)
+                await asyncio.sleep(sleep_seconds if remaining is None else min(sleep_seconds, remaining))
+        except asyncio.CancelledError:
+            with self._condition:
+                if not ticket.granted:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._update_depth()
+                    self._condition.notify_all()
+            raise
+
+    def try_acquire(self, tokens=1, tenant=DEFAULT_TENANT, priority=INTERACTIVE):
+        """Takes a slot only if nobody is queued and the buckets have room right now (used for hedged requests)."""
+        with self._condition:
+            if self._queue:
+                return False
+            ticket = self._enqueue(tenant, priority, tokens)
+            if self._try_grant(ticket) == 0.0:
+                return True
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._update_depth()
+            return False
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Corrects the TPM bucket once a response reports its real usage (may leave it in debt). The request was
+        charged _cost(estimated_tokens) up front, so that is what the real usage is reconciled against."""
+        if self.token_bucket is not None and actual_tokens:
+            with self._condition:
+                self.token_bucket.tokens -= actual_tokens - self._cost(estimated_tokens)
+
+    def stats(self):
+        with self._condition:
+            waiting = {}
+            for ticket in self._queue:
+                waiting[PRIORITY_NAMES[ticket.priority]] = waiting.get(PRIORITY_NAMES[ticket.priority], 0) + 1
+            return {"queued": len(self._queue), "waiting": waiting, "tenants": len({ticket.tenant for ticket in self._queue})}
+
+
+# --- Process-wide scheduler in front of every API call (see resilient_client) ---
+class RequestScheduler:
+    """One BucketScheduler per API bucket, with the tenant and priority taken from the current scope()."""
+
+    def __init__(self, limits=None, weights=None):
+        self.weights = dict(weights or {})
+        self.buckets = {}
+        self.configure(limits or DEFAULT_RATE_LIMITS)
+
+    def configure(self, limits):
+        """Replaces the limits of the given buckets, e.g. {"chat": (60, 40000)}. Requests already queued keep waiting
+        in the old bucket's queue."""
+        for name, (rpm, tpm) in limits.items():
+            self.buckets[name] = BucketScheduler(name, rpm, tpm, self.weights)
+
+    def set_weight(self, tenant, weight):
+        """Gives tenant `weight` times the share of a weight-1 tenant when the quota is contended."""
+        self.weights[tenant] = float(weight)
+
+    def _bucket(self, endpoint_name):
+        return self.buckets.get(ENDPOINT_BUCKETS.get(endpoint_name, endpoint_name)) if SCHEDULER_ENABLED else None
+
+    @staticmethod
+    def estimate_tokens(kwargs):
+        """TPM cost counted up front, like the API does: prompt tokens plus the completion limit."""
+        messages = kwargs.get("messages")
+        if not messages:
+            return 1
+        return estimate_message_tokens(messages) + (kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+    def acquire(self, endpoint_name, kwargs, timeout=None):
+        """Waits for a slot for one request to endpoint_name. Returns the estimated tokens it was charged."""
+        bucket = self._bucket(endpoint_name)
+        if bucket is None:
+            return 0
+        tokens = self.estimate_tokens(kwargs)
+        tenant, priority = current_scope()
+        bucket.acquire(tokens, timeout, tenant, priority)
+        return tokens
+
+    async def aacquire(self, endpoint_name, kwargs, timeout=None):
+        bucket = self._bucket(endpoint_name)
+        if bucket is None:
+            return 0
+        tokens = self.estimate_tokens(kwargs)
+        tenant, priority = current_scope()
+        await bucket.aacquire(tokens, timeout, tenant, priority)
+        return tokens
+
+    def try_acquire(self, endpoint_name, kwargs):
+        bucket = self._bucket(endpoint_name)
+        if bucket is None:
+            return True
+        tenant, priority = current_scope()
+        return bucket.try_acquire(self.estimate_tokens(kwargs), tenant, priority)
+
+    def settle(self, endpoint_name, estimated_tokens, result):
+        """Charges the real token usage of a non-streamed chat response."""
+        bucket = self._bucket(endpoint_name)
+        usage = getattr(result, "usage", None)
+        if bucket is not None and usage is not None and isinstance(getattr(usage, "total_tokens", None), int):
+            bucket.settle(estimated_tokens, usage.total_tokens)
+
+    def stats(self):
+        """{bucket: {queued, waiting per priority, tenants}} for the UI."""
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+
+default_scheduler = RequestScheduler({**DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv("SPEAKGENIE_RATE_LIMITS", ""))},
+                                     parse_weights(os.getenv("SPEAKGENIE_TENANT_WEIGHTS", "")))
@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import state_backend
+from instrumentation import event
+
+# --- Session History Configuration ---
+AUDIO_MEMORY_BYTES = int(os.getenv("SPEAKGENIE_AUDIO_MEMORY_BYTES", str(32 * 1024 * 1024))) # Hot clips kept in RAM (per process)
+AUDIO_DISK_BYTES = int(os.getenv("SPEAKGENIE_AUDIO_DISK_BYTES", str(512 * 1024 * 1024))) # Spilled clips kept on disk (per process)
+AUDIO_SPILL_DIR = os.getenv("SPEAKGENIE_AUDIO_SPILL_DIR") # Default: a private temp directory created on first spill
+
+
+# --- Bounded audio store (memory LRU, spilling to disk) ---
+class AudioStore:
+    """Holds reply audio out of session state, addressed by a content-hash clip id.
+    Recent clips stay in a byte-bounded in-memory LRU; older clips are spilled to disk, and the oldest
+    spilled clips are dropped once the disk budget is used up (their replay button then disappears).
+    With a shared state backend clips are mirrored there too, so a session restored on another worker can still replay them."""
+
+    def __init__(self, max_memory_bytes=AUDIO_MEMORY_BYTES, max_disk_bytes=AUDIO_DISK_BYTES, spill_dir=AUDIO_SPILL_DIR, backend=None):
+        backend = backend or state_backend.default_backend
+        self.backend = backend if backend.shared else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.spill_dir = spill_dir
+        self._memory = OrderedDict() # clip_id -> audio bytes, least recently used first
+        self._memory_bytes = 0
+        self._disk = OrderedDict() # clip_id -> file size, oldest first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def clip_id_for(audio_bytes):
+        """Content hash, so the same greeting played in many sessions is stored once."""
+        return hashlib.sha256(audio_bytes).hexdigest()[:32]
+
+    def _spill_path(self, clip_id):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="speakgenie-audio-")
+        return os.path.join(self.spill_dir, clip_id + ".audio")
+
+    def put(self, audio_bytes):
+        """Stores audio bytes and returns their clip id."""
+        clip_id = self.clip_id_for(audio_bytes)
+        with self._lock:
+            if clip_id in self._memory:
+                self._memory.move_to_end(clip_id)
+                return clip_id
+            if clip_id in self._disk:
+                return clip_id
+            self._memory[clip_id] = bytes(audio_bytes)
+            self._memory_bytes += len(audio_bytes)
+            self._evict_memory()
+        if self.backend is not None:
+            self.backend.set("audio", clip_id, audio_bytes, state_backend.SESSION_TTL_SECONDS)
+        return clip_id
+
+    def get(self, clip_id):
+        """Returns the audio bytes for clip_id, or None if it has been evicted."""
+        with self._lock:
+            audio_bytes = self._memory.get(clip_id)
+            if audio_bytes is not None:
+                self._memory.move_to_end(clip_id)
+                return audio_bytes
+            if clip_id in self._disk:
+                try:
+                    with open(self._spill_path(clip_id), "rb") as audio_file:
+                        return audio_file.read() # Served from disk; not promoted, old turns are rarely replayed twice
+                except OSError:
+                    self._disk_bytes -= self._disk.pop(clip_id)
+        if self.backend is None:
+            return None
+        audio_bytes = self.backend.get("audio", clip_id) # Stored by another worker (or before a restart)
+        if audio_bytes is not None:
+            self._keep_in_memory(clip_id, audio_bytes) # Replays (and the next has_audio check) stay local
+        return audio_bytes
+
+    def _keep_in_memory(self, clip_id, audio_bytes):
+        with self._lock:
+            if clip_id not in self._memory and clip_id not in self._disk:
+                self._memory[clip_id] = audio_bytes
+                self._memory_bytes += len(audio_bytes)
+                self._evict_memory()
+
+    def __contains__(self, clip_id):
+        with self._lock:
+            return clip_id in self._memory or clip_id in self._disk
+
+    def _evict_memory(self):
+        """Spills least recently used clips to disk until the memory tier is within budget (lock held)."""
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            clip_id, audio_bytes = self._memory.popitem(last=False)
+            self._memory_bytes -= len(audio_bytes)
+            if len(audio_bytes) > self.max_disk_bytes:
+                continue
+            path = self._spill_path(clip_id)
+            try:
+                temp_path = path + ".tmp"
+                with open(temp_path, "wb") as audio_file:
+                    audio_file.write(audio_bytes)
+                os.replace(temp_path, path)
+            except OSError as e:
+                event("audio_store.spill_error", level=logging.WARNING, clip_id=clip_id, error=str(e))
+                continue
+            self._disk[clip_id] = len(audio_bytes)
+            self._disk_bytes += len(audio_bytes)
+            while self._disk_bytes > self.max_disk_bytes:
+                old_clip_id, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                try:
+                    os.remove(self._spill_path(old_clip_id))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_clips": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_clips": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+# Process-wide store shared by every session (clips are content-addressed)
+default_audio_store = AudioStore()
+
+
+# --- Compact per-session history ---
+class ConversationHistory:
+    """Text turns and audio kept apart. `messages` is a plain list of {"role", "content"} dicts that is handed
+    to core_tutor as-is (it is already the LLM view, nothing to copy or strip); audio lives in an AudioStore
+    and messages only reference it by clip id."""
+    __slots__ = ("messages", "audio_ids", "audio_store", "speech_stats")
+
+    def __init__(self, audio_store=None):
+        self.messages = []
+        self.audio_ids = {} # message index -> clip id
+        self.speech_stats = {} # user message index -> speech_analytics stats of the recording (for teacher dashboards)
+        self.audio_store = audio_store or default_audio_store
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        """Yields (message, clip_id or None) in order, for display."""
+        for index, message in enumerate(self.messages):
+            yield message, self.audio_ids.get(index)
+
+    def append(self, role, content, audio_bytes=None):
+        self.messages.append({"role": role, "content": content})
+        if audio_bytes:
+            self.set_audio(len(self.messages) - 1, audio_bytes)
+
+    def set_audio(self, index, audio_bytes):
+        """Attaches audio to the message at index (negative indexes count from the end). Returns the clip id."""
+        if index < 0:
+            index += len(self.messages)
+        clip_id = self.audio_ids[index] = self.audio_store.put(audio_bytes)
+        return clip_id
+
+    def set_speech_stats(self, index, stats):
+        if index < 0:
+            index += len(self.messages)
+        self.speech_stats[index] = stats
+
+    def audio_for(self, clip_id):
+        return self.audio_store.get(clip_id) if clip_id else None
+
+    def has_audio(self, clip_id):
+        """Whether clip_id can still be played. Local clips are checked without reading them; others are fetched
+        from the shared backend (and kept locally), so a clip evicted everywhere loses its player."""
+        if clip_id is None:
+            return False
+        return clip_id in self.audio_store or self.audio_store.get(clip_id) is not None
+
+    def to_state(self):
+        """JSON-serializable snapshot (text and clip ids only; the audio stays in the AudioStore)."""
+        return {"messages": self.messages, "audio_ids": {str(index): clip_id for index, clip_id in self.audio_ids.items()},
+                "speech_stats": {str(index): stats for index, stats in self.speech_stats.items()}}
+
+    @classmethod
+    def from_state(cls, state, audio_store=None):
+        history = cls(audio_store)
+        history.messages = list(state.get("messages", []))
+        history.audio_ids = {int(index): clip_id for index, clip_id in state.get("audio_ids", {}).items()}
+        history.speech_stats = {int(index): stats for index, stats in state.get("speech_stats", {}).items()}
+        return history
+
+    def pop(self):
+        """Removes and returns the last message (e.g. a "Transcribing..." placeholder)."""
+        self.audio_ids.pop(len(self.messages) - 1, None)
+        self.speech_stats.pop(len(self.messages) - 1, None)
+        return self.messages.pop()
+
+    def clear(self):
+        self.messages = []
+        self.audio_ids = {}
+        self.speech_stats = {}
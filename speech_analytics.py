@@ -0,0 +1,132 @@
+import io
+import wave
+
+import audio_preprocessing as ap
+from instrumentation import span
+
+# --- Speech Analytics Configuration ---
+ANALYSIS_FRAME_MS = 20
+MIN_SPEECH_MS = 250 # Less voiced audio than this counts as a silent recording (never sent to Whisper)
+PAUSE_MIN_MS = 250 # Gaps between words shorter than this are articulation, not pauses
+CLIP_LEVEL = 0.99 # Samples at or above this fraction of full scale count as clipped
+CLIPPING_WARN_RATIO = 0.001
+QUIET_DBFS = -35.0 # Speech quieter than this gets a "speak up" hint
+SLOW_WPM = 60 # Children's conversational speech is roughly 90-150 words per minute
+FAST_WPM = 170
+MANY_PAUSES_RATIO = 0.4
+
+
+# --- PCM decoding (no FFmpeg needed) ---
+def samples_from_pcm(pcm_bytes, sample_width=2, channels=1):
+    """Converts interleaved PCM to mono float32 samples in [-1, 1]."""
+    import numpy as np # Loaded on the first analyzed turn, not at server start (see benchmarks/bench_import_time.py)
+
+    if sample_width == 1: # 8-bit WAV is unsigned
+        samples = (np.frombuffer(pcm_bytes, dtype=np.uint8).astype(np.float32) - 128) / 128
+    else:
+        dtype = {2: "<i2", 4: "<i4"}[sample_width]
+        usable = len(pcm_bytes) - len(pcm_bytes) % (sample_width * channels)
+        samples = np.frombuffer(pcm_bytes[:usable], dtype=dtype).astype(np.float32) / float(2 ** (8 * sample_width - 1))
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+# --- Frame-wise analysis ---
+def analyze_samples(samples, sample_rate, frame_ms=ANALYSIS_FRAME_MS):
+    """Fluency and recording-quality stats for one recording, from frame-wise RMS and zero-crossing rates.
+    Returns a JSON-ready dict; `silent` is True when it holds too little speech to transcribe."""
+    import numpy as np
+
+    with span("audio.analyze", input_ms=round(len(samples) * 1000 / sample_rate)) as stage:
+        frame_length = max(1, sample_rate * frame_ms // 1000)
+        frame_count = len(samples) // frame_length
+        stats = {"duration_ms": round(len(samples) * 1000 / sample_rate), "speech_ms": 0, "pause_ms": 0, "pause_ratio": 0.0,
+                 "pauses": 0, "longest_pause_ms": 0, "loudness_dbfs": -100.0, "peak_dbfs": -100.0, "clipping_ratio": 0.0,
+                 "zero_crossing_rate": 0.0, "silent": True}
+        if frame_count == 0:
+            stage.set(silent=True)
+            return stats
+
+        frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+        frame_rms = np.sqrt(np.mean(frames * frames, axis=1))
+        frame_dbfs = 20 * np.log10(np.maximum(frame_rms, 1e-5)) # -100 dBFS for digital silence
+        frame_zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        # Same threshold rule as audio_preprocessing's VAD, so "silent" here means Whisper would get nothing useful
+        overall_dbfs = 20 * np.log10(max(float(np.sqrt(np.mean(frames * frames))), 1e-5))
+        voiced = frame_dbfs >= max(ap.VAD_MIN_THRESHOLD_DBFS, overall_dbfs - ap.VAD_RELATIVE_THRESHOLD_DB)
+
+        peak = float(np.max(np.abs(samples)))
+        stats["peak_dbfs"] = round(20 * float(np.log10(max(peak, 1e-5))), 1)
+        stats["clipping_ratio"] = round(float(np.mean(np.abs(samples) >= CLIP_LEVEL)), 5)
+        voiced_indexes = np.flatnonzero(voiced)
+        if len(voiced_indexes) * frame_ms < MIN_SPEECH_MS:
+            stage.set(silent=True, peak_dbfs=stats["peak_dbfs"])
+            return stats
+
+        # Silent runs between the first and last voiced frame; only the long ones are pauses
+        first, last = voiced_indexes[0], voiced_indexes[-1]
+        edges = np.diff(np.concatenate(([1], voiced[first:last + 1].astype(np.int8), [1])))
+        gap_frames = np.flatnonzero(edges == 1) - np.flatnonzero(edges == -1)
+        pause_frames = gap_frames[gap_frames * frame_ms >= PAUSE_MIN_MS]
+        span_frames = last - first + 1
+        stats.update(
+            speech_ms=int((span_frames - pause_frames.sum()) * frame_ms),
+            pause_ms=int(pause_frames.sum() * frame_ms),
+            pause_ratio=round(float(pause_frames.sum() / span_frames), 3),
+            pauses=len(pause_frames),
+            longest_pause_ms=int(pause_frames.max() * frame_ms) if len(pause_frames) else 0,
+            loudness_dbfs=round(10 * float(np.log10(np.mean(frame_rms[voiced] ** 2))), 1),
+            zero_crossing_rate=round(float(frame_zcr[voiced].mean()), 3), # Higher = more hiss/fricatives, lower = more voicing
+            silent=False,
+        )
+        stage.set(silent=False, speech_ms=stats["speech_ms"], pauses=stats["pauses"])
+        return stats
+
+def analyze_pcm(pcm_bytes, sample_rate, sample_width=2, channels=1):
+    return analyze_samples(samples_from_pcm(pcm_bytes, sample_width, channels), sample_rate)
+
+def analyze_segment(segment):
+    """Stats for a pydub AudioSegment, e.g. what the Streamlit audiorecorder returns."""
+    return analyze_pcm(segment.raw_data, segment.frame_rate, segment.sample_width, segment.channels)
+
+def analyze_wav(wav_bytes):
+    """Stats for in-memory WAV bytes, e.g. what ct.record_audio returns in the console app."""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
+        return analyze_pcm(wav_file.readframes(wav_file.getnframes()), wav_file.getframerate(),
+                           wav_file.getsampwidth(), wav_file.getnchannels())
+
+
+# --- Per-turn feedback ---
+def add_speaking_rate(stats, transcript):
+    """Adds words per minute once the transcript is known (over speech time, long pauses excluded)."""
+    words = len(transcript.split()) if transcript else 0
+    stats["words"] = words
+    stats["words_per_minute"] = round(words * 60000 / stats["speech_ms"]) if stats.get("speech_ms") else None
+    return stats
+
+def fluency_notes(stats):
+    """Short, child-friendly hints for one turn (empty when everything looks fine)."""
+    notes = []
+    if stats.get("clipping_ratio", 0) > CLIPPING_WARN_RATIO:
+        notes.append("Your voice was so loud it crackled - try moving a little away from the microphone.")
+    elif stats.get("loudness_dbfs", 0) < QUIET_DBFS:
+        notes.append("Try speaking a little louder.")
+    words_per_minute = stats.get("words_per_minute")
+    if words_per_minute and stats.get("words", 0) >= 5: # Rates of one- or two-word answers mean nothing
+        if words_per_minute > FAST_WPM:
+            notes.append("Great energy! Try slowing down a little so every word is clear.")
+        elif words_per_minute < SLOW_WPM:
+            notes.append("Try to keep your words flowing together.")
+    if stats.get("pause_ratio", 0) > MANY_PAUSES_RATIO and stats.get("pauses", 0) >= 2:
+        notes.append("Lots of long pauses - it's fine to think first, then say the whole sentence.")
+    return notes
+
+def describe(stats):
+    """One-line summary for the chat view."""
+    parts = []
+    if stats.get("words_per_minute"):
+        parts.append(f"{stats['words_per_minute']} words/min")
+    parts.append(f"{stats['pause_ratio']:.0%} pauses")
+    parts.append(f"loudness {stats['loudness_dbfs']:.0f} dBFS")
+    return " · ".join(parts + fluency_notes(stats))
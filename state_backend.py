@@ -0,0 +1,311 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+from instrumentation import event, metrics
+
+# --- State Backend Configuration ---
+# memory:// (this process only), sqlite:///path/to/state.db (processes on one host) or redis://host:6379/0 (any host)
+STATE_URL = os.getenv("SPEAKGENIE_STATE_URL", "memory://")
+SESSION_TTL_SECONDS = 7 * 24 * 60 * 60 # Idle learner sessions (and their reply audio) are forgotten after a week
+SHARED_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60 # TTS clips are content-addressed, so they can live long
+REDIS_KEY_PREFIX = "speakgenie:"
+REDIS_TIMEOUT_SECONDS = 2.0
+PURGE_EVERY = 500 # Writes between sweeps of expired entries (memory and SQLite backends)
+
+
+class StateBackendError(Exception):
+    """A backend could not be reached or returned an error."""
+
+
+class RedisReplyError(StateBackendError):
+    """An error reply from the Redis server; unlike a broken or garbled connection, reconnecting won't help."""
+
+
+class StateBackend:
+    """Namespaced key -> bytes store with optional TTLs. get/set/delete never raise: a broken backend
+    degrades to cache misses (and an event), never to a failed turn. `shared` tells callers whether
+    other processes see the same data (if not, mirroring a local cache into it is pointless)."""
+    shared = False
+    name = "backend"
+
+    def get(self, namespace, key):
+        """Returns the stored bytes, or None if missing, expired or the backend failed."""
+        try:
+            value = self._get(namespace, key)
+        except (OSError, ValueError, sqlite3.Error, StateBackendError) as e:
+            self._error("get", namespace, e)
+            return None
+        metrics.increment(f"state.{namespace}.{'hits' if value is not None else 'misses'}")
+        return value
+
+    def set(self, namespace, key, value, ttl_seconds=None):
+        """Stores bytes under (namespace, key). Returns False if the backend failed."""
+        try:
+            self._set(namespace, key, bytes(value), ttl_seconds)
+            return True
+        except (OSError, ValueError, sqlite3.Error, StateBackendError) as e:
+            self._error("set", namespace, e)
+            return False
+
+    def delete(self, namespace, key):
+        try:
+            self._delete(namespace, key)
+        except (OSError, ValueError, sqlite3.Error, StateBackendError) as e:
+            self._error("delete", namespace, e)
+
+    def _error(self, operation, namespace, error):
+        metrics.increment(f"state.{namespace}.errors")
+        event("state.error", level=logging.WARNING, backend=self.name, operation=operation, namespace=namespace, error=str(error))
+
+    def close(self):
+        pass
+
+
+# --- In-process backend (default: one worker, nothing shared) ---
+class MemoryBackend(StateBackend):
+    name = "memory"
+
+    def __init__(self):
+        self._items = {} # (namespace, key) -> (value, expires_at or None)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, namespace, key):
+        with self._lock:
+            item = self._items.get((namespace, key))
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.time():
+                del self._items[(namespace, key)]
+                return None
+            return item[0]
+
+    def _set(self, namespace, key, value, ttl_seconds):
+        with self._lock:
+            now = time.time()
+            self._items[(namespace, key)] = (value, now + ttl_seconds if ttl_seconds else None)
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                self._items = {item_key: item for item_key, item in self._items.items() if item[1] is None or item[1] > now}
+
+    def _delete(self, namespace, key):
+        with self._lock:
+            self._items.pop((namespace, key), None)
+
+
+# --- SQLite backend (several worker processes on one host, survives restarts) ---
+class SQLiteBackend(StateBackend):
+    """One table in a WAL-mode SQLite file, so readers in other processes never block on a writer.
+    Each thread gets its own connection."""
+    shared = True
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL") # Durable enough for caches and sessions, much faster
+            connection.execute("CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                               "value BLOB NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+            self._local.connection = connection
+        return connection
+
+    def _get(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())).fetchone()
+        return bytes(row[0]) if row else None
+
+    def _set(self, namespace, key, value, ttl_seconds):
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                           (namespace, key, value, time.time() + ttl_seconds if ttl_seconds else None))
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            connection.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def _delete(self, namespace, key):
+        self._connection().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+# --- Redis-protocol backend (workers on any host; also works with the local stand-in) ---
+class RespConnection:
+    """Minimal RESP2 client: enough for GET/SET/DEL/PING/AUTH/SELECT, no dependency on redis-py."""
+
+    def __init__(self, host, port, timeout=REDIS_TIMEOUT_SECONDS):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def command(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise StateBackendError("connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RedisReplyError(payload.decode("utf-8", "replace"))
+        try:
+            if kind == b":":
+                return int(payload)
+            if kind == b"$":
+                length = int(payload)
+                if length < 0:
+                    return None
+                data = self.reader.read(length + 2)
+                if len(data) != length + 2:
+                    raise StateBackendError("connection closed by server mid-reply")
+                return data[:-2]
+            if kind == b"*":
+                count = int(payload)
+                return None if count < 0 else [self._read_reply() for _ in range(count)]
+        except ValueError:
+            raise StateBackendError(f"malformed RESP reply {line[:20]!r}") from None
+        raise StateBackendError(f"unexpected RESP reply {line[:20]!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend(StateBackend):
+    """Keys are "speakgenie:<namespace>:<key>". One connection per thread, re-opened once after a network error."""
+    shared = True
+    name = "redis"
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, prefix=REDIS_KEY_PREFIX):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = RespConnection(self.host, self.port)
+            if self.password:
+                connection.command("AUTH", self.password)
+            if self.db:
+                connection.command("SELECT", self.db)
+            self._local.connection = connection
+        return connection
+
+    def _command(self, *args):
+        for attempt in range(2):
+            try:
+                return self._connection().command(*args)
+            except (OSError, StateBackendError) as e:
+                if isinstance(e, RedisReplyError):
+                    raise # The connection is still in sync; retrying won't help
+                # Closed, truncated or garbled: the stream is out of sync, so never reuse this connection
+                connection = getattr(self._local, "connection", None)
+                if connection is not None:
+                    connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{key}"
+
+    def _get(self, namespace, key):
+        return self._command("GET", self._key(namespace, key))
+
+    def _set(self, namespace, key, value, ttl_seconds):
+        if ttl_seconds:
+            self._command("SET", self._key(namespace, key), value, "PX", int(ttl_seconds * 1000))
+        else:
+            self._command("SET", self._key(namespace, key), value)
+
+    def _delete(self, namespace, key):
+        self._command("DEL", self._key(namespace, key))
+
+    def ping(self):
+        return self._command("PING") == "PONG"
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def backend_from_url(url):
+    """memory://, sqlite:///relative.db, sqlite:////absolute/path.db or redis://[:password@]host[:port][/db]."""
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryBackend()
+    if parsed.scheme == "sqlite":
+        return SQLiteBackend(unquote(parsed.path[1:] if parsed.path.startswith("/") else parsed.path) or "speakgenie_state.db")
+    if parsed.scheme == "redis":
+        return RedisBackend(parsed.hostname or "127.0.0.1", parsed.port or 6379,
+                            int(parsed.path.lstrip("/") or 0), unquote(parsed.password) if parsed.password else None)
+    raise ValueError(f"Unsupported SPEAKGENIE_STATE_URL {url!r} (use memory://, sqlite:///... or redis://...)")
+
+
+# Process-wide backend shared by the TTS cache, response cache, audio store and session store
+default_backend = backend_from_url(STATE_URL)
+
+
+# --- Learner sessions ---
+class SessionStore:
+    """Learner session snapshots (settings, text history, clip ids) as JSON in a StateBackend, so a learner
+    can be served by any worker and a session survives a restart."""
+    NAMESPACE = "session"
+
+    def __init__(self, backend=None, ttl_seconds=SESSION_TTL_SECONDS):
+        self.backend = backend or default_backend
+        self.ttl_seconds = ttl_seconds
+
+    def save(self, session_id, state):
+        return self.backend.set(self.NAMESPACE, session_id, json.dumps(state, ensure_ascii=False).encode("utf-8"), self.ttl_seconds)
+
+    def load(self, session_id):
+        """Returns the saved state dict, or None (unknown, expired or unreadable)."""
+        value = self.backend.get(self.NAMESPACE, session_id)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def delete(self, session_id):
+        self.backend.delete(self.NAMESPACE, session_id)
+
+
+default_session_store = SessionStore()
@@ -1,21 +1,52 @@
 import streamlit as st
 import os
 import io 
-import base64 
 import time 
-import copy 
+import uuid
+from urllib.parse import urlencode
 
 # Import audiorecorder
 from audiorecorder import audiorecorder
 
 # Import core tutor functions from core_tutor.py
 import core_tutor as ct 
-from openai import OpenAI 
+from scenario_registry import registry as scenario_registry
+from response_cache import default_response_cache
+from history_manager import HistoryManager
+from session_history import ConversationHistory
+import media_server
+import audio_preprocessing as ap
+import speech_analytics
+import resilient_client
+import turn_jobs
+import instrumentation
+import asset_pipeline
+import lesson_pack
+import scheduler
+import state_backend
+
+script_run_start = time.perf_counter() # Measures how long each Streamlit rerun takes to render
 
 # --- Page Configuration ---
 # Set layout to 'wide' to utilize full screen width for chat
 st.set_page_config(page_title="SpeakGenie AI Voice Tutor Demo", layout="wide")
 
+# --- Structured logging (JSON lines on stderr, level from SPEAKGENIE_LOG_LEVEL) ---
+@st.cache_resource
+def configure_logging():
+    instrumentation.configure_logging()
+
+configure_logging()
+
+# --- Process-wide OpenAI client (one shared HTTP connection pool for every session) ---
+@st.cache_resource
+def get_shared_openai_client(api_key):
+    """Creates the OpenAI client once per server process; all learners reuse its connections.
+    Retries are handled by resilient_client (deadlines, backoff, hedging), so the SDK's own are off."""
+    from openai import OpenAI # Imported with the first client (the SDK is the slowest import of a cold start)
+
+    return resilient_client.wrap(OpenAI(api_key=api_key, max_retries=0))
+
 # --- Session State Initialization ---
 # This block runs once when the app starts or when session state is cleared
 if "openai_api_key_loaded" not in st.session_state:
@@ -24,8 +55,8 @@ if "openai_api_key_loaded" not in st.session_state:
     
     if st.session_state.openai_api_key:
         try:
-            # Initialize OpenAI client and store it in session state for persistence
-            st.session_state.openai_client = OpenAI(api_key=st.session_state.openai_api_key)
+            # Reference the shared OpenAI client from session state for convenience
+            st.session_state.openai_client = get_shared_openai_client(st.session_state.openai_api_key)
             st.session_state.openai_api_key_loaded = True
         except Exception as e:
             st.session_state.openai_api_key_loaded = False
@@ -39,91 +70,198 @@ if not st.session_state.openai_api_key_loaded:
     st.info("Please set your OPENAI_API_KEY in the `.env` file in your project directory to run this app.")
     st.stop() # Stop the app if API key isn't loaded/validly initialized
 
+# --- Process-wide TTS cache warm-up (runs once per server process, not per session) ---
+@st.cache_resource(show_spinner="Preparing SpeakGenie's voice...")
+def warm_up_tts_cache(_client):
+    """Pre-renders greetings, farewells and Store replies so they never wait on a TTS call."""
+    return ct.warm_up_tts_cache(_client)
+
+warm_up_tts_cache(st.session_state.openai_client)
+
 # Initialize other session state variables for conversation and UI
+# Text turns only; reply audio lives in the bounded shared AudioStore and is referenced by clip id
 if "conversation_history" not in st.session_state:
-    st.session_state.conversation_history = [] 
+    st.session_state.conversation_history = ConversationHistory()
+
+# Per-learner tutor state (language, mode, scenario, client); the HistoryManager keeps prompt size bounded
+if "tutor_session" not in st.session_state:
+    st.session_state.tutor_session = ct.TutorSession(st.session_state.openai_client, history_manager=HistoryManager())
 
 if "current_mode" not in st.session_state:
     st.session_state.current_mode = "Free Chat" 
 
 if "current_ai_language" not in st.session_state:
     st.session_state.current_ai_language = "English" 
-    ct.set_global_language("English") # Set initial global language in core_tutor module
+    st.session_state.tutor_session.set_language("English") # Set initial language for this learner's session
 
 if "selected_roleplay_scenario" not in st.session_state:
     st.session_state.selected_roleplay_scenario = None
 
+BACK_TO_MENU = "back_to_menu" # Pseudo scenario key for the "Back to Main Menu" option
+
 # For preventing re-processing of the same audio segment on reruns
 if "last_processed_audio_id" not in st.session_state:
     st.session_state.last_processed_audio_id = None
 
+# Error of the last turn, if it failed; the same recording is only sent again when the learner clicks Retry
+if "failed_turn_error" not in st.session_state:
+    st.session_state.failed_turn_error = None
+
+# Handle of this learner's turn running on the shared background executor (None when idle)
+if "turn_job" not in st.session_state:
+    st.session_state.turn_job = None
+
+# Clip that should start playing on its own the next time it is rendered (the newest reply)
+if "autoplay_clip_id" not in st.session_state:
+    st.session_state.autoplay_clip_id = None
+
+# (job id, clips played, playback end) of a reply whose first sentence started playing while the turn still ran
+if "early_audio" not in st.session_state:
+    st.session_state.early_audio = None
+
+# Rest of that reply (later sentences and the translation), played once right after the chat when the turn is applied
+if "autoplay_tail" not in st.session_state:
+    st.session_state.autoplay_tail = None
+
+# Farewell shown (and played) once after an exit, on top of the fresh screen
+if "farewell" not in st.session_state:
+    st.session_state.farewell = None
+
+TURN_POLL_SECONDS = 0.5 # How often the UI checks a running turn for progress
+
+# --- Learner session persistence (SPEAKGENIE_STATE_URL; lets any worker serve the learner, survives restarts) ---
+def save_learner_state():
+    """Saves this learner's settings and text history to the shared session store (clip ids only, no audio)."""
+    state_backend.default_session_store.save(st.session_state.learner_session_id, {
+        "mode": st.session_state.current_mode,
+        "language": st.session_state.current_ai_language,
+        "roleplay_scenario": st.session_state.selected_roleplay_scenario,
+        "tutor": st.session_state.tutor_session.to_state(),
+        "conversation": st.session_state.conversation_history.to_state(),
+    })
+
+# The session id travels in the URL (?sid=...), so a reload or a request routed to another worker finds the session again
+if "learner_session_id" not in st.session_state:
+    learner_session_id = st.query_params.get("sid")
+    saved_state = state_backend.default_session_store.load(learner_session_id) if learner_session_id else None
+    if saved_state:
+        st.session_state.current_mode = saved_state.get("mode", st.session_state.current_mode)
+        st.session_state.current_ai_language = saved_state.get("language", st.session_state.current_ai_language)
+        st.session_state.selected_roleplay_scenario = saved_state.get("roleplay_scenario")
+        st.session_state.tutor_session.restore_state(saved_state.get("tutor", {}))
+        st.session_state.conversation_history = ConversationHistory.from_state(saved_state.get("conversation", {}))
+    else:
+        learner_session_id = uuid.uuid4().hex
+        st.query_params["sid"] = learner_session_id
+    st.session_state.learner_session_id = learner_session_id
+
+# API quota is shared fairly per classroom (?classroom=...) or, without one, per learner session
+st.session_state.tutor_session.tenant = st.query_params.get("classroom") or st.session_state.learner_session_id
+
 # --- Helper function to display and play audio in Streamlit ---
-def display_and_play_audio(audio_bytes, filename="ai_response.mp3"):
+def audio_source(clip_id, audio_bytes=None):
+    """URL of a stored clip on the media server, so reruns send a short URL instead of the MP3 bytes
+    (falls back to the bytes when SPEAKGENIE_MEDIA_URL is not set or the server could not start)."""
+    url = media_server.clip_url(clip_id)
+    if url is not None:
+        return url
+    return audio_bytes if audio_bytes is not None else st.session_state.conversation_history.audio_for(clip_id)
+
+def display_and_play_audio(audio_bytes):
     """Displays an audio player and attempts to play audio automatically."""
-    st.audio(audio_bytes, format="audio/mp3") 
+    clip_id = st.session_state.conversation_history.audio_store.put(audio_bytes)
+    st.audio(audio_source(clip_id, audio_bytes), format="audio/mp3", autoplay=True) 
+
+def cancel_turn_job():
+    """Abandons this learner's running turn (its results are dropped), e.g. when the mode changes."""
+    if st.session_state.turn_job is not None:
+        st.session_state.turn_job.cancel()
+        st.session_state.turn_job = None
+
+def finish_turn(job):
+    """Applies a finished background turn to the session: history, audio, exit handling."""
+    conversation = st.session_state.conversation_history
+    early_audio, st.session_state.early_audio = st.session_state.early_audio, None
+    # The recording stays marked as processed: the recorder returns it on every rerun, so clearing the id
+    # would resubmit it over and over
+    if job.stage == turn_jobs.FAILED:
+        st.session_state.failed_turn_error = job.error # Shown with a Retry button until the learner acts
+        return
+    if job.stage == turn_jobs.NO_SPEECH: # Caught before Whisper, so nothing was spent on it; the child records again
+        st.warning("I couldn't hear anything in that recording. Please try again, a little closer to the microphone.")
+        return
+    if not job.transcript:
+        conversation.append("user", "Could not transcribe audio.")
+        conversation.append("assistant", "I apologize, I could not understand your audio. Please try again.")
+        attach_speech_stats(job)
+        return
+    if job.is_exit:
+        # Reset conversation history and selected scenario on full exit; the farewell plays on the fresh screen
+        st.session_state.farewell = (job.reply_text, job.reply_audio)
+        conversation.clear()
+        st.session_state.tutor_session.reset_history()
+        st.session_state.selected_roleplay_scenario = None
+        return
+    if len(conversation) <= job.history_length: # No reply was added to the history
+        conversation.append("user", job.transcript)
+        conversation.append("assistant", "I apologize, I could not generate a response.")
+    elif job.reply_audio:
+        # Kept in the AudioStore for replay via widget, and played right away (or only the part that did not
+        # already play while the turn was running)
+        clip_id = conversation.set_audio(-1, job.reply_audio)
+        if early_audio is not None and early_audio[0] == job.id:
+            st.session_state.autoplay_tail = b"".join(job.clips()[early_audio[1]:]) or None
+        else:
+            st.session_state.autoplay_clip_id = clip_id
+    else:
+        # Add specific message for no audio generated
+        conversation.append("assistant", "I apologize, I could not generate audio for the response.")
+    attach_speech_stats(job)
+
+def attach_speech_stats(job):
+    """Keeps the recording's fluency stats with the learner's message (saved with the session for teacher dashboards)."""
+    if job.speech_stats is not None and len(st.session_state.conversation_history) > job.history_length:
+        st.session_state.conversation_history.set_speech_stats(job.history_length, job.speech_stats)
+
+# Apply a turn that finished in the background since the last run
+if st.session_state.turn_job is not None and st.session_state.turn_job.done:
+    finished_job = st.session_state.turn_job
+    st.session_state.turn_job = None
+    finish_turn(finished_job)
+    save_learner_state()
+    instrumentation.maybe_export_metrics() # Refresh metrics.prom / metrics.json if SPEAKGENIE_METRICS_DIR is set
+
+# --- Pre-generated lesson packs (scripted turns play without any API call) ---
+@st.cache_resource(show_spinner=False)
+def load_lesson_packs():
+    """Loads every pack in lesson_packs/ (built with `python lesson_pack.py build <script>`) once per server process."""
+    lesson_pack.load_lesson_packs()
+    return lesson_pack.default_library.stats()
+
+load_lesson_packs()
+
+# --- Background images (resized once per process and served as cacheable static files) ---
+@st.cache_resource(show_spinner=False)
+def build_background_assets():
+    """Runs the asset pipeline once per server process: display-sized WebP/JPEG backgrounds in static/."""
+    return asset_pipeline.build_all_backgrounds(scenario_registry)
 
-# --- NEW: Function to get background CSS ---
 def get_background_css(image_path):
-    """Generates CSS to set a background image with a dark overlay for better text readability."""
-    if not os.path.exists(image_path):
+    """Returns the (memoized) CSS that sets the scenario background with a dark overlay for better text readability."""
+    asset = build_background_assets().get(image_path)
+    if asset is None:
         st.warning(f"Background image not found: {image_path}. Using default background.")
         return ""
-
-    with open(image_path, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode()
-
-    css = f"""
-    <style>
-    .stApp {{
-        background-image: url("data:image/jpeg;base64,{encoded_string}");
-        background-size: cover;
-        background-position: center center;
-        background-repeat: no-repeat;
-        background-attachment: fixed;
-        /* Add a dark, semi-transparent overlay */
-        background-color: rgba(0, 0, 0, 0.6); /* Adjust the alpha value (0 to 1) for darkness */
-        background-blend-mode: overlay; /* Blends the overlay with the image */
-    }}
-    /* Ensure all text elements have white color and a text shadow */
-    h1, h2, h3, h4, h5, h6, .stMarkdown, .stSelectbox, .stRadio, .stButton, .stTextInput, label {{
-        color: white !important;
-        text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.8); /* Slightly darker shadow */
-    }}
-    .stMarkdown div ul li {{ /* For list items */
-        color: white !important;
-    }}
-    .stMarkdown div p {{ /* For paragraphs */
-        color: white !important;
-    }}
-    .stAudioRecorder button span {{
-        color: white !important;
-    }}
-    /* Keep the chat container semi-transparent */
-    .stContainer {{
-        background-color: rgba(0, 0, 0, 0.6) !important;
-        border-radius: 10px;
-        padding: 20px;
-    }}
-    </style>
-    """
-    return css
+    if st.get_option("server.enableStaticServing"):
+        return asset_pipeline.background_css(asset)
+    return asset_pipeline.inline_background_css(image_path) # Static serving disabled: inline, but still encoded only once
 
 # --- Apply dynamic background based on current mode/scenario ---
-current_bg_image = ""
-if st.session_state.current_mode == "Free Chat":
-    current_bg_image = "backgrounds/free_chat_bg.jpg"
-elif st.session_state.current_mode == "Roleplay Mode":
-    if st.session_state.selected_roleplay_scenario == '1': # School
-        current_bg_image = "backgrounds/classroom_bg.jpg"
-    elif st.session_state.selected_roleplay_scenario == '2': # Store
-        current_bg_image = "backgrounds/shop_bg.jpg"
-    elif st.session_state.selected_roleplay_scenario == '3': # Home
-        current_bg_image = "backgrounds/home_bg.jpg"
-    else: # Default for roleplay selection screen
-        current_bg_image = "backgrounds/roleplay_selection_bg.jpg" 
+current_scenario = scenario_registry.for_mode(st.session_state.current_mode, st.session_state.selected_roleplay_scenario)
+current_bg_image = current_scenario.background or ""
     
-# Apply the CSS if an image path is determined and exists
-if current_bg_image and os.path.exists(current_bg_image):
+# Apply the CSS if an image path is determined
+if current_bg_image:
     st.markdown(get_background_css(current_bg_image), unsafe_allow_html=True)
 else:
     st.warning("No specific background image set for this mode/scenario or image not found. Using default Streamlit background. Please ensure images are in the 'backgrounds/' folder.")
@@ -154,16 +292,21 @@ with col2: # Place content in the middle column
 st.sidebar.header("Tutor Settings")
 
 # Mode Selection Radio Buttons
+mode_options = ("Free Chat", "Roleplay Mode")
 mode_selection = st.sidebar.radio(
     "Choose Mode:",
-    ("Free Chat", "Roleplay Mode")
+    mode_options,
+    index=mode_options.index(st.session_state.current_mode) # Follows restored sessions and "Back to Main Menu"
 )
 
 # Handle mode change: reset history, selected scenario, and rerun
 if mode_selection != st.session_state.current_mode:
     st.session_state.current_mode = mode_selection
-    st.session_state.conversation_history = [] # Reset history when mode changes
+    cancel_turn_job()
+    st.session_state.conversation_history.clear() # Reset history when mode changes
+    st.session_state.tutor_session.reset_history()
     st.session_state.selected_roleplay_scenario = None # Reset scenario
+    save_learner_state()
     st.rerun() # Force rerun to update UI based on new mode
 
 st.sidebar.markdown("---")
@@ -180,9 +323,39 @@ selected_language = st.sidebar.selectbox(
 # Handle language change: update global variable in core_tutor and provide success message
 if selected_language != st.session_state.current_ai_language:
     st.session_state.current_ai_language = selected_language
-    ct.set_global_language(selected_language) 
+    st.session_state.tutor_session.set_language(selected_language) 
+    save_learner_state()
     st.sidebar.success(f"AI language set to {selected_language}!")
 
+# Opt-in: answer repeated Free Chat questions from the shared response cache (skips GPT and TTS)
+reuse_answers = st.sidebar.checkbox(
+    "Reuse answers to common questions",
+    value=st.session_state.tutor_session.response_cache is not None,
+    help="Free Chat only. Frequent questions like 'what is the sun?' are answered instantly from earlier replies."
+)
+st.session_state.tutor_session.response_cache = default_response_cache if reuse_answers else None
+if reuse_answers:
+    st.sidebar.caption(f"Answer reuse hit rate: {default_response_cache.stats()['hit_rate']:.0%}")
+
+# Per-stage latency of this server process (all learners)
+with st.sidebar.expander("Performance"):
+    stage_summary = instrumentation.metrics.summary()["stages"]
+    if stage_summary:
+        st.table({
+            stage: {"count": stats["count"], "p50 ms": round(stats["p50"] * 1000), "p95 ms": round(stats["p95"] * 1000), "p99 ms": round(stats["p99"] * 1000)}
+            for stage, stats in stage_summary.items()
+        })
+    else:
+        st.caption("No turns measured yet.")
+    st.caption("API circuits: " + ", ".join(f"{endpoint} {state}" for endpoint, state in resilient_client.status().items()))
+    st.caption("API queues: " + ", ".join(f"{bucket} {stats['queued']} waiting" for bucket, stats in scheduler.default_scheduler.stats().items()))
+
+# Hands-free mode runs as its own WebSocket server (`python duplex_voice.py serve`)
+duplex_url = os.getenv("SPEAKGENIE_DUPLEX_URL")
+if duplex_url:
+    duplex_query = urlencode({"language": st.session_state.current_ai_language, "scenario": current_scenario.key})
+    st.sidebar.markdown(f"[🎙️ Hands-free voice mode]({duplex_url}?{duplex_query}) — just talk, no record button")
+
 st.sidebar.markdown("---")
 st.sidebar.info(
     "To record your input, select ""click to record"" button . "
@@ -195,12 +368,8 @@ st.header(f"Mode: {st.session_state.current_mode}")
 # Roleplay Scenario Selection (only if in Roleplay Mode and no scenario selected yet)
 if st.session_state.current_mode == "Roleplay Mode" and st.session_state.selected_roleplay_scenario is None:
     st.subheader("Select a roleplay scenario:")
-    scenario_options = {
-        "1": "At School (Talk to a teacher or friend)",
-        "2": "At the Store (Talk to a shopkeeper)",
-        "3": "At Home (Talk to a family member)",
-        "4": "Back to Main Menu" 
-    }
+    scenario_options = {scenario.key: scenario.label for scenario in scenario_registry.roleplay_scenarios()}
+    scenario_options[BACK_TO_MENU] = "Back to Main Menu"
     scenario_choice = st.radio("Choose a scenario:", list(scenario_options.values()), key="scenario_selector")
     
     # Handle scenario start button click
@@ -210,54 +379,91 @@ if st.session_state.current_mode == "Roleplay Mode" and st.session_state.selecte
                 st.session_state.selected_roleplay_scenario = key
                 break
         
-        if st.session_state.selected_roleplay_scenario == '4': # Back to Main Menu selected
+        if st.session_state.selected_roleplay_scenario == BACK_TO_MENU: # Back to Main Menu selected
             st.session_state.current_mode = "Free Chat" 
-            st.session_state.conversation_history = [] # Clear history when returning to main menu
+            cancel_turn_job()
+            st.session_state.conversation_history.clear() # Clear history when returning to main menu
+            st.session_state.tutor_session.reset_history()
             st.session_state.selected_roleplay_scenario = None
+            save_learner_state()
             st.rerun() # Rerun to switch mode and clear chat
         else:
-            # Define scenario context and initial greetings
-            scenario_context_map = {
-                '1': "At School: You are talking to a friendly teacher or a classmate about your day or a school topic.",
-                '2': "At the Store: You are buying something from a helpful shopkeeper. Focus on asking for items and quantities.",
-                '3': "At Home: You are talking to a kind family member (e.g., parent/sibling) about your activities or plans for the day."
-            }
-            initial_greetings_map = {
-                '1': "Good morning! Welcome to school today. What are you working on?",
-                '2': "Welcome! How can I help you today? Are you looking for anything special?",
-                '3': "Hi there! What are you up to today? Anything exciting happening at home?"
-            }
-            
-            st.session_state.roleplay_context = scenario_context_map.get(st.session_state.selected_roleplay_scenario, "")
-            initial_ai_greeting_text = initial_greetings_map.get(st.session_state.selected_roleplay_scenario, "Hello!")
-
-            # Add initial AI greeting to history and generate/play audio
-            st.session_state.conversation_history.append({"role": "assistant", "content": initial_ai_greeting_text})
-            try:
-                response_stream = st.session_state.openai_client.audio.speech.create(
-                    model="tts-1", voice="alloy", input=initial_ai_greeting_text, response_format="mp3"
-                )
-                initial_greeting_audio_bytes = response_stream.read()
-                display_and_play_audio(initial_greeting_audio_bytes) 
-                st.session_state.conversation_history[-1]["audio"] = initial_greeting_audio_bytes 
-            except Exception as e:
-                st.error(f"Error generating or playing initial roleplay greeting audio: {e}")
+            # Persona, greeting and background come from the scenario registry (scenarios.json)
+            selected_scenario = scenario_registry.get(st.session_state.selected_roleplay_scenario)
+            st.session_state.tutor_session.set_scenario(selected_scenario.key)
+            # Add initial AI greeting (plus its cached translation) to history and generate/play audio
+            with scheduler.scope(st.session_state.tutor_session.tenant):
+                initial_ai_greeting_text, initial_greeting_audio_bytes = ct.speak_static_phrase(st.session_state.tutor_session, selected_scenario.greeting)
+            st.session_state.conversation_history.append("assistant", initial_ai_greeting_text)
+            if initial_greeting_audio_bytes:
+                # Played by the history view after the rerun below (rendering it here would be thrown away)
+                st.session_state.autoplay_clip_id = st.session_state.conversation_history.set_audio(-1, initial_greeting_audio_bytes)
+            else:
+                st.error("Error generating or playing initial roleplay greeting audio.")
+            save_learner_state()
 
             st.rerun() # Rerun to start roleplay chat interface
 
 # Display Conversation History (full screen width due to layout="wide")
 chat_placeholder = st.container(border=True) 
+
+if st.session_state.farewell:
+    farewell_text, farewell_audio = st.session_state.farewell
+    st.session_state.farewell = None
+    st.markdown(f"**SpeakGenie:** {farewell_text}")
+    if farewell_audio:
+        display_and_play_audio(farewell_audio)
  
 with chat_placeholder:
-    for message in st.session_state.conversation_history:
+    conversation = st.session_state.conversation_history
+    running_job = st.session_state.turn_job
+    # While a turn runs, its worker appends to the history; only render what existed before it started
+    visible_messages = running_job.history_length if running_job is not None else len(conversation)
+    for index, (message, clip_id) in enumerate(conversation):
+        if index >= visible_messages:
+            break
         if message["role"] == "user":
             st.markdown(f"**You:** {message['content']}")
+            speech_stats = conversation.speech_stats.get(index)
+            if speech_stats is not None:
+                st.caption(speech_analytics.describe(speech_stats))
         elif message["role"] == "assistant":
             st.markdown(f"**SpeakGenie:** {message['content']}")
-            if "audio" in message and message["audio"] is not None:
-                st.audio(message["audio"], format="audio/mp3") 
+            if conversation.has_audio(clip_id): # Not once the clip has been evicted from the AudioStore
+                autoplay = clip_id == st.session_state.autoplay_clip_id
+                clip_source = audio_source(clip_id)
+                if clip_source is not None:
+                    st.audio(clip_source, format="audio/mp3", autoplay=autoplay) 
+    st.session_state.autoplay_clip_id = None
+    if st.session_state.autoplay_tail:
+        display_and_play_audio(st.session_state.autoplay_tail)
+        st.session_state.autoplay_tail = None
+
+# --- Progress of the running turn (polled; the script thread never waits on the API) ---
+@st.fragment(run_every=TURN_POLL_SECONDS)
+def show_turn_progress():
+    job = st.session_state.turn_job
+    early_audio = st.session_state.early_audio
+    if early_audio is not None and (job is None or early_audio[0] != job.id):
+        early_audio = st.session_state.early_audio = None
+    # A full rerun would remove the early player mid-sentence, so it waits until that clip has played
+    if job is None or (job.done and (early_audio is None or time.monotonic() >= early_audio[2])):
+        st.rerun() # Full rerun: apply the finished turn and refresh the chat
+    st.markdown(f"**You:** {job.transcript or 'Transcribing...'}")
+    if job.stage == turn_jobs.TRANSCRIBED:
+        st.markdown("**SpeakGenie:** _Thinking..._")
+    elif job.stage in (turn_jobs.RESPONDING, turn_jobs.RESPONDED, turn_jobs.AUDIO_READY):
+        st.markdown(f"**SpeakGenie:** {job.reply_text or '...'}")
+    clips = job.clips()
+    if early_audio is None and clips and job.stage == turn_jobs.RESPONDING: # First English sentence ready, the rest still rendering
+        duration_seconds = ap.mp3_duration_seconds(clips[0])
+        if duration_seconds is not None:
+            early_audio = st.session_state.early_audio = (job.id, 1, time.monotonic() + duration_seconds)
+    if early_audio is not None:
+        display_and_play_audio(clips[0]) # Same clip on every poll, so the player keeps going
 
 # --- Audio Recorder for User Input ---
+instrumentation.record_duration("ui.render", time.perf_counter() - script_run_start, messages=len(st.session_state.conversation_history))
 st.markdown("---")
 # audiorecorder widget for real-time input
 audio_segment = audiorecorder(
@@ -266,107 +472,28 @@ audio_segment = audiorecorder(
     key="audiorecorder_widget" # Key ensures widget identity across reruns
 )
 
+# A failed turn is retried on request only: every attempt pays for Whisper, GPT and TTS again
+if st.session_state.failed_turn_error and st.session_state.turn_job is None:
+    st.error(st.session_state.failed_turn_error)
+    if st.button("Retry this recording", key="retry_turn"):
+        st.session_state.failed_turn_error = None
+        st.session_state.last_processed_audio_id = None # Lets the check below submit the same recording again
+
 # Process audio input ONLY if a new, non-empty audio segment is recorded
 # This logic ensures processing happens once per unique recording
-if audio_segment.frame_count() > 0: 
+if audio_segment.frame_count() > 0 and st.session_state.turn_job is None: 
     current_audio_id = hash(audio_segment.raw_data) # Generate unique ID for current audio
     
     # Check if this audio segment has already been processed in the current session
     if st.session_state.last_processed_audio_id != current_audio_id:
         st.session_state.last_processed_audio_id = current_audio_id # Mark this audio as processed
+        st.session_state.failed_turn_error = None
 
-        # Add "Transcribing..." placeholder to history for immediate visual feedback
-        st.session_state.conversation_history.append({"role": "user", "content": "Transcribing..."})
-        
-        # Convert pydub AudioSegment to a temporary WAV file for Whisper
-        temp_audio_path = "temp_recorded_audio.wav"
-        try:
-            audio_segment.export(temp_audio_path, format="wav")
-        except Exception as e:
-            st.error(f"Error exporting recorded audio: {e}. Ensure FFmpeg is correctly installed and accessible.")
-            st.session_state.last_processed_audio_id = None # Clear ID to allow retry if export fails
-            st.rerun() # Rerun to display error
+        # Preprocess, transcribe, respond and speak on the shared background executor; progress is polled below
+        tutor_session = st.session_state.tutor_session
+        tutor_session.set_scenario(current_scenario.key)
+        st.session_state.turn_job = turn_jobs.submit_turn(tutor_session, st.session_state.conversation_history.messages, audio_segment)
 
-        # Transcribe audio using core_tutor function
-        transcribed_text = ct.transcribe_audio(st.session_state.openai_client, temp_audio_path)
-        
-        # Update user's last message in history with actual transcription
-        # Pop the "Transcribing..." and add the actual text
-        if st.session_state.conversation_history and st.session_state.conversation_history[-1]["content"] == "Transcribing...":
-            st.session_state.conversation_history[-1]["content"] = transcribed_text or "Could not transcribe audio."
-        else: # Fallback if Transcribing... was somehow missed (e.g., initial state)
-             st.session_state.conversation_history.append({"role": "user", "content": transcribed_text or "Could not transcribe audio."})
-
-        if transcribed_text:
-            # Check for exit commands
-            if ("goodbye" in transcribed_text.lower() or 
-                "exit" in transcribed_text.lower() or 
-                "exit roleplay" in transcribed_text.lower()):
-                
-                farewell_text = ""
-                if st.session_state.current_mode == "Free Chat":
-                    farewell_text = "Okay, goodbye for now! We can chat again anytime."
-                elif st.session_state.current_mode == "Roleplay Mode":
-                    farewell_text = "Okay, let's end this scenario. We can try another one, or go back to the main menu!"
-                
-                st.session_state.conversation_history.append({"role": "assistant", "content": farewell_text})
-                
-                try:
-                    response_stream = st.session_state.openai_client.audio.speech.create(
-                        model="tts-1", voice="alloy", input=farewell_text, response_format="mp3"
-                    )
-                    farewell_audio_bytes = response_stream.read()
-                    display_and_play_audio(farewell_audio_bytes) # Play farewell audio immediately
-                except Exception as e:
-                    st.error(f"Error playing farewell audio: {e}")
-                
-                time.sleep(3) # Give audio time to play before rerunning
-
-                # Reset conversation history and selected scenario on full exit
-                st.session_state.conversation_history = [] 
-                st.session_state.selected_roleplay_scenario = None
-                st.rerun() # Rerun to go back to mode/scenario selection or clear chat
-            
-            # If not an exit command, get AI response
-            else:
-                current_roleplay_context_for_gpt = ""
-                if st.session_state.current_mode == "Roleplay Mode" and st.session_state.selected_roleplay_scenario:
-                    scenario_context_map = { 
-                        '1': "At School: You are talking to a friendly teacher or a classmate about your day or a school topic.",
-                        '2': "At the Store: You are buying something from a helpful shopkeeper. Focus on asking for items and quantities.",
-                        '3': "At Home: You are talking to a kind family member (e.g., parent/sibling) about your activities or plans for the day."
-                    }
-                    current_roleplay_context_for_gpt = scenario_context_map.get(st.session_state.selected_roleplay_scenario, "")
-
-                # Call handle_conversation_turn with a COPY of conversation history for LLM (excluding audio bytes)
-                history_for_llm = copy.deepcopy(st.session_state.conversation_history)
-                for msg in history_for_llm:
-                    if "audio" in msg:
-                        del msg["audio"] 
-
-                ai_response_text, updated_history_from_ct, ai_audio_bytes = ct.handle_conversation_turn(
-                    st.session_state.openai_client, 
-                    transcribed_text, 
-                    history_for_llm, 
-                    st.session_state.current_mode.lower().replace(" ", "_"), 
-                    current_roleplay_context=current_roleplay_context_for_gpt
-                )
-                
-                # Update the actual session state history with text and potential audio for display
-                st.session_state.conversation_history = updated_history_from_ct 
-
-                if ai_response_text:
-                    if ai_audio_bytes:
-                        display_and_play_audio(ai_audio_bytes) # Play AI audio immediately here!
-                        st.session_state.conversation_history[-1]["audio"] = ai_audio_bytes # Store audio bytes in history for replay via widget
-                    else:
-                        st.session_state.conversation_history[-1]["audio"] = None # Mark no audio generated
-                        # Add specific message for no audio generated
-                        st.session_state.conversation_history.append({"role": "assistant", "content": "I apologize, I could not generate audio for the response."}) 
-                else:
-                    st.session_state.conversation_history.append({"role": "assistant", "content": "I apologize, I could not generate a response."})
-        else:
-            # If transcription failed
-            st.session_state.conversation_history.append({"role": "assistant", "content": "I apologize, I could not understand your audio. Please try again."})
-        
-        st.rerun() # Trigger a rerun to update the chat display and reset audiorecorder
\ No newline at end of file
+if st.session_state.turn_job is not None:
+    with chat_placeholder:
+        show_turn_progress()
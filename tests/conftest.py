@@ -0,0 +1,12 @@
+"""Shared test setup: project modules on sys.path, and every cache pointed at a throwaway directory so tests
+never read or write the real .tts_cache or talk to a configured state backend."""
+import os
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+os.environ["SPEAKGENIE_TTS_CACHE_DIR"] = tempfile.mkdtemp(prefix="speakgenie-test-tts-")
+os.environ["SPEAKGENIE_STATE_URL"] = "memory://"
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import pytest
+
+import async_tutor
+import core_tutor as ct
+import state_backend
+import tts_cache
+from benchmarks.fake_openai_server import FakeServerConfig, start_fake_server
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def fake_server():
+    config = FakeServerConfig(time_scale=0.02, seed=1)
+    server, base_url = start_fake_server(config)
+    yield config, base_url
+    server.shutdown()
+
+def make_session(**kwargs):
+    return ct.TutorSession(None, response_cache=ResponseCache(backend=state_backend.MemoryBackend()), **kwargs)
+
+def chat_request_count(config):
+    return config.request_counts.get("/v1/chat/completions", 0)
+
+async def stream_turn(tutor, session, text):
+    return [sentence async for sentence in tutor.stream_conversation_turn(session, text)]
+
+
+@pytest.mark.parametrize("first_turn", ["handle", "stream"])
+def test_async_stream_uses_and_fills_the_response_cache(fake_server, tmp_path, first_turn):
+    config, base_url = fake_server
+    session = make_session()
+
+    async def main():
+        async with async_tutor.AsyncTutor(api_key="test-key", base_url=base_url,
+                                          cache=tts_cache.TTSCache(cache_dir=str(tmp_path))) as tutor:
+            if first_turn == "handle":
+                await tutor.handle_conversation_turn(session, "What is the sun made of?")
+            else:
+                await stream_turn(tutor, session, "What is the sun made of?")
+            chat_requests = chat_request_count(config)
+            replay = await stream_turn(tutor, make_session_sharing(session), "What is the sun made of?")
+            return chat_requests, replay
+
+    chat_requests, replay = asyncio.run(main())
+    assert chat_requests >= 1
+    assert chat_request_count(config) == chat_requests # Answered from the cache: no GPT call
+    assert len(replay) == 1 and replay[0][1] # Cached reply text with its audio
+    assert session.response_cache.stats()["exact_hits"] == 1
+
+def make_session_sharing(session):
+    """A second learner in the same mode/language/scenario, sharing the first one's response cache."""
+    return ct.TutorSession(None, response_cache=session.response_cache)
+
+
+class SlowCache(tts_cache.TTSCache):
+    """A TTS cache whose backend takes 200 ms per lookup, like a slow Redis."""
+
+    def get(self, key):
+        time.sleep(0.2)
+        return super().get(key)
+
+def test_cache_io_does_not_block_the_event_loop(fake_server, tmp_path):
+    _, base_url = fake_server
+    ticks = []
+
+    async def ticker():
+        for _ in range(10):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        async with async_tutor.AsyncTutor(api_key="test-key", base_url=base_url, cache=SlowCache(cache_dir=str(tmp_path))) as tutor:
+            async def synthesize_while_ticking():
+                await asyncio.sleep(0.02)
+                await tutor.synthesize_speech_bytes("Hello there, friend!")
+
+            await asyncio.gather(ticker(), synthesize_while_ticking())
+
+    asyncio.run(main())
+    assert max(later - earlier for earlier, later in zip(ticks, ticks[1:])) < 0.15
@@ -0,0 +1,42 @@
+import core_tutor as ct
+
+
+def feed_all(deltas):
+    splitter = ct.BilingualSentenceSplitter()
+    ready = []
+    for delta in deltas:
+        ready += splitter.feed(delta)
+    return ready + splitter.flush()
+
+
+def test_english_then_native_sentences():
+    reply = "Hello there, my friend! What is your name today? ### नमस्ते मेरे दोस्त! आज आपका नाम क्या है?"
+    expected = [("Hello there, my friend!", ct.ENGLISH_SEGMENT),
+                ("What is your name today?", ct.ENGLISH_SEGMENT),
+                ("नमस्ते मेरे दोस्त!", ct.NATIVE_SEGMENT),
+                ("आज आपका नाम क्या है?", ct.NATIVE_SEGMENT)]
+    assert feed_all([reply]) == expected
+    assert feed_all(list(reply)) == expected # Same result however the stream is chunked
+
+def test_separator_split_across_deltas():
+    ready = feed_all(["Let us count to three", "#", "## एक दो ", "तीन"])
+    assert ready == [("Let us count to three", ct.ENGLISH_SEGMENT), ("एक दो तीन", ct.NATIVE_SEGMENT)]
+
+def test_english_is_released_as_soon_as_the_separator_arrives():
+    splitter = ct.BilingualSentenceSplitter()
+    assert splitter.feed("Nice to meet you") == [] # Unfinished sentence, held back
+    assert splitter.feed(" ###") == [("Nice to meet you", ct.ENGLISH_SEGMENT)]
+
+def test_reply_without_translation_stays_english():
+    assert feed_all(["Great job today! ", "See you soon."]) == [("Great job today!", ct.ENGLISH_SEGMENT),
+                                                               ("See you soon.", ct.ENGLISH_SEGMENT)]
+
+def test_short_fragments_merge_with_the_next_sentence():
+    sentences, remainder = ct.split_complete_sentences("Hi! How are you doing today? I am")
+    assert sentences == ["Hi! How are you doing today?"]
+    assert remainder == "I am"
+
+def test_split_bilingual():
+    assert ct.split_bilingual("Hello! ### नमस्ते!") == ("Hello!", "नमस्ते!")
+    assert ct.split_bilingual("Hello!") == ("Hello!", "")
+    assert ct.format_bilingual("Hello!", "नमस्ते!") == "Hello! (नमस्ते!)"
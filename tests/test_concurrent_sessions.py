@@ -0,0 +1,97 @@
+"""Two learners with different languages and scenarios taking turns at the same time must never see each
+other's history, language or audio (the per-session state that replaced core_tutor's module globals)."""
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import core_tutor as ct
+from history_manager import HistoryManager
+
+TURNS = 6
+
+
+class StubOpenAI:
+    """Answers like GPT would, but deterministically from the request: the reply names the language and mode
+    the prompt asked for and echoes the learner's words; TTS "audio" is the spoken text itself."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.audio = SimpleNamespace(speech=SimpleNamespace(create=self._speech))
+
+    @staticmethod
+    def _pause():
+        time.sleep(random.uniform(0, 0.005)) # Let the other learner's thread interleave
+
+    def _chat(self, model, messages, stream=False, timeout=None, **kwargs):
+        self._pause()
+        prompt = " ".join(message["content"] for message in messages if message["role"] == "system")
+        language = re.search(r"translated into (\w+)", prompt).group(1)
+        mode = "roleplay" if "Roleplay Mode" in prompt else "chat"
+        user_text = messages[-1]["content"] if messages[-1]["role"] == "user" else messages[-2]["content"]
+        reply = f"You said {user_text} in {mode} mode.\n###\n[{language}] {user_text}"
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=None)
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=reply[start:start + 7]))])
+                     for start in range(0, len(reply), 7)])
+
+    def _speech(self, model, voice, input, response_format="mp3", timeout=None, **kwargs):
+        self._pause()
+        return SimpleNamespace(read=lambda: f"<audio {input}>".encode("utf-8"))
+
+
+LEARNERS = {
+    "asha": {"language": "Hindi", "scenario_key": ct.FREE_CHAT, "mode": "chat"},
+    "kavin": {"language": "Tamil", "scenario_key": "2", "mode": "roleplay"},
+}
+
+def run_learner(name, turn_function, barrier):
+    settings = LEARNERS[name]
+    session = ct.TutorSession(StubOpenAI(), language=settings["language"], scenario_key=settings["scenario_key"],
+                              history_manager=HistoryManager())
+    audio = []
+    barrier.wait() # Both learners start together
+    for turn in range(TURNS):
+        audio.append(turn_function(session, f"{name} question {turn} about planets"))
+    return session, audio
+
+def handle_turn(session, text):
+    _, _, audio_bytes = ct.handle_conversation_turn(session, text)
+    return audio_bytes
+
+def stream_turn(session, text):
+    return b"".join(audio_bytes or b"" for _, audio_bytes in ct.stream_conversation_turn(session, text))
+
+
+@pytest.mark.parametrize("turn_function", [handle_turn, stream_turn], ids=["handle", "stream"])
+def test_parallel_sessions_do_not_cross_talk(turn_function):
+    barrier = threading.Barrier(len(LEARNERS))
+    with ThreadPoolExecutor(max_workers=len(LEARNERS)) as pool:
+        futures = {name: pool.submit(run_learner, name, turn_function, barrier) for name in LEARNERS}
+        results = {name: future.result(timeout=60) for name, future in futures.items()}
+
+    for name, (session, audio) in results.items():
+        other = next(other_name for other_name in LEARNERS if other_name != name)
+        settings, other_settings = LEARNERS[name], LEARNERS[other]
+        assert session.language == settings["language"]
+        assert session.mode == settings["mode"]
+
+        # History: exactly this learner's turns, in order, answered in this learner's language and mode
+        assert [message["content"] for message in session.history if message["role"] == "user"] == \
+               [f"{name} question {turn} about planets" for turn in range(TURNS)]
+        replies = [message["content"] for message in session.history if message["role"] == "assistant"]
+        assert len(replies) == TURNS
+        for turn, reply in enumerate(replies):
+            assert f"{name} question {turn}" in reply
+            assert f"in {settings['mode']} mode" in reply
+            assert f"[{settings['language']}]" in reply
+            assert other not in reply and f"[{other_settings['language']}]" not in reply
+
+        # Audio: every clip speaks this learner's own reply
+        for turn, audio_bytes in enumerate(audio):
+            assert f"{name} question {turn}".encode() in audio_bytes
+            assert other.encode() not in audio_bytes
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+
+import pytest
+import tornado.httpclient
+import tornado.httpserver
+import tornado.netutil
+import tornado.websocket
+
+import core_tutor as ct
+import duplex_voice
+
+TRANSCRIPTS = {} # Length of the fed PCM -> what "Whisper" hears
+
+
+def utterance(text):
+    """PCM of a distinct length for each transcript (the VAD is bypassed, so the content does not matter)."""
+    pcm_bytes = bytes(duplex_voice.FRAME_BYTES * (20 + len(TRANSCRIPTS)))
+    TRANSCRIPTS[len(pcm_bytes)] = text
+    return pcm_bytes
+
+
+class ScriptedStream:
+    """Stands in for ct.stream_conversation_turn: two sentences per reply, the first reply held at `hold_at`
+    ("before_audio" or "after_first_clip") until release() is called."""
+
+    def __init__(self, hold_at):
+        self.hold_at = hold_at
+        self.transcripts = []
+        self.held = threading.Event()
+        self.gate = threading.Event()
+
+    def release(self):
+        self.gate.set()
+
+    def __call__(self, session, user_input_text, history):
+        self.transcripts.append(user_input_text)
+        first = len(self.transcripts) == 1
+        if first and self.hold_at == "before_audio":
+            self.held.set()
+            self.gate.wait(5)
+        yield ct.SpokenSentence(f"You said: {user_input_text}.", b"mp3-1")
+        if first and self.hold_at == "after_first_clip":
+            self.held.set()
+            self.gate.wait(5)
+        yield ct.SpokenSentence("Tell me more!", b"mp3-2")
+        history.append({"role": "user", "content": user_input_text})
+        history.append({"role": "assistant", "content": f"You said: {user_input_text}. Tell me more!"})
+
+
+@pytest.fixture
+def duplex(monkeypatch):
+    monkeypatch.setattr(duplex_voice, "utterance_for_whisper", lambda pcm_bytes: pcm_bytes)
+    monkeypatch.setattr(ct, "transcribe_audio", lambda client_obj, pcm_bytes: TRANSCRIPTS[len(pcm_bytes)])
+    messages = []
+    session = duplex_voice.DuplexSession(ct.TutorSession(object()), messages.append)
+    session.messages = messages
+    return session
+
+def wait_for_reply(duplex):
+    reply = duplex._reply
+    assert reply.finished.wait(5)
+    return reply
+
+
+def test_pause_before_any_audio_is_not_a_barge_in(duplex, monkeypatch):
+    stream = ScriptedStream(hold_at="before_audio")
+    monkeypatch.setattr(ct, "stream_conversation_turn", stream)
+    duplex._on_utterance(utterance("I want to buy"))
+    assert stream.held.wait(5) # First reply is waiting on GPT, nothing played yet
+
+    duplex._on_speech_start() # The child carries on after a pause
+    duplex._on_utterance(utterance("a red pen"))
+    stream.release()
+    wait_for_reply(duplex)
+
+    assert not [message for message in duplex.messages if isinstance(message, dict) and message["type"] == "barge_in"]
+    assert stream.transcripts == ["I want to buy", "I want to buy a red pen"]
+    assert duplex.history == [{"role": "user", "content": "I want to buy a red pen"},
+                              {"role": "assistant", "content": "You said: I want to buy a red pen. Tell me more!"}]
+
+def test_speech_during_reply_audio_barges_in(duplex, monkeypatch):
+    stream = ScriptedStream(hold_at="after_first_clip")
+    monkeypatch.setattr(ct, "stream_conversation_turn", stream)
+    duplex._on_utterance(utterance("What is the moon"))
+    assert stream.held.wait(5) # First clip sent, second one pending
+    first_reply = duplex._reply
+
+    duplex._on_speech_start()
+    stream.release()
+    assert first_reply.finished.wait(5)
+
+    assert first_reply.cancelled
+    assert {"type": "barge_in", "reply": first_reply.id} in duplex.messages
+    assert duplex.history == [{"role": "user", "content": "What is the moon"},
+                              {"role": "assistant", "content": "You said: What is the moon. …"}]
+
+    duplex._on_utterance(utterance("Is it cheese"))
+    wait_for_reply(duplex)
+    assert stream.transcripts == ["What is the moon", "Is it cheese"] # Nothing carried over after audio was heard
+
+
+# --- WebSocket origin check ---
+async def connect(port, origin):
+    headers = {"Origin": origin} if origin else {}
+    request = tornado.httpclient.HTTPRequest(f"ws://127.0.0.1:{port}/duplex", headers=headers)
+    connection = await tornado.websocket.websocket_connect(request)
+    ready = await connection.read_message()
+    connection.close()
+    return ready
+
+async def check_origins(origins):
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+    server = tornado.httpserver.HTTPServer(duplex_voice.make_app(object()))
+    server.add_sockets(sockets)
+    port = sockets[0].getsockname()[1]
+    results = {}
+    try:
+        for origin in origins:
+            try:
+                results[origin] = '"ready"' in await connect(port, origin)
+            except tornado.httpclient.HTTPClientError as e:
+                results[origin] = e.code
+    finally:
+        server.stop()
+    return results
+
+def test_websocket_refuses_other_sites():
+    results = asyncio.run(check_origins(["http://localhost:8501", "https://evil.example", None]))
+    assert results == {"http://localhost:8501": True, "https://evil.example": 403, None: True}
+
+def test_websocket_accepts_its_own_page():
+    async def own_page():
+        sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+        server = tornado.httpserver.HTTPServer(duplex_voice.make_app(object()))
+        server.add_sockets(sockets)
+        port = sockets[0].getsockname()[1]
+        try:
+            return '"ready"' in await connect(port, f"http://127.0.0.1:{port}")
+        finally:
+            server.stop()
+
+    assert asyncio.run(own_page())
@@ -0,0 +1,33 @@
+import pytest
+
+import intent_matcher as im
+
+SHOP = "2" # The shop roleplay has interceptor rules
+
+
+@pytest.mark.parametrize("text", ["Goodbye!", "ok exit", "EXIT ROLEPLAY please", "I want to exit now."])
+def test_exit_phrases(text):
+    assert im.intent_matcher.is_exit("free_chat", text)
+
+@pytest.mark.parametrize("text", ["This is so exciting", "goodbyeee", "texit", "maybe later"])
+def test_exit_needs_whole_words(text):
+    assert not im.intent_matcher.is_exit("free_chat", text)
+
+def test_plural_keyword_matches():
+    intent = im.intent_matcher.match(SHOP, "Where is the pets section?")
+    assert intent.kind == im.REPLY
+    assert intent.reply == im.intent_matcher.matchers[SHOP].replies["rule_3"]
+
+def test_keyword_inside_a_word_does_not_match():
+    intent = im.intent_matcher.match(SHOP, "Do you have a carpet?")
+    assert intent.reply == im.intent_matcher.matchers[SHOP].scenario.interceptor["fallback"]
+
+def test_no_trigger_goes_to_gpt():
+    assert im.intent_matcher.match(SHOP, "I like my pen") is None
+
+def test_interceptor_only_early_in_the_chat():
+    assert im.intent_matcher.match(SHOP, "Can I get a book?", history_length=0).kind == im.REPLY
+    assert im.intent_matcher.match(SHOP, "Can I get a book?", history_length=10) is None
+
+def test_exit_wins_over_interceptor():
+    assert im.intent_matcher.match(SHOP, "Can I get a pen? Goodbye").kind == im.EXIT
@@ -0,0 +1,115 @@
+import core_tutor as ct
+import lesson_pack
+import scheduler
+
+SCRIPT = {"name": "store_test", "languages": ["English"], "voice": "alloy",
+          "scenarios": {"2": ["I want to buy a red pen.", "How much is it?"]}}
+PEN_REPLY = "Here is a lovely red pen! It costs ten rupees."
+PRICE_REPLY = "It is ten rupees, please."
+GREETING = [{"role": "assistant", "content": "Welcome! How can I help you today?"}]
+
+
+def turn_entry(earlier, utterance, after_reply, reply):
+    return {"kind": lesson_pack.TURN, "scenario": "2", "language": "English", "voice": "alloy",
+            "earlier": earlier, "after_reply": after_reply, "utterance": utterance, "reply": reply}
+
+def make_library(tmp_path):
+    results = [(turn_entry([], "I want to buy a red pen.", None, PEN_REPLY), b"pen-audio"),
+               (turn_entry(["I want to buy a red pen."], "How much is it?", PEN_REPLY, PRICE_REPLY), b"price-audio")]
+    pack_path = tmp_path / SCRIPT["name"]
+    lesson_pack.write_lesson_pack(str(pack_path), SCRIPT, results)
+    library = lesson_pack.LessonLibrary()
+    library.add(lesson_pack.LessonPack(str(pack_path)))
+    return library
+
+def make_session(scenario_key="2", language="English"):
+    return ct.TutorSession(object(), language=language, scenario_key=scenario_key)
+
+def after(utterance, reply):
+    return GREETING + [{"role": "user", "content": utterance}, {"role": "assistant", "content": reply}]
+
+
+def test_opening_turn_with_the_scripted_words_is_answered_from_the_pack(tmp_path):
+    library = make_library(tmp_path)
+    assert library.lookup_turn(make_session(), "Um, I want to buy a RED pen", GREETING) == (PEN_REPLY, b"pen-audio")
+    assert library.lookup_turn(make_session(), "I want to buy a red pen.", []) == (PEN_REPLY, b"pen-audio")
+
+def test_later_scripted_turns_are_answered_while_the_conversation_follows_the_script(tmp_path):
+    library = make_library(tmp_path)
+    history = after("I want to buy a red pen!", PEN_REPLY)
+    assert library.lookup_turn(make_session(), "How much is it", history) == (PRICE_REPLY, b"price-audio")
+
+def test_later_turns_go_to_gpt_once_the_conversation_left_the_script(tmp_path):
+    library = make_library(tmp_path)
+    assert library.lookup_turn(make_session(), "How much is it?", GREETING) is None # Skipped the first line
+    assert library.lookup_turn(make_session(), "How much is it?", after("Do you have crayons?", "Sorry, no crayons today.")) is None
+    assert library.lookup_turn(make_session(), "How much is it?", after("I want to buy a red pen.", "Red pens are sold out.")) is None
+    assert library.lookup_turn(make_session(), "I want to buy a red pen.", after("Hello!", "Hi!")) is None
+
+def test_rewordings_are_not_answered_from_the_pack(tmp_path):
+    library = make_library(tmp_path)
+    for utterance in ("buy red pen", "I want to buy a red pen and a book", "I don't want to buy a red pen"):
+        assert library.lookup_turn(make_session(), utterance, GREETING) is None
+
+def test_other_scenarios_and_languages_do_not_match(tmp_path):
+    library = make_library(tmp_path)
+    assert library.lookup_turn(make_session(scenario_key="1"), "I want to buy a red pen.", []) is None
+    assert library.lookup_turn(make_session(language="Hindi"), "I want to buy a red pen.", []) is None
+
+def test_get_cached_response_passes_the_conversation_to_the_library(tmp_path, monkeypatch):
+    monkeypatch.setattr(lesson_pack, "default_library", make_library(tmp_path))
+    session = make_session()
+    assert ct.get_cached_response(session, "I want to buy a red pen.", GREETING) == (PEN_REPLY, b"pen-audio")
+    assert ct.get_cached_response(session, "How much is it?", after("I want to buy a red pen.", PEN_REPLY)) == (PRICE_REPLY, b"price-audio")
+    assert ct.get_cached_response(session, "I want to buy a red pen.", after("Hello!", "Hi!")) is None
+
+
+# --- Building a pack ---
+class FakeApi:
+    """Stands in for GPT and TTS during a build; records the history and scheduler scope of every GPT call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def gpt(self, session, user_input_text, history):
+        self.calls.append(([message["content"] for message in history], user_input_text, scheduler.current_scope()))
+        return f"Reply {len(self.calls)}."
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(ct, "get_gpt_response", self.gpt)
+        monkeypatch.setattr(ct, "synthesize_bilingual", lambda client_obj, english_text, native_text, **kwargs: english_text.encode())
+        monkeypatch.setattr(ct, "speak_static_phrase", lambda session, phrase: (phrase, b"static-audio"))
+
+def build(tmp_path, utterances, rebuild=False):
+    script = dict(SCRIPT, scenarios={"2": utterances})
+    return lesson_pack.build_lesson_pack(script, object(), str(tmp_path), workers=2, rebuild=rebuild)
+
+def test_build_plays_the_script_through_in_order(tmp_path, monkeypatch):
+    api = FakeApi()
+    api.install(monkeypatch)
+    greeting = ct.TutorSession(object(), scenario_key="2").scenario.greeting
+    intercepted = "Can I get a pen?" # Answered by the Store's interceptor at runtime
+    pack_path, built, reused, failed = build(tmp_path, [intercepted, "Hello!", "How much is it?", "Goodbye!", "Never asked."])
+
+    assert (reused, failed) == (0, 0)
+    assert [call[1] for call in api.calls] == ["Hello!", "How much is it?"] # Not the intercepted line, nor after the exit
+    pen_reply = ct.get_interceptor_reply(make_session(), intercepted, GREETING)
+    assert api.calls[0][0] == [greeting, intercepted, pen_reply]
+    assert api.calls[1][0] == [greeting, intercepted, pen_reply, "Hello!", "Reply 1."]
+    assert {call[2] for call in api.calls} == {(lesson_pack.LESSON_PACK_TENANT, scheduler.BACKGROUND)}
+
+    library = lesson_pack.LessonLibrary()
+    library.add(lesson_pack.LessonPack(pack_path))
+    conversation = GREETING + [{"role": "user", "content": intercepted}, {"role": "assistant", "content": pen_reply},
+                               {"role": "user", "content": "Hello!"}, {"role": "assistant", "content": "Reply 1."}]
+    assert library.lookup_turn(make_session(), "How much is it?", conversation) == ("Reply 2.", b"Reply 2.")
+
+def test_rebuild_reuses_the_unchanged_start_of_a_script(tmp_path, monkeypatch):
+    FakeApi().install(monkeypatch)
+    build(tmp_path, ["Hello!", "How much is it?"])
+    api = FakeApi()
+    api.install(monkeypatch)
+    pack_path, built, reused, failed = build(tmp_path, ["Hello!", "I want a book.", "How much is it?"])
+    assert [call[1] for call in api.calls] == ["I want a book.", "How much is it?"] # Its earlier turns changed
+    assert failed == 0
+    assert built == 2
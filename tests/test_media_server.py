@@ -0,0 +1,73 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+import media_server
+import session_history
+import state_backend
+
+CLIP = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def shared_backend(tmp_path):
+    return state_backend.backend_from_url(f"sqlite:///{tmp_path / 'state.db'}")
+
+@pytest.fixture
+def fresh_media_server(monkeypatch):
+    """Resets the process-wide server so each test decides whether it starts."""
+    monkeypatch.setattr(media_server, "_server", None)
+    monkeypatch.setattr(media_server, "_base_url", None)
+    monkeypatch.setattr(media_server, "_start_failed", False)
+    monkeypatch.setattr(media_server, "MEDIA_PORT", 0)
+    yield
+    if media_server._server is not None:
+        media_server._server.shutdown()
+        media_server._server.server_close()
+
+
+def test_media_server_is_off_without_a_public_url(fresh_media_server, monkeypatch):
+    monkeypatch.setattr(media_server, "MEDIA_URL", None)
+    assert media_server.clip_url("0123456789abcdef0123456789abcdef") is None
+    assert media_server._server is None
+
+def test_clip_urls_use_the_public_url(fresh_media_server, monkeypatch):
+    monkeypatch.setattr(media_server, "MEDIA_URL", "https://tutor.example.org/media/")
+    clip_id = session_history.default_audio_store.put(CLIP)
+    assert media_server.clip_url(clip_id) == f"https://tutor.example.org/media/{clip_id}.mp3"
+    assert media_server._server is not None
+
+def test_server_sends_clips_ranges_and_not_modified():
+    store = session_history.AudioStore()
+    clip_id = store.put(CLIP)
+    server, base_url = media_server.start_media_server(store, port=0)
+    try:
+        with urllib.request.urlopen(f"{base_url}/{clip_id}.mp3") as response:
+            assert response.read() == CLIP
+            assert "immutable" in response.headers["Cache-Control"]
+            etag = response.headers["ETag"]
+        request = urllib.request.Request(f"{base_url}/{clip_id}.mp3", headers={"Range": "bytes=100-199"})
+        with urllib.request.urlopen(request) as response:
+            assert response.status == 206
+            assert response.read() == CLIP[100:200]
+        request = urllib.request.Request(f"{base_url}/{clip_id}.mp3", headers={"If-None-Match": etag})
+        with pytest.raises(urllib.error.HTTPError) as not_modified:
+            urllib.request.urlopen(request)
+        assert not_modified.value.code == 304
+        with pytest.raises(urllib.error.HTTPError) as not_found:
+            urllib.request.urlopen(f"{base_url}/{'0' * 32}.mp3")
+        assert not_found.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_has_audio_checks_the_shared_backend(shared_backend):
+    other_worker = session_history.AudioStore(backend=shared_backend)
+    clip_id = other_worker.put(CLIP)
+    history = session_history.ConversationHistory(audio_store=session_history.AudioStore(backend=shared_backend))
+    assert history.has_audio(clip_id)
+    assert clip_id in history.audio_store # Kept locally for the replay
+    assert not history.has_audio("0123456789abcdef0123456789abcdef")
+    assert not history.has_audio(None)
@@ -0,0 +1,177 @@
+import asyncio
+import itertools
+import time
+
+import pytest
+from openai import OpenAI
+
+import resilient_client as rc
+from benchmarks.fake_openai_server import FakeServerConfig, start_fake_server
+from instrumentation import metrics
+
+_names = itertools.count()
+
+
+class FakeAPIError(Exception):
+    """Stands in for an openai.APIStatusError: only status_code (and optionally Retry-After) matter."""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        if retry_after is not None:
+            self.response = type("Response", (), {"headers": {"retry-after": str(retry_after)}})()
+
+
+def make_endpoint(failure_threshold=5, reset_seconds=30.0, **policy):
+    """A fresh endpoint (own breaker, own metric names) outside the scheduler's buckets."""
+    settings = dict(deadline=3.0, attempt_timeout=1.0, max_attempts=3, backoff_base=0.01, backoff_max=0.02)
+    settings.update(policy)
+    endpoint = rc.ResilientEndpoint(f"test{next(_names)}", rc.EndpointPolicy(**settings))
+    endpoint.breaker = rc.CircuitBreaker(endpoint.name, failure_threshold, reset_seconds)
+    return endpoint
+
+def faulty(*outcomes):
+    """A fake API method that raises or returns the given outcomes in order; calls are recorded."""
+    remaining = list(outcomes)
+
+    def method(timeout=None, **kwargs):
+        method.calls += 1
+        outcome = remaining.pop(0) if remaining else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    method.calls = 0
+    return method
+
+def counter(endpoint, what):
+    return metrics.summary()["counters"].get(f"client.{endpoint.name}.{what}", 0)
+
+
+# --- Retries ---
+def test_retries_transient_errors_then_succeeds():
+    endpoint = make_endpoint()
+    method = faulty(FakeAPIError(503), FakeAPIError(429), "reply")
+    assert endpoint.call(method, {}) == "reply"
+    assert method.calls == 3
+    assert counter(endpoint, "retries") == 2
+    assert endpoint.breaker.state == rc.CircuitBreaker.CLOSED
+
+def test_does_not_retry_bad_requests():
+    endpoint = make_endpoint()
+    method = faulty(FakeAPIError(400))
+    with pytest.raises(FakeAPIError):
+        endpoint.call(method, {})
+    assert method.calls == 1
+    assert endpoint.breaker.failures == 0 # The API answered; it is healthy
+
+def test_gives_up_after_max_attempts():
+    endpoint = make_endpoint(max_attempts=2)
+    method = faulty(FakeAPIError(500), FakeAPIError(500), "never reached")
+    with pytest.raises(FakeAPIError):
+        endpoint.call(method, {})
+    assert method.calls == 2
+    assert counter(endpoint, "failures") == 1
+
+def test_backoff_honours_retry_after():
+    endpoint = make_endpoint()
+    assert endpoint.backoff(0, FakeAPIError(429, retry_after=0.5)) == 0.5
+    assert endpoint.backoff(0, FakeAPIError(503)) <= 0.02
+
+def test_slow_attempt_times_out_and_is_retried():
+    endpoint = make_endpoint(attempt_timeout=0.1)
+    calls = []
+
+    def method(timeout=None):
+        calls.append(timeout)
+        if len(calls) == 1:
+            time.sleep(0.5)
+        return "fast"
+
+    assert endpoint.call(method, {}) == "fast"
+    assert counter(endpoint, "timeouts") == 1
+    assert calls[0] <= 0.1 # The SDK gets the attempt timeout too
+
+def test_hedge_wins_when_the_first_request_stalls():
+    endpoint = make_endpoint(hedge=True, hedge_after=0.05)
+    calls = []
+
+    def method(timeout=None):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(0.5) # The primary stalls; the duplicate answers at once
+            return "primary"
+        return "hedge"
+
+    start = time.monotonic()
+    assert endpoint.call(method, {}) == "hedge"
+    assert time.monotonic() - start < 0.3
+    assert (counter(endpoint, "hedges"), counter(endpoint, "hedge_wins")) == (1, 1)
+
+def test_no_hedge_when_disabled_for_the_call():
+    endpoint = make_endpoint(hedge=True, hedge_after=0.01)
+    method = faulty()
+    endpoint.call(method, {}, hedge=False)
+    assert counter(endpoint, "hedges") == 0
+
+
+# --- Circuit breaker ---
+def test_breaker_opens_fails_fast_and_recovers_after_a_probe():
+    endpoint = make_endpoint(failure_threshold=2, reset_seconds=0.1, max_attempts=1)
+    for _ in range(2):
+        with pytest.raises(FakeAPIError):
+            endpoint.call(faulty(FakeAPIError(503)), {})
+    assert endpoint.breaker.state == rc.CircuitBreaker.OPEN
+
+    method = faulty()
+    with pytest.raises(rc.CircuitOpenError):
+        endpoint.call(method, {})
+    assert method.calls == 0 and counter(endpoint, "short_circuits") == 1
+
+    time.sleep(0.15)
+    assert endpoint.call(method, {}) == "ok" # Half-open probe succeeds
+    assert endpoint.breaker.state == rc.CircuitBreaker.CLOSED
+
+def test_failed_probe_reopens_the_circuit():
+    endpoint = make_endpoint(failure_threshold=1, reset_seconds=0.05, max_attempts=1)
+    with pytest.raises(FakeAPIError):
+        endpoint.call(faulty(FakeAPIError(503)), {})
+    time.sleep(0.1)
+    with pytest.raises(FakeAPIError):
+        endpoint.call(faulty(FakeAPIError(503)), {})
+    assert endpoint.breaker.state == rc.CircuitBreaker.OPEN
+    with pytest.raises(rc.CircuitOpenError):
+        endpoint.call(faulty(), {})
+
+
+# --- Async ---
+def test_async_call_retries_and_hedges():
+    endpoint = make_endpoint(hedge=True, hedge_after=0.05)
+    calls = []
+
+    async def method(timeout=None):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise FakeAPIError(502)
+        if len(calls) == 2:
+            await asyncio.sleep(0.5)
+            return "slow"
+        return "hedged"
+
+    assert asyncio.run(endpoint.acall(method, {})) == "hedged"
+    assert (counter(endpoint, "retries"), counter(endpoint, "hedge_wins")) == (1, 1)
+
+
+# --- Against the local fake OpenAI server ---
+def test_wrapped_client_survives_injected_server_errors():
+    server, base_url = start_fake_server(FakeServerConfig(error_rate=0.3, time_scale=0.01, seed=3))
+    try:
+        client = rc.wrap(OpenAI(api_key="test-key", base_url=base_url, max_retries=0))
+        retries_before = metrics.summary()["counters"].get("client.chat.retries", 0)
+        for _ in range(6):
+            completion = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "Hi"}])
+            assert completion.choices[0].message.content
+        assert metrics.summary()["counters"].get("client.chat.retries", 0) > retries_before
+        assert rc.status()["chat"] == rc.CircuitBreaker.CLOSED
+    finally:
+        server.shutdown()
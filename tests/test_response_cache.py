@@ -0,0 +1,48 @@
+import pytest
+
+import core_tutor as ct
+import response_cache
+import state_backend
+
+
+def make_cache():
+    return response_cache.ResponseCache(backend=state_backend.MemoryBackend())
+
+def make_session(cache):
+    return ct.TutorSession(object(), response_cache=cache)
+
+
+@pytest.mark.parametrize("question", ["Tell me more about it", "Why?", "Why not?", "How come?", "Why did they do that?",
+                                      "What happened to her then", "Say it again please", "What do you want"])
+def test_follow_ups_are_never_cached(question):
+    cache = make_cache()
+    session = make_session(cache)
+    cache.put(session, question, "An answer about the previous topic.", b"audio")
+    assert cache.get(session, question) is None
+    assert cache.stats()["entries"] == 0
+
+@pytest.mark.parametrize("question", ["What is the sun?", "Why is the sky blue?", "How do bees make honey?"])
+def test_standalone_questions_are_cached(question):
+    cache = make_cache()
+    session = make_session(cache)
+    cache.put(session, question, "A standalone answer.", b"audio")
+    assert cache.get(session, question) == ("A standalone answer.", b"audio")
+
+def test_follow_up_after_a_cached_answer_goes_to_gpt():
+    cache = make_cache()
+    session = make_session(cache)
+    ct.cache_response(session, "Tell me about dogs", "Dogs are loyal friends.", b"dogs")
+    ct.cache_response(session, "Tell me about cats", "Cats love to nap.", b"cats")
+    history = [{"role": "user", "content": "Tell me about cats"}, {"role": "assistant", "content": "Cats love to nap."}]
+    assert ct.get_cached_response(session, "Tell me about dogs", history) == ("Dogs are loyal friends.", b"dogs")
+    assert ct.get_cached_response(session, "Tell me more about them", history) is None
+
+def test_streamed_cache_hit_is_a_spoken_sentence():
+    cache = make_cache()
+    session = make_session(cache)
+    ct.cache_response(session, "Tell me about dogs", "Dogs are loyal friends.", b"dogs")
+    history = []
+    [spoken] = list(ct.stream_conversation_turn(session, "Tell me about dogs", history))
+    assert isinstance(spoken, ct.SpokenSentence)
+    assert (spoken.segment, tuple(spoken)) == (ct.ENGLISH_SEGMENT, ("Dogs are loyal friends.", b"dogs"))
+    assert history[-1] == {"role": "assistant", "content": "Dogs are loyal friends."}
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import scheduler
+
+
+def drain(bucket):
+    """Empties a bucket's burst allowance so the next requests have to queue."""
+    bucket.requests.tokens = 0
+    bucket.requests.updated = time.monotonic()
+    if bucket.token_bucket is not None:
+        bucket.token_bucket.tokens = 0
+        bucket.token_bucket.updated = time.monotonic()
+
+def run_in_threads(bucket, requests, start_delay=0.05):
+    """requests: [(tenant, priority, tokens)] in submission order. Returns tenants in grant order."""
+    order = []
+    lock = threading.Lock()
+
+    def request(tenant, priority, tokens):
+        bucket.acquire(tokens, None, tenant, priority)
+        with lock:
+            order.append(tenant)
+
+    threads = []
+    for tenant, priority, tokens in requests:
+        thread = threading.Thread(target=request, args=(tenant, priority, tokens))
+        thread.start()
+        threads.append(thread)
+        time.sleep(start_delay / len(requests)) # Keep submission order deterministic
+    for thread in threads:
+        thread.join(10)
+    return order
+
+
+# --- Limits ---
+def test_rpm_burst_then_rate():
+    bucket = scheduler.BucketScheduler("rpm", rpm=600) # 10 requests/s, burst of 20
+    start = time.monotonic()
+    for _ in range(20):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    bucket.acquire()
+    bucket.acquire()
+    assert 0.15 <= time.monotonic() - start < 0.5 # Two more at 10/s
+
+def test_tpm_limits_large_requests():
+    bucket = scheduler.BucketScheduler("tpm", rpm=60000, tpm=6000) # 100 tokens/s, burst of 200
+    start = time.monotonic()
+    bucket.acquire(tokens=200)
+    assert time.monotonic() - start < 0.05
+    bucket.acquire(tokens=30)
+    assert 0.25 <= time.monotonic() - start < 0.6
+
+def test_settle_charges_actual_usage():
+    bucket = scheduler.BucketScheduler("settle", rpm=60000, tpm=6000)
+    bucket.acquire(tokens=100)
+    bucket.settle(100, 180) # The response used more than estimated
+    assert bucket.token_bucket.tokens == pytest.approx(20, abs=2)
+
+def test_settle_reconciles_against_the_capped_charge():
+    bucket = scheduler.BucketScheduler("settle-big", rpm=60000, tpm=6000) # Capacity: 200 tokens
+    bucket.acquire(tokens=500) # Bigger than the burst, so only 200 were taken up front
+    bucket.settle(500, 450)
+    assert bucket.token_bucket.tokens == pytest.approx(200 - 450, abs=5)
+
+def test_idle_tenants_are_forgotten():
+    bucket = scheduler.BucketScheduler("sessions", rpm=600000)
+    for index in range(500):
+        bucket.acquire(tenant=f"learner-{index}")
+    assert not bucket._last_finish # Every tenant has been served, so none needs a finish time kept
+
+def test_queue_timeout_leaves_no_ticket_behind():
+    bucket = scheduler.BucketScheduler("timeout", rpm=60)
+    drain(bucket)
+    with pytest.raises(scheduler.QueueTimeoutError):
+        bucket.acquire(timeout=0.05)
+    assert bucket.stats()["queued"] == 0
+
+
+# --- Fair share and priorities ---
+def test_quiet_tenant_is_not_starved_by_a_noisy_one():
+    bucket = scheduler.BucketScheduler("fair", rpm=1200) # 20/s
+    drain(bucket)
+    order = run_in_threads(bucket, [("noisy", scheduler.INTERACTIVE, 1)] * 12 + [("quiet", scheduler.INTERACTIVE, 1)] * 3)
+    assert len(order) == 15
+    # All quiet requests are served long before the noisy backlog is cleared
+    assert max(index for index, tenant in enumerate(order) if tenant == "quiet") <= 7
+
+def test_weights_give_a_larger_share():
+    bucket = scheduler.BucketScheduler("weights", rpm=1200, weights={"big": 3.0})
+    drain(bucket)
+    order = run_in_threads(bucket, [("small", scheduler.INTERACTIVE, 1)] * 8 + [("big", scheduler.INTERACTIVE, 1)] * 8)
+    assert order[:8].count("big") >= 5
+
+def test_background_waits_behind_interactive():
+    bucket = scheduler.BucketScheduler("priority", rpm=600) # First slot frees up after 0.1 s, when all six are queued
+    drain(bucket)
+    order = run_in_threads(bucket, [("pack", scheduler.BACKGROUND, 1)] * 3 + [("learner", scheduler.INTERACTIVE, 1)] * 3,
+                           start_delay=0.02)
+    assert order == ["learner"] * 3 + ["pack"] * 3
+
+def test_try_acquire_only_when_nobody_waits():
+    bucket = scheduler.BucketScheduler("hedge", rpm=600)
+    assert bucket.try_acquire()
+    drain(bucket)
+    assert not bucket.try_acquire()
+    assert bucket.stats()["queued"] == 0
+
+def test_async_acquire_waits_without_blocking_the_loop():
+    bucket = scheduler.BucketScheduler("async", rpm=600)
+    drain(bucket)
+    ticks = []
+
+    async def ticker():
+        while len(ticks) < 5:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        start = time.monotonic()
+        await asyncio.gather(ticker(), *(bucket.aacquire(1, None, f"learner-{index}") for index in range(3)))
+        return time.monotonic() - start
+
+    assert 0.25 <= asyncio.run(main()) < 1.0 # Three requests at 10/s from an empty bucket
+    assert len(ticks) == 5
+
+
+# --- Request scheduler (what resilient_client calls) ---
+def test_scope_sets_tenant_and_priority():
+    assert scheduler.current_scope() == (scheduler.DEFAULT_TENANT, scheduler.INTERACTIVE)
+    with scheduler.scope("class-7b", scheduler.BACKGROUND):
+        assert scheduler.current_scope() == ("class-7b", scheduler.BACKGROUND)
+        with scheduler.scope("learner-1"):
+            assert scheduler.current_scope() == ("learner-1", scheduler.INTERACTIVE)
+    assert scheduler.current_scope() == (scheduler.DEFAULT_TENANT, scheduler.INTERACTIVE)
+
+def test_request_scheduler_charges_estimated_tokens_to_the_scoped_tenant():
+    requests = scheduler.RequestScheduler({"chat": (600, 100000), "tts": (600, None)})
+    kwargs = {"messages": [{"role": "user", "content": "Why is the sky blue?"}], "max_tokens": 150}
+    with scheduler.scope("class-7b"):
+        tokens = requests.acquire("chat_stream", kwargs) # Streaming chat shares the chat bucket
+    assert tokens == requests.estimate_tokens(kwargs) > 150
+    assert requests.acquire("tts", {"input": "Hello"}) == 1
+    assert requests.acquire("embeddings", {}) == 0 # No bucket configured: not scheduled
+
+def test_parse_limits_and_weights():
+    assert scheduler.parse_rate_limits("chat=3500/200000, tts=100") == {"chat": (3500.0, 200000.0), "tts": (100.0, None)}
+    assert scheduler.parse_rate_limits("") == {}
+    assert scheduler.parse_weights("class-7a=2,class-7b=0.5") == {"class-7a": 2.0, "class-7b": 0.5}
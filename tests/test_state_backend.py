@@ -0,0 +1,97 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import state_backend
+from benchmarks.fake_redis_server import start_fake_redis_server
+
+
+@pytest.fixture(scope="module")
+def redis_url():
+    server, url = start_fake_redis_server()
+    yield url
+    server.shutdown()
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = state_backend.MemoryBackend()
+    elif request.param == "sqlite":
+        backend = state_backend.backend_from_url(f"sqlite:///{tmp_path / 'state.db'}")
+    else:
+        backend = state_backend.backend_from_url(request.getfixturevalue("redis_url"))
+        backend.prefix = f"test-{time.monotonic_ns()}:" # Isolate from other tests on the shared fake server
+    yield backend
+    backend.close()
+
+
+def test_round_trip(backend):
+    assert backend.get("tts", "missing") is None
+    assert backend.set("tts", "clip", b"\x00\xffaudio\r\n") is True
+    assert backend.get("tts", "clip") == b"\x00\xffaudio\r\n"
+    assert backend.get("audio", "clip") is None # Namespaces are separate
+    backend.set("tts", "clip", b"newer")
+    assert backend.get("tts", "clip") == b"newer"
+    backend.delete("tts", "clip")
+    assert backend.get("tts", "clip") is None
+
+def test_ttl_expiry(backend):
+    backend.set("session", "short", b"1", ttl_seconds=0.05)
+    backend.set("session", "long", b"2", ttl_seconds=60)
+    assert backend.get("session", "short") == b"1"
+    time.sleep(0.1)
+    assert backend.get("session", "short") is None
+    assert backend.get("session", "long") == b"2"
+
+def test_session_store_round_trip(backend):
+    store = state_backend.SessionStore(backend)
+    state = {"language": "Hindi", "history": {"messages": [{"role": "user", "content": "नमस्ते"}]}}
+    assert store.save("sid-1", state)
+    assert store.load("sid-1") == state
+    assert store.load("sid-unknown") is None
+
+
+def test_backend_from_url():
+    assert isinstance(state_backend.backend_from_url("memory://"), state_backend.MemoryBackend)
+    redis = state_backend.backend_from_url("redis://:secret@cache.local:6391/2")
+    assert (redis.host, redis.port, redis.db, redis.password, redis.shared) == ("cache.local", 6391, 2, "secret", True)
+    with pytest.raises(ValueError):
+        state_backend.backend_from_url("postgres://db")
+
+def test_unreachable_redis_degrades_to_misses():
+    with socket.socket() as probe: # A port nothing listens on
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    backend = state_backend.RedisBackend("127.0.0.1", port)
+    assert backend.get("tts", "clip") is None
+    assert backend.set("tts", "clip", b"x") is False
+
+
+def _serve_replies(replies):
+    """A server that answers each command with the next canned (possibly broken) reply."""
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        for reply in replies:
+            connection, _ = listener.accept()
+            with connection:
+                connection.recv(65536)
+                connection.sendall(reply)
+        listener.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener.getsockname()[1]
+
+@pytest.mark.parametrize("reply", [b"$abc\r\n", b":12x\r\n", b"$10\r\nshort", b"?what\r\n"])
+def test_malformed_redis_reply_is_a_backend_failure(reply):
+    port = _serve_replies([reply, reply]) # The backend reconnects and retries once
+    backend = state_backend.RedisBackend("127.0.0.1", port)
+    assert backend.get("tts", "clip") is None
+
+def test_redis_error_reply_is_not_retried(redis_url):
+    backend = state_backend.backend_from_url(redis_url)
+    with pytest.raises(state_backend.RedisReplyError):
+        backend._command("NOSUCHCOMMAND")
+    assert backend.ping() # The connection is still usable afterwards
@@ -0,0 +1,127 @@
+import math
+import os
+import struct
+import threading
+
+import pytest
+from pydub import AudioSegment
+
+import core_tutor as ct
+import turn_jobs
+from benchmarks.fake_openai_server import FAKE_MP3_FRAME, FakeServerConfig, start_fake_server
+
+SAMPLE_RATE = 16000
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+def segment(samples):
+    return AudioSegment(data=struct.pack(f"<{len(samples)}h", *samples), sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+
+def silence(seconds=1.5):
+    return segment([0] * int(SAMPLE_RATE * seconds))
+
+def no_transcription(client_obj, audio):
+    raise AssertionError("a silent recording was sent to Whisper")
+
+
+@pytest.mark.parametrize("recording", [silence(), segment([]), segment([3, -2, 1] * 8000)], ids=["silent", "empty", "hiss"])
+def test_silent_recordings_stop_before_whisper(recording, monkeypatch):
+    monkeypatch.setattr(ct, "transcribe_audio", no_transcription)
+    messages = []
+    job = turn_jobs.submit_turn(ct.TutorSession(object()), messages, recording)
+    assert job.finished.wait(5)
+    assert job.stage == turn_jobs.NO_SPEECH
+    assert job.speech_stats["silent"]
+    assert messages == []
+
+def test_speech_is_transcribed(monkeypatch):
+    tone = [int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)) for i in range(SAMPLE_RATE)]
+    recording = silence(0.3) + segment(tone) + silence(0.3)
+    monkeypatch.setattr(turn_jobs.ap, "preprocess_for_whisper", lambda audio_segment: ("speech.wav", b"wav"))
+    monkeypatch.setattr(ct, "transcribe_audio", lambda client_obj, audio: None) # Whisper heard nothing
+    job = turn_jobs.submit_turn(ct.TutorSession(object()), [], recording)
+    assert job.finished.wait(5)
+    assert job.stage == turn_jobs.TRANSCRIBED
+    assert not job.speech_stats["silent"]
+
+
+# --- The app submits each recording once ---
+@pytest.fixture
+def app_env(monkeypatch):
+    config = FakeServerConfig(time_scale=0.0)
+    server, base_url = start_fake_server(config)
+    monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+    yield
+    server.shutdown()
+
+def run_app_with_recording(monkeypatch, recording, outcome, reruns=4):
+    """Runs the app with the recorder always returning `recording` (as the widget does on every rerun) and each
+    submitted turn ending in `outcome`. Returns the AppTest and how many turns were submitted."""
+    import audiorecorder
+    from streamlit.testing.v1 import AppTest
+
+    submitted = []
+
+    def submit_turn(session, messages, audio_segment):
+        job = turn_jobs.TurnJob(len(messages))
+        job.update(stage=outcome, error="Something went wrong during this turn: boom")
+        job.finished.set()
+        submitted.append(job)
+        return job
+
+    monkeypatch.setattr(audiorecorder, "audiorecorder", lambda *args, **kwargs: recording)
+    monkeypatch.setattr(turn_jobs, "submit_turn", submit_turn)
+    app = AppTest.from_file(APP_PATH, default_timeout=60).run()
+    for _ in range(reruns):
+        app.run()
+    return app, submitted
+
+def test_app_does_not_resubmit_a_silent_recording(app_env, monkeypatch):
+    app, submitted = run_app_with_recording(monkeypatch, silence(), turn_jobs.NO_SPEECH)
+    assert not app.exception
+    assert len(submitted) == 1
+
+def test_app_retries_a_failed_turn_only_on_request(app_env, monkeypatch):
+    app, submitted = run_app_with_recording(monkeypatch, silence(), turn_jobs.FAILED)
+    assert not app.exception
+    assert len(submitted) == 1
+    assert "boom" in app.error[0].value
+    app.button(key="retry_turn").click().run()
+    assert len(submitted) == 2
+
+
+# --- Reply audio is published sentence by sentence ---
+class GatedStream:
+    """Stands in for ct.stream_conversation_turn: an English sentence, then (once released) its translation."""
+
+    def __init__(self):
+        self.english_sent = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, session, user_input_text, history):
+        yield ct.SpokenSentence("Hello there!", FAKE_MP3_FRAME * 10)
+        self.english_sent.set()
+        self.gate.wait(5) # The translation is still rendering
+        yield ct.SpokenSentence("नमस्ते!", FAKE_MP3_FRAME * 20, ct.NATIVE_SEGMENT)
+
+def test_english_clip_is_published_before_the_translation_lands(monkeypatch):
+    stream = GatedStream()
+    monkeypatch.setattr(ct, "stream_conversation_turn", stream)
+    monkeypatch.setattr(turn_jobs.ap, "preprocess_for_whisper", lambda audio_segment: ("speech.wav", b"wav"))
+    monkeypatch.setattr(ct, "transcribe_audio", lambda client_obj, audio: "Hello")
+    tone = [int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)) for i in range(SAMPLE_RATE)]
+    job = turn_jobs.submit_turn(ct.TutorSession(object(), language="Hindi"), [], segment(tone))
+
+    assert stream.english_sent.wait(5)
+    assert job.clips() == [FAKE_MP3_FRAME * 10] # Playable while the translation renders
+    assert not job.done
+    stream.gate.set()
+    assert job.finished.wait(5)
+    assert job.clips() == [FAKE_MP3_FRAME * 10, FAKE_MP3_FRAME * 20]
+    assert job.reply_audio == FAKE_MP3_FRAME * 30
+    assert job.stage == turn_jobs.AUDIO_READY
+
+def test_mp3_duration_from_the_frame_header():
+    assert turn_jobs.ap.mp3_duration_seconds(FAKE_MP3_FRAME * 100) == pytest.approx(2.606, abs=0.01) # 128 kbps
+    assert turn_jobs.ap.mp3_duration_seconds(b"not an mp3") is None
+    assert turn_jobs.ap.mp3_duration_seconds(b"") is None
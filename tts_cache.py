@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import state_backend
+from instrumentation import event
+
+# --- TTS Cache Configuration ---
+TTS_CACHE_DIR = os.getenv("SPEAKGENIE_TTS_CACHE_DIR", ".tts_cache")
+TTS_CACHE_MEMORY_ITEMS = 256 # Clips kept in the in-memory LRU tier
+TTS_CACHE_DISK_BYTES = 200 * 1024 * 1024 # Upper bound for the on-disk tier (200 MB)
+
+
+# --- Text Normalization ---
+def normalize_tts_text(text):
+    """Normalizes text before hashing so trivially different spellings of a phrase share one clip."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+# --- Two-tier (memory + disk) content-addressed audio cache ---
+class TTSCache:
+    """Content-addressed cache for TTS audio, keyed on (model, voice, format, normalized text).
+    Clips live in a small in-memory LRU and in a size-bounded directory on disk. With a shared state backend
+    (SQLite or Redis) every clip is also written there, so other workers get it without a TTS call."""
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_memory_items=TTS_CACHE_MEMORY_ITEMS, max_disk_bytes=TTS_CACHE_DISK_BYTES, backend=None):
+        self.cache_dir = cache_dir
+        backend = backend or state_backend.default_backend
+        self.backend = backend if backend.shared else None
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict() # key -> audio bytes, oldest first
+        self._disk_index = None # key -> file size, oldest first (loaded lazily)
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, voice, response_format, text):
+        """Returns the cache key for one TTS request."""
+        raw = "\x1f".join([model, voice, response_format, normalize_tts_text(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".audio")
+
+    def _load_disk_index(self):
+        """Scans the cache directory once, ordering existing clips by last access time."""
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".audio"):
+                        continue
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-len(".audio")], stat.st_size))
+        entries.sort()
+        self._disk_index = OrderedDict((key, size) for _, key, size in entries)
+        self._disk_bytes = sum(self._disk_index.values())
+
+    def _remember(self, key, audio_bytes):
+        self._memory[key] = audio_bytes
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns cached audio bytes for key, or None on a miss."""
+        with self._lock:
+            audio_bytes = self._memory.get(key)
+            if audio_bytes is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio_bytes
+            if self._disk_index is None:
+                self._load_disk_index()
+            if key in self._disk_index:
+                path = self._path_for(key)
+                try:
+                    with open(path, "rb") as audio_file:
+                        audio_bytes = audio_file.read()
+                    os.utime(path) # Refresh access time so eviction stays LRU across restarts
+                except OSError:
+                    self._disk_bytes -= self._disk_index.pop(key)
+                else:
+                    self._disk_index.move_to_end(key)
+                    self._remember(key, audio_bytes)
+                    self.disk_hits += 1
+                    return audio_bytes
+        if self.backend is not None: # Outside the lock: a network round trip must not stall other lookups
+            audio_bytes = self.backend.get("tts", key)
+            if audio_bytes is not None:
+                with self._lock:
+                    self._remember(key, audio_bytes)
+                    self.shared_hits += 1
+                return audio_bytes
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def __contains__(self, key):
+        """Checks whether key is cached in either tier, without touching hit/miss counters."""
+        with self._lock:
+            if self._disk_index is None:
+                self._load_disk_index()
+            return key in self._memory or key in self._disk_index
+
+    def put(self, key, audio_bytes):
+        """Stores audio bytes under key in both tiers (and the shared backend), evicting the oldest disk clips when over budget."""
+        if self.backend is not None:
+            self.backend.set("tts", key, audio_bytes, state_backend.SHARED_CACHE_TTL_SECONDS)
+        with self._lock:
+            self._remember(key, audio_bytes)
+            if self._disk_index is None:
+                self._load_disk_index()
+            if key in self._disk_index or len(audio_bytes) > self.max_disk_bytes:
+                return
+            path = self._path_for(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as audio_file:
+                    audio_file.write(audio_bytes)
+                os.replace(temp_path, path) # Atomic, so concurrent readers never see half a clip
+            except OSError as e:
+                event("tts_cache.write_error", level=logging.WARNING, key=key, error=str(e))
+                return
+            self._disk_index[key] = len(audio_bytes)
+            self._disk_bytes += len(audio_bytes)
+            while self._disk_bytes > self.max_disk_bytes and self._disk_index:
+                old_key, old_size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= old_size
+                try:
+                    os.remove(self._path_for(old_key))
+                except OSError:
+                    pass
+
+    def clear_memory(self):
+        """Drops the in-memory tier (the disk tier is kept)."""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        """Returns hit/miss counters and tier sizes for this cache."""
+        with self._lock:
+            if self._disk_index is None:
+                self._load_disk_index()
+            lookups = self.memory_hits + self.disk_hits + self.shared_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits + self.shared_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+# Process-wide cache shared by core_tutor and the Streamlit app
+default_cache = TTSCache()
+
+
+# --- Command-line entry point ---
+def main():
+    """Warm-up / inspection command: `python tts_cache.py --warm-up` pre-renders every static phrase."""
+    parser = argparse.ArgumentParser(description="SpeakGenie TTS audio cache")
+    parser.add_argument("--warm-up", action="store_true", help="Pre-render all static phrases into the cache.")
+    parser.add_argument("--voice", default="alloy", help="TTS voice to render with (default: alloy).")
+    args = parser.parse_args()
+
+    # Import core_tutor here so it and this command share the same module-level cache
+    import core_tutor as ct
+
+    if args.warm_up:
+        from openai import OpenAI
+
+        ct.load_dotenv()
+        rendered = ct.warm_up_tts_cache(OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0), voice=args.voice)
+        print(f"Rendered {rendered} new phrase(s) into {TTS_CACHE_DIR}.")
+    print(f"TTS cache stats: {ct.tts_cache.default_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import audio_preprocessing as ap
+import core_tutor as ct
+import scheduler
+import speech_analytics
+from instrumentation import event
+from intent_matcher import intent_matcher
+
+# --- Turn Job Configuration ---
+TURN_WORKERS = int(os.getenv("SPEAKGENIE_TURN_WORKERS", "16")) # Turns running at once per process (all sessions)
+
+# Job stages, in order; the UI renders whatever has arrived so far
+QUEUED = "queued"
+NO_SPEECH = "no_speech" # The recording was silent; nothing was sent to Whisper
+TRANSCRIBING = "transcribing"
+TRANSCRIBED = "transcribed"
+RESPONDING = "responding"
+RESPONDED = "responded"
+AUDIO_READY = "audio_ready"
+FAILED = "failed"
+
+# Shared by every session, so Streamlit script threads only submit and poll
+_turn_executor = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="speakgenie-turn")
+
+
+class TurnJob:
+    """Handle for one learner turn running in the background: recording -> transcript -> reply text -> audio.
+    The worker only writes to this object (and appends the finished turn to the session history);
+    the UI thread reads snapshots of it and never blocks on it."""
+
+    def __init__(self, history_length):
+        self.id = uuid.uuid4().hex[:12]
+        self.history_length = history_length # Messages that existed before this turn (safe to render while it runs)
+        self.stage = QUEUED
+        self.transcript = None
+        self.speech_stats = None # speech_analytics stats of the recording (speaking rate added once transcribed)
+        self.reply_parts = [] # Sentences as they stream in
+        self.reply_clips = [] # One clip per spoken sentence as soon as it is rendered: English first, then the translation
+        self.is_exit = False
+        self.error = None
+        self.cancelled = False
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def add_reply_part(self, text):
+        with self._lock:
+            self.reply_parts.append(text)
+
+    def add_reply_clip(self, audio_bytes):
+        with self._lock:
+            self.reply_clips.append(audio_bytes)
+
+    @property
+    def reply_text(self):
+        with self._lock:
+            return " ".join(self.reply_parts)
+
+    def clips(self):
+        """Snapshot of the reply clips published so far."""
+        with self._lock:
+            return list(self.reply_clips)
+
+    @property
+    def reply_audio(self):
+        """The whole reply as one clip (MP3 frames concatenate cleanly), or None."""
+        with self._lock:
+            return b"".join(self.reply_clips) or None
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def cancel(self):
+        """Marks the job as abandoned (e.g. the learner switched mode); its results are then ignored."""
+        self.cancelled = True
+
+
+# --- Background turn ---
+def _run_turn(job, session, messages, audio_segment):
+    with scheduler.scope(session.tenant): # Fair share of the API quota per learner / classroom
+        _run_scheduled_turn(job, session, messages, audio_segment)
+
+def _run_scheduled_turn(job, session, messages, audio_segment):
+    try:
+        job.update(stage=TRANSCRIBING)
+        try:
+            speech_stats = speech_analytics.analyze_segment(audio_segment)
+        except Exception as e: # Analytics are a nice-to-have; never lose the turn over them
+            event("speech.analyze_error", level=logging.WARNING, error=str(e))
+            speech_stats = None
+        if speech_stats is not None and speech_stats["silent"]:
+            event("speech.silent_recording", duration_ms=speech_stats["duration_ms"], peak_dbfs=speech_stats["peak_dbfs"])
+            job.update(stage=NO_SPEECH, speech_stats=speech_stats)
+            return
+        try:
+            whisper_audio = ap.preprocess_for_whisper(audio_segment)
+        except Exception as e:
+            job.update(stage=FAILED, error=f"Error exporting recorded audio: {e}. Ensure FFmpeg is correctly installed and accessible.")
+            return
+        transcript = ct.transcribe_audio(session.client, whisper_audio)
+        if speech_stats is not None and transcript:
+            speech_analytics.add_speaking_rate(speech_stats, transcript)
+        job.update(stage=TRANSCRIBED, transcript=transcript, speech_stats=speech_stats)
+        if not transcript or job.cancelled:
+            return
+
+        if intent_matcher.is_exit(session.scenario.key, transcript):
+            farewell_text, farewell_audio = ct.speak_static_phrase(session, session.scenario.farewell)
+            job.update(stage=RESPONDED, is_exit=True)
+            job.add_reply_part(farewell_text)
+            if farewell_audio:
+                job.add_reply_clip(farewell_audio)
+                job.update(stage=AUDIO_READY)
+            return
+
+        # Streamed, so reply text shows up sentence by sentence while the rest is still generating
+        job.update(stage=RESPONDING)
+        # English sentences arrive first; the translation's clips (rendered alongside) follow them. Each clip is
+        # published right away, so the UI can start playing English while the translation is still rendering
+        for sentence_text, audio_bytes in ct.stream_conversation_turn(session, transcript, messages):
+            if job.cancelled:
+                return
+            job.add_reply_part(sentence_text)
+            if audio_bytes: # None for a fragment with nothing to speak, or whose TTS failed
+                job.add_reply_clip(audio_bytes)
+        if not job.reply_parts:
+            return
+        job.update(stage=AUDIO_READY if job.reply_clips else RESPONDED)
+    except Exception as e:
+        event("turn.error", level=logging.ERROR, error=str(e))
+        job.update(stage=FAILED, error=f"Something went wrong during this turn: {e}")
+    finally:
+        job.finished.set()
+
+def submit_turn(session, messages, audio_segment):
+    """Starts a turn on the shared executor and returns its TurnJob immediately.
+    messages is the session's text history; the finished user/assistant turn is appended to it by the worker."""
+    job = TurnJob(len(messages))
+    _turn_executor.submit(_run_turn, job, session, messages, audio_segment)
+    return job